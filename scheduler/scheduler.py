@@ -1,59 +1,253 @@
-import os, pika, configparser, json, os.path, csv
-
-
-# Read config
-if "RABBIT_HOST" not in os.environ:
-    os.environ["RABBIT_HOST"] = "localhost"
-
-# Find config in different locations
-config_file = None
-if os.path.isfile('config.ini'):
-    config_file = 'config.ini'
-elif os.path.isfile('../config.ini'):
-    config_file = '../config.ini'
-elif os.path.isfile('../tracing/config.ini'):
-    config_file = '../tracing/config.ini'
-else:
-    raise Exception('config.ini not found')
-
-config = configparser.SafeConfigParser(os.environ)
-config.read(config_file)
-
-# Check that urls_file is defined and exists
-urls_file = config.get('scheduler', 'urls_file')
-print(urls_file)
-
-if not urls_file:
-    raise Exception('Set "urls_file" in config.ini')
-
-if not os.path.isfile(urls_file):
-    raise Exception("Can't open file '{}'".format(urls_file))
-
-
-# Create RabbitMQ connection
-rabbitmq_host = config.get('rabbitmq', 'host', fallback='localhost', raw=False)
-rabbitmq_queue = config.get('rabbitmq', 'queue', fallback='trace_tasks')
-        
-params = pika.ConnectionParameters(host=rabbitmq_host,
-    heartbeat_interval=0, connection_attempts=3, retry_delay=1)
-
-connection = pika.BlockingConnection(params)
-channel = connection.channel()
-channel.queue_declare(queue = rabbitmq_queue, durable=True)
-
-# Read urls and publish messages
-with open(urls_file) as f:
-    csvreader = csv.reader(f, delimiter=',')
-    for row in csvreader:
-        url = row[0]
-        message = json.dumps({"url": url})
-
-        channel.basic_publish(exchange='',
-            routing_key='trace_tasks',
-            body=message,
-            properties=pika.BasicProperties(
-              delivery_mode = 2
-           )
-        )
-    
+import os, pika, configparser, json, os.path, csv, collections, sqlite3, time, mongoengine
 
+from tracing.domain_prober import DomainProber, ProbeStatus
+from tracing.freshness import FreshnessIndex
+from tracing.utils.domains import normalize_domain
+
+
+def read_config():
+    if "RABBIT_HOST" not in os.environ:
+        os.environ["RABBIT_HOST"] = "localhost"
+
+    if "MONGO_HOST" not in os.environ:
+        os.environ["MONGO_HOST"] = "localhost"
+
+    # Find config in different locations
+    for config_file in ['config.ini', '../config.ini', '../tracing/config.ini']:
+        if os.path.isfile(config_file):
+            break
+    else:
+        raise Exception('config.ini not found')
+
+    config = configparser.ConfigParser(os.environ)
+    config.read(config_file)
+
+    return config
+
+
+class PublishState:
+    """
+    Input offset and set of published normalized domains of the current run kept in SQLite.
+    Interrupted run is resumed from the last committed offset, finished run is started again from scratch
+    """
+
+    def __init__(self, path, urls_file):
+        self.urls_file = os.path.abspath(urls_file)
+        self.connection = sqlite3.connect(path)
+
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS domains (domain TEXT PRIMARY KEY) WITHOUT ROWID')
+            self.connection.execute('''
+                CREATE TABLE IF NOT EXISTS progress (
+                    urls_file TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    offset INTEGER NOT NULL,
+                    finished INTEGER NOT NULL
+                )''')
+
+    def start(self):
+        """
+        :return:  Offset in urls file to start from
+        """
+        stat = os.stat(self.urls_file)
+        row = self.connection.execute('SELECT size, mtime, offset, finished FROM progress WHERE urls_file = ?',
+                                      (self.urls_file,)).fetchone()
+
+        if row is not None and not row[3] and row[0] == stat.st_size and row[1] == stat.st_mtime:
+            return row[2]
+
+        with self.connection:
+            self.connection.execute('DELETE FROM domains')
+            self.connection.execute('INSERT OR REPLACE INTO progress VALUES (?, ?, ?, 0, 0)',
+                                    (self.urls_file, stat.st_size, stat.st_mtime))
+        return 0
+
+    def get_published(self, domains, chunk_size = 500):
+        """
+        :return:  Set of domains that were already published in the current run
+        """
+        result = set()
+        domains = list(domains)
+        for i in range(0, len(domains), chunk_size):
+            chunk = domains[i:i + chunk_size]
+            query = 'SELECT domain FROM domains WHERE domain IN ({})'.format(','.join('?' * len(chunk)))
+            result.update(row[0] for row in self.connection.execute(query, chunk))
+
+        return result
+
+    def commit(self, domains, offset):
+        with self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO domains VALUES (?)', [(d,) for d in domains])
+            self.connection.execute('UPDATE progress SET offset = ? WHERE urls_file = ?', (offset, self.urls_file))
+
+    def finish(self):
+        with self.connection:
+            self.connection.execute('UPDATE progress SET finished = 1 WHERE urls_file = ?', (self.urls_file,))
+
+    def close(self):
+        self.connection.close()
+
+
+def read_batches(urls_file, offset = 0, batch_size = 1000):
+    """
+    Streams urls from the first column of csv file
+    :param urls_file:   Csv file
+    :param offset:      Byte offset to start reading from
+    :param batch_size:  Number of urls in batch
+    :return:            Generator of tuples (list of urls, byte offset after the batch)
+    """
+    with open(urls_file, 'rb') as f:
+        f.seek(offset)
+        batch = []
+        while True:
+            line = f.readline()
+            if not line:
+                break
+
+            row = next(csv.reader([line.decode('utf-8', errors='ignore')]), None)
+            url = row[0].strip() if row else None
+
+            # Skip empty lines and header
+            if url and url.lower() != 'url':
+                batch.append(url)
+
+            if len(batch) >= batch_size:
+                yield (batch, f.tell())
+                batch = []
+
+        yield (batch, f.tell())
+
+
+class Publisher:
+    """
+    Publishes urls from csv file to RabbitMQ queue by transactional batches
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.urls_file = config.get('scheduler', 'urls_file')
+        self.batch_size = config.getint('scheduler', 'batch_size', fallback=1000)
+        self.state_file = config.get('scheduler', 'state_file', fallback='scheduler_state.sqlite')
+        self.report_every = config.getint('scheduler', 'report_every', fallback=10)
+
+        self.rabbitmq_host = config.get('rabbitmq', 'host', fallback='localhost', raw=False)
+        self.rabbitmq_queue = config.get('rabbitmq', 'queue', fallback='trace_tasks')
+
+        self.prober = None
+        if config.getboolean('prober', 'scheduler_filter', fallback=False):
+            self.prober = DomainProber.from_config(config)
+
+        self.freshness = FreshnessIndex.from_config(config)
+        if self.freshness:
+            mongo_db = config.get('mogodb', 'db', fallback='trace_automation')
+            mongo_host = config.get('mogodb', 'host', fallback='localhost', raw=False)
+            mongoengine.connect(mongo_db, host=mongo_host)
+
+        self.counts = collections.Counter()
+
+    def connect(self):
+        params = pika.ConnectionParameters(host=self.rabbitmq_host,
+            heartbeat_interval=0, connection_attempts=3, retry_delay=1)
+
+        self.connection = pika.BlockingConnection(params)
+        self.channel = self.connection.channel()
+        self.channel.queue_declare(queue = self.rabbitmq_queue, durable=True)
+
+        # Batch is confirmed by broker at once on commit
+        self.channel.tx_select()
+
+    def filter_urls(self, urls, state):
+        """
+        Removes duplicates, already published, recently traced and not live domains
+        :return:  Tuple (list of urls to publish, list of their normalized domains)
+        """
+        unique = collections.OrderedDict()
+        for url in urls:
+            domain = normalize_domain(url)
+            if domain and domain not in unique:
+                unique[domain] = url
+
+        self.counts['duplicates'] += len(urls) - len(unique)
+
+        published = state.get_published(unique.keys())
+        self.counts['duplicates'] += len(published)
+        for domain in published:
+            del unique[domain]
+
+        if self.freshness and unique:
+            fresh = self.freshness.get_fresh(unique.keys())
+            self.counts['fresh'] += len(fresh)
+            for domain in fresh:
+                del unique[domain]
+
+        if self.prober and unique:
+            results = self.prober.probe(list(unique.values()))
+            for domain, result in zip(list(unique.keys()), results):
+                self.counts[result.status] += 1
+                if result.status != ProbeStatus.live:
+                    del unique[domain]
+
+        return (list(unique.values()), list(unique.keys()))
+
+    def publish(self, urls):
+        for url in urls:
+            message = json.dumps({"url": url})
+
+            self.channel.basic_publish(exchange='',
+                routing_key=self.rabbitmq_queue,
+                body=message,
+                properties=pika.BasicProperties(
+                  delivery_mode = 2
+               )
+            )
+
+        self.channel.tx_commit()
+
+    def report(self, started):
+        elapsed = max(time.time() - started, 1e-6)
+        print('published: {}, {:.1f} msgs/sec, skipped: {}'.format(
+            self.counts['published'], self.counts['published'] / elapsed,
+            {key: value for key, value in self.counts.items() if key != 'published'}))
+
+    def run(self):
+        if not os.path.isfile(self.urls_file):
+            raise Exception("Can't open file '{}'".format(self.urls_file))
+
+        state = PublishState(self.state_file, self.urls_file)
+        offset = state.start()
+        if offset:
+            print('resuming {} from offset {}'.format(self.urls_file, offset))
+
+        self.connect()
+
+        started = time.time()
+        for i, (urls, offset) in enumerate(read_batches(self.urls_file, offset, self.batch_size)):
+            urls, domains = self.filter_urls(urls, state)
+            self.publish(urls)
+
+            # Offset is saved only after the batch is committed, so crash can only duplicate one batch
+            state.commit(domains, offset)
+            self.counts['published'] += len(urls)
+
+            if (i + 1) % self.report_every == 0:
+                self.report(started)
+
+        state.finish()
+        state.close()
+        self.connection.close()
+
+        self.report(started)
+
+
+if __name__ == '__main__':
+    config = read_config()
+
+    # Check that urls_file is defined
+    urls_file = config.get('scheduler', 'urls_file')
+    print(urls_file)
+
+    if not urls_file:
+        raise Exception('Set "urls_file" in config.ini')
+
+    Publisher(config).run()
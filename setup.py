@@ -8,7 +8,7 @@ setup(
     install_requires=[
         'requests', 'lxml', 'image', 'Pillow',
         'scipy', 'mongoengine', 'pika', 'configparser',
-        'selenium', 'beautifulsoup4', 'tensorflow', 'tracing'
+        'selenium', 'beautifulsoup4', 'tensorflow', 'aiohttp', 'tracing'
     ],
     packages=find_packages(),
     include_package_data=True,
@@ -0,0 +1,80 @@
+"""
+Benchmark of PageClassifier backbones on the test part of pages dataset.
+
+Reports per page classification latency on CPU and F1 (PageClassifier.measure) for every backbone.
+Run: python backbone_benchmark.py \
+        --model inception_resnet_v2:classification_model/19 \
+        --model mobilenet_v1:distilled_model/19
+"""
+import os
+import time
+import argparse
+
+import numpy as np
+
+from tracing.training.classification.pages_dataset import read_pages_dataset
+from tracing.training.classification.page_classifier import PageClassifier
+
+
+def measure_latency(classifier, imgs, warmup = 3):
+    """
+    :param imgs:  Images that are classified one by one as in tracing
+    :return:      List of seconds per page
+    """
+    for img in imgs[:warmup]:
+        classifier.classify_pages([img])
+
+    result = []
+    for img in imgs:
+        started = time.time()
+        classifier.classify_pages([img])
+        result.append(time.time() - started)
+
+    return result
+
+
+def benchmark(backbone, checkpoint, test_urls, latency_pages):
+    classifier = PageClassifier.from_checkpoint(checkpoint, backbone = backbone)
+
+    imgs = [classifier.read_image(item)[:1200] for item in test_urls[:latency_pages]]
+    latency = measure_latency(classifier, imgs)
+    f1 = classifier.measure(test_urls)
+
+    classifier.session.close()
+    return {
+        'backbone': backbone,
+        'checkpoint': checkpoint,
+        'mean_ms': np.mean(latency) * 1000,
+        'p95_ms': np.percentile(latency, 95) * 1000,
+        'f1': f1
+    }
+
+
+def print_results(results):
+    print('{:<22} {:>10} {:>10} {:>12} {:>12}'.format('backbone', 'mean ms', 'p95 ms', 'popups f1', 'checkouts f1'))
+    for r in results:
+        print('{:<22} {:>10.1f} {:>10.1f} {:>12.3f} {:>12.3f}'.format(
+            r['backbone'], r['mean_ms'], r['p95_ms'], r['f1'].get('popups', 0.), r['f1'].get('checkouts', 0.)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Compares latency and F1 of page classifier backbones')
+    parser.add_argument('--model', action = 'append', required = True,
+                        help = 'Backbone and checkpoint of PageClassifier: <backbone>:<checkpoint>')
+    parser.add_argument('--latency_pages', type = int, default = 50, help = 'Pages to measure latency')
+    parser.add_argument('--cpu', action = 'store_true', help = 'Hide GPUs to measure CPU latency')
+    parser.add_argument('--cache_folder', default = None, help = 'Datasets cache folder')
+    args = parser.parse_args()
+
+    if args.cpu:
+        os.environ['CUDA_VISIBLE_DEVICES'] = ''
+
+    train_urls, test_urls = read_pages_dataset(cache_folder = args.cache_folder, seed = 0)
+
+    results = []
+    for model in args.model:
+        backbone, checkpoint = model.split(':', 1)
+        print('benchmarking {} from {}'.format(backbone, checkpoint))
+        results.append(benchmark(backbone, checkpoint, test_urls, args.latency_pages))
+
+    print_results(results)
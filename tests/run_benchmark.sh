@@ -0,0 +1 @@
+xvfb-run -s "-screen 0 1280x960x16" python shop_tracer_benchmark.py "$@"
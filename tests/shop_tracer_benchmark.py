@@ -0,0 +1,249 @@
+"""
+Benchmark of tracers on synthetic shops from assets/shops served locally.
+
+Reports per state latency, WebDriver roundtrips, screenshot cost and traces per minute per core.
+Run: xvfb-run python shop_tracer_benchmark.py --tracer both --repeat 3
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from queue import Queue
+from collections import defaultdict
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+from selenium.webdriver.remote.webdriver import WebDriver
+
+import tracing.shop_tracer as shop_tracer
+import tracing.common_actors as common_actors
+import tracing.heuristic.shop_tracer as heuristic_tracer
+import tracing.heuristic.common_actors as heuristic_actors
+import tracing.trace_logger as trace_logger
+import tracing.user_data as user_data
+from tracing.rl.environment import Environment
+
+
+shops_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets', 'shops')
+
+# basic shop consists only of pages from common folder
+all_shops = ['basic', 'iframe', 'popup', 'combobox', 'links']
+
+
+class ShopRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Serves /<shop>/<page> from shops/<shop>/<page> or from shops/common/<page> if shop doesn't override it
+    """
+
+    def translate_path(self, path):
+        path = path.split('?', 1)[0].split('#', 1)[0]
+        parts = [part for part in path.split('/') if part and part != '..']
+
+        if not parts or parts[0] not in all_shops:
+            return os.path.join(shops_folder, 'not_found')
+
+        page = os.path.join(*parts[1:]) if len(parts) > 1 else 'index.html'
+        own = os.path.join(shops_folder, parts[0], page)
+        if os.path.isfile(own):
+            return own
+
+        return os.path.join(shops_folder, 'common', page)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def start_server(port):
+    server = ThreadingHTTPServer(('127.0.0.1', port), ShopRequestHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    return server
+
+
+class Stats:
+    """
+    Collects timings from patched tracer methods and WebDriver commands
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.commands = defaultdict(lambda: [0, 0.])
+        self.states = defaultdict(list)
+        self.snapshots = []
+        self.traces = []
+
+    def add_command(self, command, elapsed):
+        with self.lock:
+            item = self.commands[command]
+            item[0] += 1
+            item[1] += elapsed
+
+    def add_state(self, state, elapsed):
+        with self.lock:
+            self.states[state].append(elapsed)
+
+    def add_snapshot(self, elapsed):
+        with self.lock:
+            self.snapshots.append(elapsed)
+
+    def add_trace(self, tracer, shop, state, elapsed):
+        with self.lock:
+            self.traces.append({'tracer': tracer, 'shop': shop, 'state': state, 'time': elapsed})
+
+    def timed(self, function, on_finished):
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                on_finished(args, time.time() - start)
+
+        return wrapper
+
+    def install(self):
+        WebDriver.execute = self.timed(WebDriver.execute,
+            lambda args, elapsed: self.add_command(args[1], elapsed))
+
+        # process_state(self, driver, state, context)
+        shop_tracer.ShopTracer.process_state = self.timed(shop_tracer.ShopTracer.process_state,
+            lambda args, elapsed: self.add_state(args[2], elapsed))
+
+        # process_state(self, state, context)
+        heuristic_tracer.ShopTracer.process_state = self.timed(heuristic_tracer.ShopTracer.process_state,
+            lambda args, elapsed: self.add_state(args[1], elapsed))
+
+        trace_logger.ITraceLogging.save_snapshot = self.timed(trace_logger.ITraceLogging.save_snapshot,
+            lambda args, elapsed: self.add_snapshot(elapsed))
+
+    def report(self, elapsed, workers):
+        commands_number = sum(count for count, _ in self.commands.values())
+        screenshot_commands = self.commands.get('screenshot', [0, 0.])
+        cores = min(workers, multiprocessing.cpu_count())
+
+        return {
+            'traces': len(self.traces),
+            'time': elapsed,
+            'traces_per_minute_per_core': len(self.traces) / (elapsed / 60.) / cores if elapsed > 0 else 0,
+            'roundtrips': commands_number,
+            'roundtrips_per_trace': commands_number / max(len(self.traces), 1),
+            'commands': {command: {'count': count, 'time': total}
+                         for command, (count, total) in sorted(self.commands.items(), key=lambda p: -p[1][1])},
+            'states': {state: {'count': len(times), 'mean': sum(times) / len(times), 'max': max(times)}
+                       for state, times in self.states.items()},
+            'snapshots': {'count': len(self.snapshots),
+                          'time': sum(self.snapshots),
+                          'screenshot_commands': screenshot_commands[0],
+                          'screenshot_commands_time': screenshot_commands[1]},
+            'results': self.traces
+        }
+
+
+def create_tracer(name, log_folder):
+    logger = trace_logger.FileTraceLogger(os.path.join(log_folder, 'results.jsonl'),
+                                          os.path.join(log_folder, 'images'))
+    if name == 'main':
+        tracer = shop_tracer.ShopTracer(user_data.get_user_data, headless=True, trace_logger = logger)
+        common_actors.add_tracer_extensions(tracer)
+    else:
+        env = Environment(headless=True)
+        tracer = heuristic_tracer.ShopTracer(environment = env, trace_logger = logger)
+        heuristic_actors.add_tracer_extensions(tracer)
+
+    return tracer
+
+
+def run_worker(queue, stats, log_folder):
+    tracers = {}
+    while True:
+        task = queue.get()
+        if task is None:
+            break
+
+        name, shop, url = task
+        if name not in tracers:
+            tracers[name] = create_tracer(name, os.path.join(log_folder, name, str(threading.get_ident())))
+
+        start = time.time()
+        status = tracers[name].trace(url, wait_response_seconds = 30, attempts = 1, delaying_time = 1)
+        stats.add_trace(name, shop, getattr(status, 'state', str(status)), time.time() - start)
+
+    for tracer in tracers.values():
+        tracer.__exit__(None, None, None)
+
+
+def print_report(report):
+    print('\nTraces: {traces}, time: {time:.1f}s, traces per minute per core: {traces_per_minute_per_core:.2f}'
+          .format(**report))
+    print('WebDriver roundtrips: {roundtrips}, per trace: {roundtrips_per_trace:.0f}'.format(**report))
+
+    snapshots = report['snapshots']
+    print('Snapshots: {count}, time {time:.1f}s, screenshot commands: {screenshot_commands} '
+          '({screenshot_commands_time:.1f}s)'.format(**snapshots))
+
+    print('\n{:<20} {:>8} {:>10} {:>10}'.format('state', 'count', 'mean, s', 'max, s'))
+    for state, item in report['states'].items():
+        print('{:<20} {:>8} {:>10.2f} {:>10.2f}'.format(str(state), item['count'], item['mean'], item['max']))
+
+    print('\n{:<30} {:>8} {:>10}'.format('command', 'count', 'time, s'))
+    for command, item in list(report['commands'].items())[:15]:
+        print('{:<30} {:>8} {:>10.2f}'.format(command, item['count'], item['time']))
+
+    print('\n{:<10} {:<10} {:<16} {:>8}'.format('tracer', 'shop', 'final state', 'time, s'))
+    for item in report['results']:
+        print('{:<10} {:<10} {:<16} {:>8.1f}'.format(item['tracer'], item['shop'], str(item['state']), item['time']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark tracers on local synthetic shops')
+    parser.add_argument('--tracer', choices=['main', 'heuristic', 'both'], default='both')
+    parser.add_argument('--shops', nargs='+', choices=all_shops, default=all_shops)
+    parser.add_argument('--repeat', type=int, default=1, help='Number of traces for every shop')
+    parser.add_argument('--workers', type=int, default=1, help='Number of parallel tracers')
+    parser.add_argument('--port', type=int, default=8124)
+    parser.add_argument('--output', help='File to save report as json')
+    args = parser.parse_args()
+
+    os.environ['DBUS_SESSION_BUS_ADDRESS'] = '/dev/null'
+    logging.getLogger('shop_tracer').setLevel(logging.ERROR)
+
+    server = start_server(args.port)
+    stats = Stats()
+    stats.install()
+
+    tracers = ['main', 'heuristic'] if args.tracer == 'both' else [args.tracer]
+    queue = Queue()
+    for name in tracers:
+        for shop in args.shops:
+            for _ in range(args.repeat):
+                queue.put((name, shop, '127.0.0.1:{}/{}/'.format(args.port, shop)))
+
+    for _ in range(args.workers):
+        queue.put(None)
+
+    log_folder = tempfile.mkdtemp(prefix='benchmark')
+    start = time.time()
+    workers = [threading.Thread(target=run_worker, args=(queue, stats, log_folder)) for _ in range(args.workers)]
+    for worker in workers:
+        worker.start()
+
+    for worker in workers:
+        worker.join()
+
+    report = stats.report(time.time() - start, args.workers)
+    server.shutdown()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
@@ -0,0 +1,64 @@
+"""
+Tests of trace time budgets
+Run: python -m pytest test_deadline.py
+"""
+import time
+import unittest
+
+from tracing.deadline import Deadline, DeadlineExceeded, check_deadline
+
+
+class StubDriver:
+    pass
+
+
+class TestDeadline(unittest.TestCase):
+
+    def test_unlimited(self):
+        deadline = Deadline()
+        self.assertIsNone(deadline.left())
+        self.assertFalse(deadline.is_expired())
+        self.assertEqual(deadline.cap(5), 5)
+        deadline.check()
+
+    def test_total_expiry(self):
+        deadline = Deadline(budget = 0.05)
+        self.assertFalse(deadline.is_expired())
+        self.assertLessEqual(deadline.cap(5), 0.05)
+
+        time.sleep(0.06)
+        self.assertTrue(deadline.is_expired())
+        self.assertTrue(deadline.is_total_expired())
+        self.assertEqual(deadline.left(), 0)
+        self.assertEqual(deadline.cap(5), 0)
+
+        with self.assertRaises(DeadlineExceeded) as context:
+            deadline.check()
+        self.assertTrue(context.exception.total)
+
+    def test_state_expiry(self):
+        deadline = Deadline(budget = 60, state_budget = 0.05)
+        deadline.start_state('product')
+        time.sleep(0.06)
+
+        with self.assertRaises(DeadlineExceeded) as context:
+            deadline.check()
+        self.assertFalse(context.exception.total)
+        self.assertEqual(context.exception.state, 'product')
+
+        # Next state gets a new budget
+        deadline.start_state('cart')
+        self.assertFalse(deadline.is_expired())
+        deadline.check()
+
+    def test_check_deadline(self):
+        driver = StubDriver()
+        check_deadline(driver)
+
+        driver.deadline = Deadline(budget = 0)
+        with self.assertRaises(DeadlineExceeded):
+            check_deadline(driver)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+Tests of cached backbone features
+Run: python -m pytest test_feature_store.py
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from tracing.utils.feature_store import FeatureStore, get_array_hash
+
+
+meta = {'backbone': 'mobilenet_v1', 'checkpoint': 'model/19@1'}
+
+
+def make_images(count, seed = 0):
+    rnd = np.random.RandomState(seed)
+    return [rnd.rand(4, 4, 3).astype(np.float32) for _ in range(count)]
+
+
+def compute_features(images):
+    return np.array([[image.mean(), image.max(), image.min()] for image in images], dtype = np.float32)
+
+
+class TestFeatureStore(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'features', 'store')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_array_hash(self):
+        image = make_images(1)[0]
+        self.assertEqual(get_array_hash(image), get_array_hash(image.copy()))
+        self.assertNotEqual(get_array_hash(image), get_array_hash(image.reshape(16, 3)))
+
+    def test_grow_and_reopen(self):
+        images = make_images(5)
+        store = FeatureStore(self.path, 3, initial_capacity = 2, meta = meta)
+        features = store.get_or_compute(images, compute_features)
+        self.assertEqual(len(store), 5)
+        self.assertGreaterEqual(store.capacity, 5)
+        np.testing.assert_allclose(features, compute_features(images))
+        store.close()
+
+        computed = []
+        def compute(images):
+            computed.extend(images)
+            return compute_features(images)
+
+        store = FeatureStore(self.path, 3, initial_capacity = 2, meta = meta)
+        self.assertEqual(len(store), 5)
+
+        more = make_images(2, seed = 1)
+        features = store.get_or_compute(images[:2] + more + more[:1], compute)
+        self.assertEqual(len(computed), 2)
+        self.assertEqual(len(store), 7)
+        np.testing.assert_allclose(features, compute_features(images[:2] + more + more[:1]))
+        store.close()
+
+    def test_refuses_other_meta(self):
+        FeatureStore(self.path, 3, meta = meta).close()
+
+        with self.assertRaises(ValueError):
+            FeatureStore(self.path, 3, meta = dict(meta, checkpoint = 'model/20@2'))
+
+        with self.assertRaises(ValueError):
+            FeatureStore(self.path, 4, meta = meta)
+
+    def test_refuses_data_without_meta(self):
+        store = FeatureStore(self.path, 3, meta = meta)
+        store.get_or_compute(make_images(1), compute_features)
+        store.close()
+        os.remove(self.path + '.meta')
+
+        with self.assertRaises(ValueError):
+            FeatureStore(self.path, 3, meta = meta)
+
+    def test_truncates_torn_key(self):
+        images = make_images(2)
+        store = FeatureStore(self.path, 3, meta = meta)
+        store.get_or_compute(images, compute_features)
+        store.close()
+
+        with open(self.path + '.keys', 'a') as f:
+            f.write(get_array_hash(images[0])[:10])
+
+        store = FeatureStore(self.path, 3, meta = meta)
+        self.assertEqual(len(store), 2)
+
+        image = make_images(1, seed = 2)
+        np.testing.assert_allclose(store.get_or_compute(image, compute_features), compute_features(image))
+        store.close()
+
+        store = FeatureStore(self.path, 3, meta = meta)
+        self.assertEqual(len(store), 3)
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
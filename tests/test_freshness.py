@@ -0,0 +1,76 @@
+"""
+Tests of trace outcomes and freshness of traced domains
+Run: python -m pytest test_freshness.py
+"""
+import configparser
+import datetime
+import unittest
+
+from tracing.freshness import FreshnessIndex
+from tracing.status import NotAvailable, RequestError, Timeout, ProcessingStatus, get_outcome
+
+
+class Record:
+    def __init__(self, outcome, last_traced):
+        self.outcome = outcome
+        self.last_traced = last_traced
+
+
+def read_config(text):
+    config = configparser.ConfigParser()
+    config.read_string(text)
+    return config
+
+
+class TestGetOutcome(unittest.TestCase):
+
+    def test_errors(self):
+        self.assertEqual(get_outcome(NotAvailable('dns error')), 'not_available')
+        self.assertEqual(get_outcome(RequestError(404)), 'request_error')
+        self.assertEqual(get_outcome(Timeout(60, state = 'product')), 'timeout')
+
+    def test_final_state(self):
+        self.assertEqual(get_outcome(ProcessingStatus('purchased')), 'purchased')
+        self.assertEqual(get_outcome(ProcessingStatus(None)), 'unknown')
+
+
+class TestFreshnessIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.now = datetime.datetime(2020, 1, 10)
+        self.index = FreshnessIndex(ttl_days = {'not_available': 30, 'timeout': 0}, default_ttl_days = 1)
+
+    def test_is_record_fresh(self):
+        days_ago = lambda days: self.now - datetime.timedelta(days = days)
+
+        self.assertTrue(self.index.is_record_fresh(Record('not_available', days_ago(29)), self.now))
+        self.assertFalse(self.index.is_record_fresh(Record('not_available', days_ago(31)), self.now))
+
+        # Outcomes without ttl use default one
+        self.assertTrue(self.index.is_record_fresh(Record('purchased', days_ago(0.5)), self.now))
+        self.assertFalse(self.index.is_record_fresh(Record('purchased', days_ago(2)), self.now))
+
+    def test_zero_ttl_is_never_fresh(self):
+        self.assertFalse(self.index.is_record_fresh(Record('timeout', self.now), self.now))
+
+    def test_never_traced(self):
+        self.assertFalse(self.index.is_record_fresh(Record('purchased', None), self.now))
+
+    def test_from_config(self):
+        self.assertIsNone(FreshnessIndex.from_config(read_config('[freshness]\nenabled = false\n')))
+        self.assertIsNone(FreshnessIndex.from_config(read_config('[tracing]\n')))
+
+        config = read_config('[freshness]\n'
+                             'enabled = true\n'
+                             'ttl_days = not_available: 30, purchased:7,\n'
+                             'default_ttl_days = 0.5\n')
+        index = FreshnessIndex.from_config(config)
+        self.assertEqual(index.ttl_days, {'not_available': 30, 'purchased': 7})
+        self.assertEqual(index.default_ttl_days, 0.5)
+
+        index = FreshnessIndex.from_config(config, default_ttl_days = 2)
+        self.assertEqual(index.default_ttl_days, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
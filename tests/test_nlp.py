@@ -0,0 +1,59 @@
+"""
+Tests of compiled pattern sets in tracing.nlp
+Run: python -m pytest test_nlp.py
+"""
+import unittest
+
+from tracing.nlp import PatternSet, check_text, check_texts, check_if_empty_cart
+
+
+class TestPatternSet(unittest.TestCase):
+
+    def test_finds_any_pattern(self):
+        patterns = PatternSet(['check ?out', 'pay(ment)?'])
+        self.assertEqual(len(patterns), 2)
+        self.assertTrue(patterns.search('go to checkout'))
+        self.assertTrue(patterns.search('payment'))
+        self.assertFalse(patterns.search('add to cart'))
+
+    def test_empty(self):
+        patterns = PatternSet([])
+        self.assertEqual(len(patterns), 0)
+        self.assertFalse(patterns.search('anything'))
+
+    def test_duplicate_named_groups(self):
+        patterns = PatternSet(['(?P<word>cart)', '(?P<word>bag)'])
+        self.assertTrue(patterns.search('my bag'))
+        self.assertTrue(patterns.search('my cart'))
+        self.assertFalse(patterns.search('my basket'))
+
+    def test_back_references(self):
+        patterns = PatternSet(['(a)\\1', '(b)c'])
+        self.assertTrue(patterns.search('xaay'))
+        self.assertTrue(patterns.search('bc'))
+        self.assertFalse(patterns.search('ab'))
+
+    def test_inline_flags(self):
+        patterns = PatternSet(['(?i)Cart', 'bag'])
+        self.assertTrue(patterns.search('CART'))
+        self.assertTrue(patterns.search('bag'))
+
+
+class TestCheckText(unittest.TestCase):
+
+    def test_contains_and_not_contains(self):
+        self.assertTrue(check_text('Check-Out', ['check out']))
+        self.assertFalse(check_text('Check-Out now', ['check out'], ['now']))
+        self.assertFalse(check_text('cart', ['checkout']))
+        self.assertTrue(check_text('anything', []))
+
+    def test_check_texts(self):
+        self.assertEqual(check_texts(['Pay', 'Cart', 'Pay later'], ['pay'], ['later']), [True, False, False])
+
+    def test_empty_cart(self):
+        self.assertTrue(check_if_empty_cart('Your cart is currently empty'))
+        self.assertFalse(check_if_empty_cart('Your cart'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+"""
+Tests of ReplayStore and domain normalization
+Run: python -m pytest test_replay_store.py
+"""
+import os
+import shutil
+import time
+import tempfile
+import unittest
+
+from tracing.replay_store import ReplayStore, trim_path
+from tracing.utils.domains import normalize_domain
+
+
+def make_step(state, new_state):
+    return {'state': state, 'new_state': new_state, 'handler': 'click'}
+
+
+class TestNormalizeDomain(unittest.TestCase):
+
+    def test_urls(self):
+        self.assertEqual(normalize_domain('https://WWW.Shop.com:443/index.html'), 'shop.com')
+        self.assertEqual(normalize_domain('http://shop.com/?q=1'), 'shop.com')
+        self.assertEqual(normalize_domain('shop.com.'), 'shop.com')
+
+    def test_domains(self):
+        self.assertEqual(normalize_domain(' www.Shop.com '), 'shop.com')
+        self.assertEqual(normalize_domain('sub.shop.com'), 'sub.shop.com')
+
+    def test_empty(self):
+        self.assertEqual(normalize_domain(''), '')
+        self.assertEqual(normalize_domain(None), '')
+
+
+class TestReplayStore(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'replay.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_trim_path(self):
+        steps = [make_step('shop', 'product'), make_step('product', 'product')]
+        self.assertEqual(trim_path(steps), steps[:1])
+        self.assertEqual(trim_path(steps[1:]), [])
+
+    def test_round_trip(self):
+        steps = [make_step('shop', 'product'), make_step('product', 'cart'), make_step('cart', 'cart')]
+        with ReplayStore(self.path) as store:
+            self.assertTrue(store.save_path('https://www.shop.com/', 'heuristic', steps, 'cart', 2))
+
+        with ReplayStore(self.path) as store:
+            self.assertEqual(store.get_path('shop.com', 'heuristic'), steps[:2])
+            self.assertIsNone(store.get_path('shop.com', 'rl'))
+            self.assertIsNone(store.get_path('other.com', 'heuristic'))
+
+    def test_keeps_deeper_path(self):
+        deep = [make_step('shop', 'product'), make_step('product', 'cart')]
+        shallow = [make_step('shop', 'product')]
+        with ReplayStore(self.path) as store:
+            self.assertTrue(store.save_path('shop.com', 'heuristic', deep, 'cart', 2))
+            self.assertFalse(store.save_path('shop.com', 'heuristic', shallow, 'product', 1))
+            self.assertEqual(store.get_path('shop.com', 'heuristic'), deep)
+
+    def test_stale_path(self):
+        steps = [make_step('shop', 'product')]
+        with ReplayStore(self.path, max_age_days = 0) as store:
+            store.save_path('shop.com', 'heuristic', steps, 'product', 1)
+            self.assertIsNone(store.get_path('shop.com', 'heuristic'))
+
+    def test_removes_diverging_path(self):
+        steps = [make_step('shop', 'product')]
+        with ReplayStore(self.path, max_failures = 2) as store:
+            store.save_path('shop.com', 'heuristic', steps, 'product', 1)
+            store.report_replay('shop.com', 'heuristic', diverged_step = 0)
+            self.assertEqual(store.get_path('shop.com', 'heuristic'), steps)
+
+            store.report_replay('shop.com', 'heuristic', diverged_step = 0)
+            self.assertIsNone(store.get_path('shop.com', 'heuristic'))
+
+    def test_evicts_least_recently_used(self):
+        steps = [make_step('shop', 'product')]
+        with ReplayStore(self.path, max_domains = 1) as store:
+            store.save_path('first.com', 'heuristic', steps, 'product', 1)
+            time.sleep(0.01)
+            store.save_path('second.com', 'heuristic', steps, 'product', 1)
+            store.evict()
+
+            self.assertIsNone(store.get_path('first.com', 'heuristic'))
+            self.assertEqual(store.get_path('second.com', 'heuristic'), steps)
+
+
+if __name__ == '__main__':
+    unittest.main()
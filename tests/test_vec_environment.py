@@ -0,0 +1,102 @@
+"""
+Smoke test of VecEnvironment with stub environments that don't need a browser.
+Run: python -m pytest test_vec_environment.py
+"""
+import unittest
+import numpy as np
+
+from tracing.rl.actions import Actions
+from tracing.rl.vec_environment import VecEnvironment
+from tracing.selenium_utils.controls import Types
+
+
+crop = 4
+
+
+class StubControl:
+    type = Types.button
+    label = 'Add to cart'
+    values = None
+
+    def __str__(self):
+        return 'Control: button, label: Add to cart'
+
+
+class StubEnvironment:
+    """
+    Environment with a fixed number of controls, control input is filled by url id
+    """
+
+    def __init__(self, controls = 2):
+        self.controls = controls
+        self.rewards = None
+        self.step = 0
+        self.value = 0
+
+    def start(self, url):
+        self.value = float(url.split('/')[-1])
+        self.left = self.controls
+        self.step = 0
+        return True
+
+    def has_next_control(self):
+        return self.left > 0
+
+    def get_next_control(self):
+        self.left -= 1
+        return StubControl()
+
+    def get_control_as_input(self, ctrl):
+        return np.full((crop, crop, 3), self.value, dtype = np.float32)
+
+    def apply_action(self, ctrl, action):
+        self.step += 1
+        return (True, self.value)
+
+    def calc_final_reward(self):
+        return self.value * 10
+
+    def try_quit_driver(self):
+        pass
+
+
+def create_short_env():
+    return StubEnvironment(controls = 1)
+
+
+def create_long_env():
+    return StubEnvironment(controls = 2)
+
+
+class TestVecEnvironment(unittest.TestCase):
+
+    def test_steps_environments_until_they_finish(self):
+        env_fns = [create_short_env, create_long_env]
+        with VecEnvironment(env_fns, crop_h = crop, crop_w = crop, start_method = 'fork') as envs:
+            self.assertEqual(envs.reset(['http://shop/1', 'http://shop/2']), [True, True])
+
+            observations, active, possible_actions, labels = envs.next_controls()
+            self.assertEqual(active, [True, True])
+            self.assertTrue(np.all(observations[0] == 1))
+            self.assertTrue(np.all(observations[1] == 2))
+
+            expected = Actions.get_possible_actions(StubControl())
+            self.assertEqual(possible_actions, [expected, expected])
+            self.assertEqual(labels[0], str(StubControl()))
+
+            results = envs.apply_actions([0, None])
+            self.assertEqual(results, [(True, 1.0, 1), None])
+
+            # The first environment has only one control
+            observations, active, possible_actions, labels = envs.next_controls()
+            self.assertEqual(active, [False, True])
+            self.assertEqual(possible_actions[0], None)
+
+            observations, active, _, _ = envs.next_controls()
+            self.assertEqual(active, [False, False])
+
+            self.assertEqual(envs.calc_final_rewards(), [10.0, 20.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
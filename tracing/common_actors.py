@@ -1,7 +1,6 @@
 import random
 import sys
 import traceback
-import time
 import calendar
 import csv
 import sys
@@ -45,7 +44,7 @@ class ToProductPageLink(IStepActor):
 
             url = ShopTracer.normalize_url(link)
             driver.get(url)
-            time.sleep(3)
+            wait_settled(driver, 3)
 
             # Check that have add to cart buttons
             if AddToCart.find_to_cart_elements(driver):
@@ -75,7 +74,7 @@ class AddToCart(IStepActor):
         elements = AddToCart.find_to_cart_elements(driver)
 
         if click_first(driver, elements, try_handle_popups, randomize = True):
-            time.sleep(3)
+            wait_settled(driver, 3)
             return States.product_in_cart
         else:
             return state
@@ -125,7 +124,7 @@ class ToCartLink(IStepActor):
                 break
 
             if click_first(driver, btns, randomize = True):
-                time.sleep(3)
+                wait_settled(driver, 3)
                 checkouts = ToCheckout.find_checkout_elements(driver)
 
                 if not is_empty_cart(driver) and len(checkouts) > 0:
@@ -172,7 +171,7 @@ class ToCheckout(IStepActor):
         btns = ToCheckout.find_checkout_elements(driver)
 
         if click_first(driver, btns):
-            time.sleep(3)
+            wait_settled(driver, 3)
             close_alert_if_appeared(driver)
             if not is_empty_cart(driver):
                 if ToCheckout.has_checkout_btns(driver) and max_depth > 0:
@@ -345,14 +344,18 @@ class PaymentFields(IStepActor):
                         if nlp.check_text(text, ctns):
                             try:
                                 option.click() # select() in earlier versions of webdriver
-                                time.sleep(context.delaying_time - 1)
+                                wait_settled(driver, context.delaying_time - 1)
                                 result_cnt += 1
                                 flag = True
                                 break
+                            except DeadlineExceeded:
+                                raise
                             except:
                                 break
                     if flag:
                         break
+                except DeadlineExceeded:
+                    raise
                 except:
                     continue
         return result_cnt
@@ -392,7 +395,7 @@ class PaymentFields(IStepActor):
 
         input_texts = driver.find_elements_by_css_selector("input")
         input_texts += driver.find_elements_by_css_selector("textarea")
-        time.sleep(context.delaying_time - 1)
+        wait_settled(driver, context.delaying_time - 1)
 
         if is_userInfo:
             json_Info = context.user_info.get_json_userinfo()
@@ -462,13 +465,15 @@ class PaymentFields(IStepActor):
                             input_texts[index].send_keys(json_Info[key])
                             input_texts[index].clear()
                             input_texts[index].send_keys(json_Info[key])
-                            time.sleep(context.delaying_time + 1)
+                            wait_settled(driver, context.delaying_time + 1)
                         else:
                             input_texts[index].send_keys(json_Info[key])
 
                         if not is_userInfo and key == "zip":
-                            time.sleep(context.delaying_time)
-                        time.sleep(context.delaying_time - 1)
+                            wait_settled(driver, context.delaying_time)
+                        wait_settled(driver, context.delaying_time - 1)
+                    except DeadlineExceeded:
+                        raise
                     except:
                         break
 
@@ -500,7 +505,7 @@ class PaymentFields(IStepActor):
             if nlp.check_alert_text(driver, ["decline", "duplicate", "merchant", "transaction", "credit card"]):
                 return 2
             return 0
-        time.sleep(context.delaying_time - 1)
+        wait_settled(driver, context.delaying_time - 1)
 
         required_fields = driver.find_elements_by_css_selector("input")
         required_fields += driver.find_elements_by_css_selector("select")
@@ -555,7 +560,7 @@ class PaymentFields(IStepActor):
                     break
                 except:
                     error_elements = find_error_elements(driver, ["error", "err", "alert", "advice", "fail"], ["override"])
-                    time.sleep(context.delaying_time - 1)
+                    wait_settled(driver, context.delaying_time - 1)
                     pass
 
             if not error_result:
@@ -792,13 +797,13 @@ class PaymentFields(IStepActor):
             if not is_userinfo and self.fill_billing_address(driver, context):
                 is_userinfo = True
                 context.log_step("Fill user information fields")
-                time.sleep(context.delaying_time - 1)
+                wait_settled(driver, context.delaying_time - 1)
 
             div_btns = find_elements_with_attribute(driver, "div", "class", "shipping_method")
 
             if div_btns:
                 div_btns[0].click()
-                time.sleep(context.delaying_time - 1)
+                wait_settled(driver, context.delaying_time - 1)
 
             if allow_fill_payment and not is_paymentinfo:
                 if self.fill_payment_info(driver, context):
@@ -851,7 +856,7 @@ class PaymentFields(IStepActor):
                 except:
                     driver.execute_script("arguments[0].click();",continue_btns[len(continue_btns) - 1])
                     pass
-            time.sleep(context.delaying_time * 3)
+            wait_settled(driver, context.delaying_time * 3)
             checked_error = self.check_error(driver, context)
 
             if not checked_error:
@@ -863,7 +868,7 @@ class PaymentFields(IStepActor):
                     return True
                 purchase_text = get_page_text(driver)
                 if nlp.check_text(purchase_text, ["being process", "logging"]):
-                    time.sleep(context.delaying_time - 1)
+                    wait_settled(driver, context.delaying_time - 1)
                 elif nlp.check_text(purchase_text, ["credit card to complete your purchase", "secure payment page"]):
                     return True
             elif checked_error == 2:
@@ -901,7 +906,7 @@ class PaymentFields(IStepActor):
             driver.execute_script("arguments[0].click();", order[0])
             pass
 
-        time.sleep(context.delaying_time * 2)
+        wait_settled(driver, context.delaying_time * 2)
 
         if nlp.check_alert_text(driver, ["decline", "duplicate", "merchant", "transaction"]):
             return True
@@ -943,7 +948,7 @@ class PaymentFields(IStepActor):
                         else:
                             return_flag = True
 
-                        time.sleep(context.delaying_time - 1)
+                        wait_settled(driver, context.delaying_time - 1)
                 else:
                     return_flag = False
 
@@ -969,7 +974,7 @@ class PaymentFields(IStepActor):
             #click an radio as guest....
             if not click_first(driver, radio_pass):
                 return state
-            time.sleep(context.delaying_time - 1)
+            wait_settled(driver, context.delaying_time - 1)
 
         continue_pass = self.find_guest_continue_button(
             driver,
@@ -990,14 +995,14 @@ class PaymentFields(IStepActor):
             if guest_email:
                 for g_email in guest_email:
                     g_email.send_keys(context.user_info.email)
-                time.sleep(context.delaying_time - 1)
+                wait_settled(driver, context.delaying_time - 1)
             #click continue button for guest....
             try:
                 continue_pass[0].click()
             except:
                 driver.execute_script("arguments[0].click();", continue_pass[0])
                 pass
-            time.sleep(context.delaying_time - 1)
+            wait_settled(driver, context.delaying_time - 1)
 
         #the case if authentication is not requiring....
         filling_result = self.click_to_order(driver, context)
@@ -1014,13 +1019,13 @@ class SearchForProductPage(IStepActor):
 
     def search_in_google(self, driver, query):
         driver.get('https://www.google.com')
-        time.sleep(3)
+        wait_settled(driver, 3)
 
         search_input = driver.find_element_by_css_selector('input.gsfi')
         search_input.clear()
         search_input.send_keys(query)
         search_input.send_keys(Keys.ENTER)
-        time.sleep(3)
+        wait_settled(driver, 3)
 
         links = driver.find_elements_by_css_selector('div.g .rc .r a[href]')
         if len(links) > 0:
@@ -1030,13 +1035,13 @@ class SearchForProductPage(IStepActor):
 
     def search_in_bing(self, driver, query):
         driver.get('https://www.bing.com')
-        time.sleep(3)
+        wait_settled(driver, 3)
 
         search_input = driver.find_element_by_css_selector('input.b_searchbox')
         search_input.clear()
         search_input.send_keys(query)
         search_input.send_keys(Keys.ENTER)
-        time.sleep(3)
+        wait_settled(driver, 3)
 
         links = driver.find_elements_by_css_selector('ol#b_results > li.b_algo > h2 > a[href]')
 
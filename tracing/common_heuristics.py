@@ -1,13 +1,16 @@
 import random
-import time
 import logging
 
 from selenium.common.exceptions import WebDriverException
 from selenium.webdriver.common.action_chains import ActionChains
+from selenium.webdriver.common.keys import Keys
 
 import tracing.nlp as nlp
 from tracing.selenium_utils.common import *
 from tracing.selenium_utils.controls import *
+from tracing.selenium_utils.snapshot import get_page_snapshot
+from tracing.selenium_utils.settle import wait_settled
+from tracing.deadline import check_deadline
 
 
 def get_label_text_with_attribute(driver, elem):
@@ -31,22 +34,33 @@ def get_label_text_with_attribute(driver, elem):
 
     return label_text
 
+def click_radio_or_checkout_button(driver, element):
+    try:
+        element.send_keys(Keys.SPACE)
+    except:
+        driver.execute_script("arguments[0].click();", element)
+        pass
+
+    wait_settled(driver, 1)
+
+
 def find_radio_or_checkbox_buttons(driver,
                                   contains=None,
                                   not_contains=None):
-    radiobtns = driver.find_elements_by_css_selector("input[type='radio']")
-    checkbtns = driver.find_elements_by_css_selector("input[type='checkbox']")
-
     result = []
-    for elem in radiobtns + checkbtns:
-        text = elem.get_attribute("outerHTML")
+    for item in get_page_snapshot(driver).get('checks'):
+        text = item['html']
         if nlp.check_text(text, contains, not_contains):
-            result.append(elem)
+            result.append(item['elem'])
         else:
-            l_text = get_label_text_with_attribute(driver, elem)
+            # the same as get_label_text_with_attribute but without extra calls to the driver
+            if item['hasId'] and item['label'] is not None:
+                l_text = nlp.remove_letters(item['label'], ["/", "*", "-", "_", ":", " "]).lower()
+            else:
+                l_text = nlp.remove_letters(text.strip(), ["*", "-", "_", ":", " "]).lower()
 
             if l_text and nlp.check_text(l_text, contains, not_contains):
-                result.append(elem)
+                result.append(item['elem'])
     
     return result
 
@@ -55,19 +69,12 @@ def get_no_href_buttons(driver, contains, not_contains=None, get_type = 1):
         '''
             Find no href link or button based on contains and not_contains parameters.
         '''
-        result = []
-
-        if get_type == 1:
-            elements = find_buttons_or_links(driver, contains, not_contains)
-        else:
-            elements = find_buttons(driver, contains, not_contains)
+        url = normalize_url(get_url(driver))
 
-        for btn in elements:
-            if btn.get_attribute('href') == normalize_url(get_url(driver)):
-                continue
-            result.append(btn)
+        items = find_links(driver, contains, not_contains, return_items=True) if get_type == 1 else []
+        items += find_buttons(driver, contains, not_contains, return_items=True)
 
-        return result
+        return [item['elem'] for item in items if item['href'] != url]
 
 
 def find_elements_with_attribute(driver,
@@ -102,39 +109,30 @@ def check_filling_fields_required (driver):
             return 2
         return 0
 
-def find_links(driver, contains=None, not_contains=None):
-    result = []
+def find_links(driver, contains=None, not_contains=None, return_items=False):
+    url = get_url(driver)
 
-    for link in get_links(driver):
-        if not can_click(link):
+    result = []
+    for item in get_page_snapshot(driver).get('links'):
+        if not item['displayed']:
             continue
             
-        if get_url(driver) == link.get_attribute("href"):
+        if url == item['href']:
             continue
 
-        text = link.get_attribute("outerHTML")
-        if nlp.check_text(text, contains, not_contains):
-            result.append(link)
+        if nlp.check_text(item['html'], contains, not_contains):
+            result.append(item)
 
-    return result
+    return result if return_items else [item['elem'] for item in result]
 
 
 def find_error_elements(driver, contains=None, not_contains=None):
-    divs = driver.find_elements_by_css_selector("div")
-    spans = driver.find_elements_by_css_selector("span")
-    label = driver.find_elements_by_css_selector("label")
-    p = driver.find_elements_by_css_selector("p")
-    ul = driver.find_elements_by_css_selector("ul")
-
     # Yield isn't good because context can change
     result = []
     try:
-        for div in divs + spans + label + p + ul:
-            if div.is_displayed():
-                div_class = div.get_attribute("class")
-                if nlp.check_text(div_class, contains, not_contains) and \
-                    (div.get_attribute("innerHTML").strip() and not "error hide" in div.get_attribute("innerHTML").strip().lower()):
-                    result.append(div)
+        for item in get_page_snapshot(driver).get('errors'):
+            if nlp.check_text(item['cls'], contains, not_contains) and item['hasContent']:
+                result.append(item['elem'])
     except:
         result = []
         pass
@@ -161,20 +159,18 @@ def find_sub_elements(driver, element, contains=None, not_contains=None):
     return result
 
 
-def find_buttons(driver, contains=None, not_contains=None):
+def find_buttons(driver, contains=None, not_contains=None, return_items=False):
     
     # Yield isn't good because context can change
     result = []
-    for elem in get_buttons(driver):
-        if not can_click(elem):
+    for item in get_page_snapshot(driver).get('buttons'):
+        if not item['displayed']:
             continue
-        text = elem.get_attribute("innerHTML").strip() + \
-               elem.text + " " + \
-               (elem.get_attribute("value") if elem.get_attribute("value")  else "")
+        text = item['inner'] + item['text'] + " " + item['value']
         if nlp.check_text(text, contains, not_contains):
-            result.append(elem)
+            result.append(item)
 
-    return result
+    return result if return_items else [item['elem'] for item in result]
 
 
 def find_buttons_or_links(driver, contains=None, not_contains=None):
@@ -194,7 +190,7 @@ def try_handle_popups(driver):
     
     result = click_first(driver, btns, None)
     if result:
-        time.sleep(2)
+        wait_settled(driver, 2)
     
     return result
 
@@ -230,6 +226,7 @@ def click_first(driver, elements, on_error=try_handle_popups, randomize = False)
         random.shuffle(elements)
     
     for element in elements:
+        check_deadline(driver)
         logger.debug('clicking element: {}'.format(to_string(element)))
         clicked = process(element)
         logger.debug('result: {}'.format(clicked))
@@ -251,22 +248,13 @@ def click_first(driver, elements, on_error=try_handle_popups, randomize = False)
     return False
 
 def find_text_element(driver, contains=None, not_contains=None):
-    label = driver.find_elements_by_tag_name('label')
-    h_elements = driver.find_elements_by_tag_name('h')
-    span = driver.find_elements_by_tag_name('span')
-    p = driver.find_elements_by_tag_name('p')
-    td = driver.find_elements_by_tag_name('td')
-    li = driver.find_elements_by_css_selector('li')
-
-    for ind in range(1,6):
-        h_elements += driver.find_elements_by_tag_name('h%s' % str(ind))
+    items = get_page_snapshot(driver).get('texts')
+    checks = nlp.check_texts([item['html'] for item in items], contains, not_contains)
 
     result = None
-    for elem in label + h_elements + span + p + td + li:
-        text = elem.get_attribute("outerHTML")
-
-        if nlp.check_text(text, contains, not_contains):
-            result = elem
+    for item, passed in zip(items, checks):
+        if passed:
+            result = item['elem']
 
     return result
 
@@ -0,0 +1,85 @@
+import time
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised by Deadline.check when trace or state budget is over
+    """
+    def __init__(self, state = None, total = True):
+        """
+        :param state:  State that was processed when budget was over
+        :param total:  True if the whole trace budget is over, False if only budget of the state
+        """
+        self.state = state
+        self.total = total
+        super().__init__('{} budget is over{}'.format('Trace' if total else 'State',
+                                                      ' in state {}'.format(state) if state else ''))
+
+
+class Deadline:
+    """
+    Time budget of a trace that is checked cooperatively by tracers, handlers and waits.
+    Is available as driver.deadline during tracing
+    """
+
+    def __init__(self, budget = None, state_budget = None):
+        """
+        :param budget:        Seconds for the whole trace (all attempts), None for unlimited
+        :param state_budget:  Seconds for processing of one state, None for unlimited
+        """
+        self.budget = budget
+        self.state_budget = state_budget
+        self.started = time.time()
+        self.state = None
+        self.state_started = self.started
+
+    def start_state(self, state):
+        """
+        Starts budget of the next state
+        """
+        self.state = state
+        self.state_started = time.time()
+
+    def left(self):
+        """
+        Seconds left till the nearest of trace and state deadlines, None if both are unlimited
+        """
+        now = time.time()
+        lefts = []
+        if self.budget is not None:
+            lefts.append(self.started + self.budget - now)
+
+        if self.state_budget is not None:
+            lefts.append(self.state_started + self.state_budget - now)
+
+        return max(0, min(lefts)) if lefts else None
+
+    def is_total_expired(self):
+        return self.budget is not None and time.time() - self.started >= self.budget
+
+    def is_expired(self):
+        left = self.left()
+        return left is not None and left <= 0
+
+    def check(self):
+        """
+        Raises DeadlineExceeded if budget is over
+        """
+        if self.is_expired():
+            raise DeadlineExceeded(self.state, self.is_total_expired())
+
+    def cap(self, seconds):
+        """
+        Limits waiting time by time left
+        """
+        left = self.left()
+        return seconds if left is None else min(seconds, left)
+
+
+def check_deadline(driver):
+    """
+    Checks deadline of the trace that uses driver if it's set
+    """
+    deadline = getattr(driver, 'deadline', None)
+    if deadline is not None:
+        deadline.check()
@@ -0,0 +1,225 @@
+import re
+import time
+import asyncio
+import logging
+from collections import namedtuple
+
+import aiohttp
+
+import tracing.nlp as nlp
+from tracing.status import *
+from tracing.utils.domains import normalize_domain
+
+
+class ProbeStatus:
+    unreachable = "unreachable"
+    error = "error"
+    parked = "parked"
+    live = "live"
+
+    statuses = [unreachable, error, parked, live]
+
+
+ProbeResult = namedtuple('ProbeResult', ['domain', 'status', 'code', 'final_url', 'elapsed', 'message'])
+
+
+# Hosts of domain parking and domain sale services
+parking_hosts = [
+    'sedoparking.com', 'sedo.com', 'parkingcrew.net', 'bodis.com', 'dan.com', 'hugedomains.com',
+    'afternic.com', 'above.com', 'buydomains.com', 'domainmarket.com', 'undeveloped.com',
+    'parklogic.com', 'searchvity.com', 'domainnamesales.com'
+]
+
+parking_phrases = [
+    'this domain (name )?(is|may be) for sale', 'buy this domain', 'domain is parked',
+    'parked free', 'parked domain', 'this domain has expired', 'domain (name )?has been registered',
+    'make an offer on this domain', 'inquire about this domain'
+]
+
+# Codes that are often returned to bots by protection services while the shop works in browser
+protection_codes = [401, 403, 429, 503]
+
+
+def get_text(html):
+    html = re.sub(r'(?is)<(script|style)[^>]*>.*?</\1>', ' ', html)
+    text = re.sub(r'(?s)<[^>]+>', ' ', html)
+    return re.sub(r'\s+', ' ', text).lower()
+
+
+def is_parking_host(url):
+    host = normalize_domain(url)
+    return any(host == parking or host.endswith('.' + parking) for parking in parking_hosts)
+
+
+def classify(domain, code, final_url, html):
+    """
+    Classifies response of the shop main page
+    :return:  Tuple (ProbeStatus, message)
+    """
+    if final_url and normalize_domain(final_url) != normalize_domain(domain) and is_parking_host(final_url):
+        return (ProbeStatus.parked, 'redirect to {}'.format(final_url))
+
+    if code >= 400 and code not in protection_codes:
+        return (ProbeStatus.error, 'status {}'.format(code))
+
+    text = get_text(html or '')
+    if nlp.check_if_domain_for_sale(text, re.escape(normalize_domain(domain))) or \
+            nlp.check_text(text, parking_phrases):
+        return (ProbeStatus.parked, 'domain for sale')
+
+    return (ProbeStatus.live, None)
+
+
+class DomainProber:
+    """
+    Checks a lot of domains concurrently by plain HTTP requests before they are traced by browser
+    """
+
+    def __init__(self,
+                 concurrency = 1000,
+                 timeout = 15,
+                 limit_per_host = 4,
+                 dns_cache_seconds = 600,
+                 max_body = 65536,
+                 user_agent = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                              'Chrome/70.0.3538.77 Safari/537.36'
+                ):
+        """
+        :param concurrency:        Maximum number of simultaneous connections
+        :param timeout:            Seconds to wait for the whole response of one domain
+        :param limit_per_host:     Maximum number of simultaneous connections to one host
+        :param dns_cache_seconds:  Time to keep resolved DNS names
+        :param max_body:           Number of bytes of page that are read to detect parked domains
+        :param user_agent:         User-Agent header, bots are often blocked by shops
+        """
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.limit_per_host = limit_per_host
+        self.dns_cache_seconds = dns_cache_seconds
+        self.max_body = max_body
+        self.user_agent = user_agent
+        self._logger = logging.getLogger('shop_tracer')
+
+    @staticmethod
+    def from_config(config, **kwargs):
+        """
+        Creates DomainProber from section [prober] of config
+        :param config:  ConfigParser
+        :param kwargs:  Parameters that override config values
+        """
+        params = dict(
+            concurrency = config.getint('prober', 'concurrency', fallback=1000),
+            timeout = config.getint('prober', 'timeout', fallback=15),
+            limit_per_host = config.getint('prober', 'limit_per_host', fallback=4)
+        )
+        params.update(kwargs)
+
+        return DomainProber(**params)
+
+    def create_session(self):
+        connector = aiohttp.TCPConnector(limit = self.concurrency,
+                                         limit_per_host = self.limit_per_host,
+                                         ttl_dns_cache = self.dns_cache_seconds,
+                                         use_dns_cache = True,
+                                         ssl = False)
+
+        return aiohttp.ClientSession(connector = connector,
+                                     timeout = aiohttp.ClientTimeout(total = self.timeout),
+                                     headers = {'User-Agent': self.user_agent})
+
+    async def probe_domain(self, session, domain):
+        """
+        Requests main page of domain
+        :param session:  aiohttp.ClientSession
+        :param domain:   Domain or url
+        :return:         ProbeResult
+        """
+        url = domain if '://' in domain else 'http://' + domain
+        start = time.time()
+
+        code = None
+        final_url = None
+        try:
+            async with session.get(url, allow_redirects = True, max_redirects = 10) as response:
+                code = response.status
+                final_url = str(response.url)
+                body = await response.content.read(self.max_body)
+                html = body.decode(response.charset or 'utf-8', errors = 'ignore')
+
+            status, message = classify(domain, code, final_url, html)
+
+        except asyncio.TimeoutError:
+            status, message = ProbeStatus.unreachable, 'timeout'
+
+        except (aiohttp.ClientConnectorError, aiohttp.ServerDisconnectedError) as e:
+            status, message = ProbeStatus.unreachable, str(e)
+
+        except (aiohttp.ClientError, ValueError, UnicodeError) as e:
+            status, message = ProbeStatus.error, '{}: {}'.format(type(e).__name__, e)
+
+        return ProbeResult(domain, status, code, final_url, time.time() - start, message)
+
+    async def probe_many(self, domains, on_result = None):
+        """
+        Probes domains by concurrency workers that share one connection pool and DNS cache
+        :param domains:    Iterable of domains
+        :param on_result:  Function that is called with every ProbeResult as soon as it's ready
+        :return:           List of ProbeResult in order of domains
+        """
+        domains = list(domains)
+        results = [None] * len(domains)
+        queue = asyncio.Queue()
+        for item in enumerate(domains):
+            queue.put_nowait(item)
+
+        async def work(session):
+            while not queue.empty():
+                i, domain = queue.get_nowait()
+                results[i] = await self.probe_domain(session, domain)
+                if on_result:
+                    on_result(results[i])
+
+        async with self.create_session() as session:
+            workers = min(self.concurrency, len(domains))
+            await asyncio.gather(*[work(session) for _ in range(workers)])
+
+        return results
+
+    def probe(self, domains, on_result = None):
+        """
+        Synchronous version of probe_many, runs it in a new event loop
+        """
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.probe_many(domains, on_result))
+        finally:
+            loop.close()
+
+    def check(self, domain):
+        """
+        Probes one domain before tracing it
+        :param domain:  Domain
+        :return:        ITraceStatus if domain shouldn't be traced, None if it's live
+        """
+        result = self.probe([domain])[0]
+        self._logger.info('probe {}: {}, {}'.format(domain, result.status, result.message))
+
+        return get_probe_status(result)
+
+
+def get_probe_status(result):
+    """
+    Converts probe result to the trace status
+    :param result:  ProbeResult
+    :return:        ITraceStatus or None if domain is live
+    """
+    if result.status == ProbeStatus.live:
+        return None
+
+    if result.status == ProbeStatus.parked:
+        return NotAvailable('Domain {} for sale'.format(result.domain))
+
+    if result.status == ProbeStatus.error and result.code:
+        return RequestError(result.code, message = result.message)
+
+    return NotAvailable('Domain {} is not available: {}'.format(result.domain, result.message))
@@ -0,0 +1,122 @@
+import datetime
+import logging
+
+from mongoengine import *
+
+from tracing.status import get_outcome
+from tracing.utils.domains import normalize_domain
+
+
+class MongoDbFreshness(Document):
+    """
+    The last trace of normalized domain
+    """
+    domain = StringField(primary_key = True)
+    last_traced = DateTimeField()
+    final_state = StringField()
+    outcome = StringField()
+    attempts = IntField(default = 0)
+
+    meta = {'collection': 'trace_freshness'}
+
+    @staticmethod
+    def register(domain, status):
+        """
+        Updates the last trace of domain and increments number of its traces
+        :param domain:  Domain or url
+        :param status:  ITraceStatus of the trace
+        """
+        domain = normalize_domain(domain)
+        if not domain:
+            return
+
+        MongoDbFreshness.objects(domain = domain).update_one(
+            upsert = True,
+            set__last_traced = datetime.datetime.utcnow(),
+            set__final_state = status.state,
+            set__outcome = get_outcome(status),
+            inc__attempts = 1
+        )
+
+
+class FreshnessIndex:
+    """
+    Decides if domain was traced recently enough to skip it.
+    Time to live depends on the outcome of the last trace
+    """
+
+    def __init__(self,
+                 ttl_days = {'not_available': 30, 'request_error': 14, 'purchased': 7},
+                 default_ttl_days = 1
+                ):
+        """
+        :param ttl_days:          Dict outcome -> days before domain is traced again, 0 to always trace
+        :param default_ttl_days:  Days for outcomes that are not in ttl_days
+        """
+        self.ttl_days = dict(ttl_days)
+        self.default_ttl_days = default_ttl_days
+        self._logger = logging.getLogger('shop_tracer')
+
+    @staticmethod
+    def from_config(config, **kwargs):
+        """
+        Creates FreshnessIndex from section [freshness] of config
+        :param config:  ConfigParser
+        :param kwargs:  Parameters that override config values
+        :return:        FreshnessIndex or None if it's disabled
+        """
+        if not config.getboolean('freshness', 'enabled', fallback=False):
+            return None
+
+        ttl_days = {}
+        for item in config.get('freshness', 'ttl_days', fallback='').split(','):
+            if not item.strip():
+                continue
+
+            outcome, days = item.split(':')
+            ttl_days[outcome.strip()] = float(days)
+
+        params = dict(
+            ttl_days = ttl_days,
+            default_ttl_days = config.getfloat('freshness', 'default_ttl_days', fallback=1)
+        )
+        params.update(kwargs)
+
+        return FreshnessIndex(**params)
+
+    def get_ttl(self, outcome):
+        return datetime.timedelta(days = self.ttl_days.get(outcome, self.default_ttl_days))
+
+    def is_record_fresh(self, record, now = None):
+        now = now or datetime.datetime.utcnow()
+        ttl = self.get_ttl(record.outcome)
+
+        return record.last_traced is not None and ttl > datetime.timedelta(0) and \
+               record.last_traced + ttl > now
+
+    def is_fresh(self, domain):
+        """
+        :param domain:  Domain or url
+        :return:        True if domain was traced recently and shouldn't be traced now
+        """
+        record = MongoDbFreshness.objects(domain = normalize_domain(domain)).first()
+        if record is None:
+            return False
+
+        fresh = self.is_record_fresh(record)
+        if fresh:
+            self._logger.info('domain {} was traced at {} with outcome {}, skipping'.format(
+                domain, record.last_traced, record.outcome))
+
+        return fresh
+
+    def get_fresh(self, domains):
+        """
+        Checks a batch of domains by one query
+        :param domains:  Iterable of normalized domains
+        :return:         Set of domains that shouldn't be traced now
+        """
+        now = datetime.datetime.utcnow()
+        records = MongoDbFreshness.objects(domain__in = list(domains))
+
+        return set(record.domain for record in records if self.is_record_fresh(record, now))
@@ -1,7 +1,6 @@
 import random
 import sys
 import traceback
-import time
 import csv
 import sys
 
@@ -39,7 +38,7 @@ class ToProductPageLink(IEnvActor):
 
         self.checked[link] = True
 
-        text = control.elem.get_attribute('outerHTML')
+        text = control.get_outer_html()
         if nlp.check_text(text, self.contains, self.not_contains):
             self.attempts -= 1
             return Click()
@@ -87,7 +86,7 @@ class AddToCart(IEnvActor):
         try:
             text = control.label
             if not text or not text.strip():
-                text = control.elem.get_attribute('outerHTML')
+                text = control.get_outer_html()
 
             if nlp.check_text(text, self.contains, self.not_contains):
                 self.attempts -= 1
@@ -123,7 +122,7 @@ class ToShopLink(IEnvActor):
         if control.type not in self.type_list:
             return Nothing()
         
-        text = control.elem.get_attribute('outerHTML')
+        text = control.get_outer_html()
         if nlp.check_text(text, self.contains, self.not_contains):
             return Click()
         else:
@@ -196,7 +195,7 @@ class ToCartLink(IEnvActor):
 
         self.checked[link] = True
         
-        text = control.elem.get_attribute('outerHTML')
+        text = control.get_outer_html()
         if nlp.check_text(text, self.contains, self.not_contains):
             self.attempts -= 1
             return Click()
@@ -208,7 +207,7 @@ class ToCartLink(IEnvActor):
             environment.states.append(())
             return (state, False)
         
-        time.sleep(3)
+        wait_settled(environment.driver, 3)
 
         is_empty = is_empty_cart(environment.driver)
 
@@ -264,7 +263,7 @@ class ToCheckout(IEnvActor):
         if control.type not in self.type_list:
             return Nothing()
 
-        text = control.label or control.elem.get_attribute('outerHTML')
+        text = control.label or control.get_outer_html()
 
         if nlp.check_text(text, self.contains, self.not_contains):
             return Click()
@@ -287,7 +286,7 @@ class ToCheckout(IEnvActor):
         if not is_success:
             return (state, False)
         
-        time.sleep(3)
+        wait_settled(environment.driver, 3)
         close_alert_if_appeared(environment.driver)
 
         if ToCheckout.find_checkout_elements(environment.driver):
@@ -353,7 +352,7 @@ class CheckoutLogin(IEnvActor):
                     return InputSelectField('select-country-short-form')
             return Nothing()
 
-        text = control.elem.get_attribute('outerHTML')
+        text = control.get_outer_html()
 
         if nlp.check_text(text.lower(), ['email', 'username'], self.not_contains):
             self.user_name_found = True
@@ -427,10 +426,10 @@ class FillingCheckoutPage(IEnvActor):
 
         if control.type == controls.Types.text:
             if not control.label:
-                text = control.elem.get_attribute('outerHTML')
+                text = control.get_outer_html()
                 # return Nothing()
 
-            text = control.elem.get_attribute('outerHTML')
+            text = control.get_outer_html()
             if (control.label and nlp.check_text_with_label([text.lower(), control.label.lower()], ['first-name', 'first_name', 'first name', 'firstname', 'f_name', 'f-name', 'fname'], ['last_name'])) or nlp.check_text(text.lower(), ['first-name', 'first_name', 'first name', 'firstname', 'f_name', 'f-name', 'fname'], ['last_name']):
                 return InputCheckoutFields("first_name")
             elif (control.label and nlp.check_text_with_label([text.lower(), control.label.lower()], ['last-name', 'last_name', 'last name', 'lastname', 'l_name', 'l-name', 'lname'], ['first_name'])) or nlp.check_text(text.lower(), ['last-name', 'last_name', 'last name', 'lastname', 'l_name', 'l-name', 'lname'], ['first_name']):
@@ -478,7 +477,7 @@ class FillingCheckoutPage(IEnvActor):
             else:
                 return Nothing()
         elif control.type in [controls.Types.link, controls.Types.button]:
-            text = control.elem.get_attribute('outerHTML')
+            text = control.get_outer_html()
             if (control.label and nlp.check_text(control.label.lower(), self.contains, self.not_contains)):
                 if 'giftcode' in text.lower():
                     return Nothing()
@@ -510,6 +509,8 @@ class FillingCheckoutPage(IEnvActor):
                 if 'place order' in control.label.lower():
                     return (States.fillPaymentPage, False)                
                 return (States.prePaymentFillingPage, False)
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             pass
         return (state, False)
@@ -541,7 +542,7 @@ class PrePaymentFillingPage(IEnvActor):
         if control.type not in self.type_list:
             return Nothing()
 
-        text = control.elem.get_attribute('outerHTML')
+        text = control.get_outer_html()
 
         if (nlp.check_text(text.lower(), self.card_text + self.contains, self.not_contains)) or \
             (control.label and nlp.check_text(control.label.lower(), self.card_text, self.not_contains)):
@@ -554,7 +555,7 @@ class PrePaymentFillingPage(IEnvActor):
         if not is_success:
             return (state, False)
         try:
-            text = control.elem.get_attribute('outerHTML')
+            text = control.get_outer_html(live = True)
 
             if nlp.check_text(text.lower(), self.contains, self.not_contains):
                 return (States.fillPaymentPage, False)
@@ -604,7 +605,7 @@ class FillingPaymentPage(IEnvActor):
         elif self.place_order_control and self.get_filling_status():
             return Click()
 
-        text = control.elem.get_attribute('outerHTML')
+        text = control.get_outer_html()
 
         if control.type == controls.Types.text:
 
@@ -715,9 +716,9 @@ class FillingPaymentPage(IEnvActor):
             return (state, False)
         try:
             if control.label and nlp.check_text(control.label.lower(), ['proceed to payment'], self.not_contains):
-                time.sleep(5)
+                wait_settled(environment.driver, 5)
             if control.type in [controls.Types.text, controls.Types.select, controls.Types.radiobutton]:
-                text = control.elem.get_attribute('outerHTML')
+                text = control.get_outer_html(live = True)
                 if (control.label and nlp.check_text(control.label.lower(), ['verification', 'cvc', 'cvv', 'cccvd'], ['card-number'])) or nlp.check_text(text.lower(), ['verification', 'cvc', 'cvv', 'cccvd'], ['card-number']):
                     if not environment.has_next_control():
                         environment.reset_control()
@@ -730,7 +731,7 @@ class FillingPaymentPage(IEnvActor):
                     if not self.has_card_details:
                         environment.refetch_controls()
             elif control.label and nlp.check_text(control.label.lower(), ['continue', 'order'], self.not_contains):
-                text = control.elem.get_attribute('outerHTML')
+                text = control.get_outer_html(live = True)
                 if 'credit card' in text.lower():
                     return (States.pay, False)
                 if not self.get_filling_status():
@@ -744,7 +745,7 @@ class FillingPaymentPage(IEnvActor):
             elif self.get_filling_status():
                 if environment.has_next_control():
                     next_ctrl = environment.get_next_control()
-                    next_text = next_ctrl.elem.get_attribute('outerHTML')
+                    next_text = next_ctrl.get_outer_html(live = True)
                     if nlp.check_text(next_text.lower(), ['post code', 'zip', 'postal', 'post-code', 'post_code', 'postal code'], ['card-number']):
                         environment.apply_action(next_ctrl, InputPaymentTextField('cvc'))
                         return (States.pay, False)
@@ -754,6 +755,8 @@ class FillingPaymentPage(IEnvActor):
             elif not self.get_filling_status():
                 if not self.has_card_details:
                     environment.refetch_controls()
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             pass
         return (state, False)
@@ -774,7 +777,7 @@ class Pay(IEnvActor):
 
         if control.type not in self.type_list:
             return Nothing()
-        text = control.elem.get_attribute('outerHTML')
+        text = control.get_outer_html()
 
         if nlp.check_text(text.lower(), self.contains, self.not_contains):
             return Click()
@@ -789,7 +792,7 @@ class Pay(IEnvActor):
         try:
             if control.label and nlp.check_text(control.label.lower(), self.contains, self.not_contains):
                 return (States.purchased, False)
-            text = control.elem.get_attribute('outerHTML')
+            text = control.get_outer_html(live = True)
 
             if nlp.check_text(text.lower(), self.contains, self.not_contains):
                 return (States.purchased, False)
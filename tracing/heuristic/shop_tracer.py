@@ -1,10 +1,15 @@
-import requests
+import time
 import selenium
 from abc import abstractmethod
 from tracing.common_heuristics import *
 from tracing.status import *
+from tracing.selenium_utils.navigation import navigate
 from tracing.rl.environment import Environment
 from tracing.rl.actions import Nothing
+from tracing.selenium_utils.controls import find_control
+from tracing.selenium_utils.profiler import set_profiler_context
+from tracing.selenium_utils.checkpoint import CheckpointHistory
+from tracing.deadline import Deadline, DeadlineExceeded, check_deadline
 
 
 class ITraceListener:
@@ -52,7 +57,7 @@ class States:
 
 
 class TraceContext:
-    def __init__(self, domain, delaying_time, tracer):
+    def __init__(self, domain, delaying_time, tracer, deadline = None):
         self.domain = domain
         self.tracer = tracer
         self.trace_logger = tracer._trace_logger
@@ -60,6 +65,7 @@ class TraceContext:
         self.state = None
         self.url = None
         self.delaying_time = delaying_time
+        self.deadline = deadline or Deadline()
         self.is_started = False
 
     @property
@@ -90,6 +96,10 @@ class TraceContext:
             return
         
         self.log_step(None, 'finished')
+
+        profiler = getattr(self.driver, 'profiler', None)
+        if profiler is not None:
+            self.trace.set_profile(profiler.summary())
         
         self.trace_logger.save(self.trace, status)
         self.trace = None
@@ -194,7 +204,8 @@ class ShopTracer:
                  environment,
                  chrome_path='/usr/bin/chromedriver',
                  # Must be an instance of ITraceSaver
-                 trace_logger = None
+                 trace_logger = None,
+                 replay_store = None
                  ):
         """
         :param environment    Environment that wraps selenium
@@ -202,6 +213,7 @@ class ShopTracer:
         :param chrome_path:   Path to chrome driver
         :param headless:      Wheather to start driver in headless mode
         :param trace_logger:  ITraceLogger instance that could store snapshots and source code during tracing
+        :param replay_store:  ReplayStore to record winning paths and replay them for the same domains
         """
         if environment is None:
             environment = Environment()
@@ -212,6 +224,11 @@ class ShopTracer:
         self._logger = logging.getLogger('shop_tracer')
         self._headless = environment.headless
         self._trace_logger = trace_logger
+        self._replay_store = replay_store
+        self._replay_steps = []
+
+        # Deepest checkpoint of the current trace and recorded path that led to it
+        self._checkpoints = CheckpointHistory()
 
         self.action_listeners = []
 
@@ -253,20 +270,12 @@ class ShopTracer:
     
     @staticmethod
     def get(driver, url, timeout=10):
-        try:
-            driver.get(url)
-            response = requests.get(url, verify=False, timeout=timeout)
-            code = response.status_code
-            if code >= 400:
-                return RequestError(code)
-            
-            return None
-        
-        except selenium.common.exceptions.TimeoutException:
-            return Timeout(timeout)
-            
-        except requests.exceptions.ConnectionError:
-            return NotAvailable(url)
+        """
+        Opens url, response status is taken from the browser (available as driver.navigation)
+        :return:  ITraceStatus if page can't be loaded or None
+        """
+        navigation = navigate(driver, url, timeout)
+        return get_navigation_status(navigation, timeout)
 
     def apply_actor(self, actor, state):
         if isinstance(actor, ISiteActor):
@@ -280,6 +289,7 @@ class ShopTracer:
 
             if new_state != state:
                 self.on_after_action(action, True, new_state = new_state)
+                self.record_step(state, actor, action, new_state)
                 return new_state
             else:
                 self.on_after_action(action, False, new_state = new_state)
@@ -288,6 +298,7 @@ class ShopTracer:
             assert isinstance(actor, IEnvActor), "Actor {} must be IEnvActor".format(actor)
 
             while self.environment.has_next_control():
+                check_deadline(self.environment.driver)
                 ctrl = self.environment.get_next_control()
                 self.on_before_action(ctrl, state = state, handler=actor)
                 action = actor.get_action(ctrl)
@@ -298,11 +309,19 @@ class ShopTracer:
                     self._logger.info(action)
                     self.environment.save_state()
 
+                # Selector has to be taken before action, page could be changed after it
+                selector = self.get_selector(ctrl)
+                frame_idx = self.environment.f_idx
+
                 is_success,_ = self.environment.apply_action(ctrl, action)
                 is_success = is_success and not isinstance(action, Nothing)
                 new_state, discard = actor.get_state_after_action(is_success, state, ctrl, self.environment)
                 self.on_after_action(action, is_success and not discard, new_state=new_state)
 
+                if is_success and not discard and selector:
+                    self.record_step(state, actor, action, new_state,
+                                     control_type = ctrl.type, selector = selector, frame = frame_idx)
+
                 if not isinstance(action, Nothing):
                     self._logger.info('is_success: {}, discard: {}'.format(is_success, discard))
 
@@ -314,6 +333,171 @@ class ShopTracer:
                     return new_state        
         return state
 
+    def get_selector(self, ctrl):
+        if not self._replay_store:
+            return None
+
+        try:
+            return ctrl.get_selector()
+        except:
+            self._logger.debug('Cannot get selector of control {}'.format(traceback.format_exc()))
+            return None
+
+    def record_step(self, state, actor, action, new_state, control_type = None, selector = None, frame = None):
+        self._replay_steps.append({
+            'state': state,
+            'handler': type(actor).__name__,
+            'action': type(action).__name__,
+            'control_type': control_type,
+            'selector': selector,
+            'frame': frame,
+            'url': get_url(self.environment.driver),
+            'new_state': new_state
+        })
+
+    def replay_control(self, actor, step, state):
+        """
+        Finds control by recorded selector and applies action the actor chooses for it.
+        Step is followed only if the actor chooses the recorded action and gets the recorded state
+        :return:  Tuple (reached state, is step followed), reached state is None if browser stays in state
+        """
+        env = self.environment
+        env.try_switch_to_default()
+        env.frames = env.get_frames()
+        env.f_idx = step['frame']
+        if env.f_idx >= len(env.frames) or not env.try_switch_to_frame():
+            return None, False
+
+        ctrl = find_control(env.driver, step['selector'], step['control_type'])
+        if ctrl is None:
+            return None, False
+
+        self.on_before_action(ctrl, state = state, handler = actor)
+        action = actor.get_action(ctrl)
+        if type(action).__name__ != step['action']:
+            return None, False
+
+        env.save_state()
+        is_success,_ = env.apply_action(ctrl, action)
+        new_state, discard = actor.get_state_after_action(is_success, state, ctrl, env)
+        self.on_after_action(action, is_success and not discard, new_state = new_state)
+
+        if discard:
+            env.discard()
+
+        if not is_success or discard or new_state == state:
+            return None, False
+
+        # Browser has already moved, so the reached state is recorded even if it differs from the recorded one
+        self.record_step(state, actor, action, new_state,
+                         control_type = ctrl.type, selector = step['selector'], frame = step['frame'])
+        return new_state, new_state == step['new_state']
+
+    def replay_site(self, actor, step, state):
+        """
+        :return:  Tuple (reached state, is step followed), browser is restored if step diverged
+        """
+        self.on_before_action(state = state, handler = actor)
+        action = actor.get_action(self.environment)
+        if type(action).__name__ != step['action']:
+            return None, False
+
+        self.environment.save_state()
+        is_success,_ = self.environment.apply_action(None, action)
+        new_state = actor.get_state_after_action(is_success, state, self.environment)
+        self.on_after_action(action, new_state != state, new_state = new_state)
+
+        if new_state != step['new_state']:
+            self.environment.discard()
+            return None, False
+
+        self.record_step(state, actor, action, new_state)
+        return new_state, True
+
+    def replay(self, domain, state, context):
+        """
+        Replays path recorded by previous traces of the domain until the first step that diverges
+        :return:  Reached state, heuristics continue from it
+        """
+        steps = self._replay_store.get_path(domain, 'heuristic_tracer') if self._replay_store else None
+        if not steps:
+            return state
+
+        self._logger.info('replaying {} steps for {}'.format(len(steps), domain))
+        handlers = {type(handler).__name__: handler for _, handler in self._handlers}
+
+        diverged = None
+        last_handler = None
+        for i, step in enumerate(steps):
+            actor = handlers.get(step['handler'])
+            if step['state'] != state or actor is None:
+                diverged = i
+                break
+
+            # Actors are reset for every state in process_state
+            if (state, actor) != last_handler:
+                actor.reset()
+                self.environment.reset_control()
+                set_profiler_context(self.environment.driver, state, type(actor).__name__)
+                last_handler = (state, actor)
+
+            try:
+                if isinstance(actor, ISiteActor):
+                    new_state, is_followed = self.replay_site(actor, step, state)
+                else:
+                    new_state, is_followed = self.replay_control(actor, step, state)
+            except DeadlineExceeded:
+                raise
+            except:
+                self._logger.debug('Unexpected exception during replay {}'.format(traceback.format_exc()))
+                new_state, is_followed = None, False
+
+            # Heuristics continue from the state browser has actually reached
+            if new_state is not None:
+                context.on_handler_finished(new_state, actor)
+                state = new_state
+
+            if not is_followed:
+                diverged = i
+                break
+
+        self.environment.reset_control()
+        self._replay_store.report_replay(domain, 'heuristic_tracer', diverged)
+        return state
+
+    def save_checkpoint(self, driver, state):
+        """
+        Saves browser state if state is deeper than the saved checkpoints
+        """
+        if state in [States.new, States.purchased]:
+            return
+
+        self._checkpoints.save(driver, state, States.states.index(state), self._replay_steps)
+
+    def resume(self, driver, state, context):
+        """
+        Restores the deepest checkpoint of previous attempts that hasn't led to a dead end
+        :return:  State of the checkpoint or the current state if there is nothing to restore
+        """
+        restored = self._checkpoints.restore(driver)
+        if restored is None:
+            return state
+
+        checkpoint, steps = restored
+        self._logger.info('resuming from state {}, url {}'.format(checkpoint.state, checkpoint.url))
+        self._replay_steps = steps
+        context.state = checkpoint.state
+        context.url = get_url(driver)
+
+        return checkpoint.state
+
+    def save_path(self, domain, status):
+        if not self._replay_store or not isinstance(status, ProcessingStatus):
+            return
+
+        self._replay_store.save_path(domain, 'heuristic_tracer', self._replay_steps,
+                                     status.state, States.states.index(status.state))
+
     def process_state(self, state, context):
         # Close popups if appeared
         close_alert_if_appeared(self.environment.driver)
@@ -327,6 +511,7 @@ class ShopTracer:
         for priority, handler in handlers:
             handler.reset()
             self.environment.reset_control()
+            set_profiler_context(self.environment.driver, state, type(handler).__name__)
             self._logger.info('handler {}'.format(handler))
             new_state = self.apply_actor(handler, state)
 
@@ -337,26 +522,40 @@ class ShopTracer:
                 return new_state
         return state
 
-    def trace(self, domain, wait_response_seconds = 60, attempts = 3, delaying_time = 10):
+    def trace(self, domain, wait_response_seconds = 60, attempts = 3, delaying_time = 10,
+              time_budget = None, state_budget = None):
         """
         Traces shop
 
         :param domain:                 Shop domain to trace
         :param wait_response_seconds:  Seconds to wait response from shop
-        :param attempts:               Number of attempts to navigate to checkout page
+        :param attempts:               Number of attempts to navigate to checkout page,
+                                       every attempt is resumed from the deepest state reached before,
+                                       or from a shallower one if resuming from it made no progress
+        :param time_budget:            Seconds for all attempts, None for unlimited
+        :param state_budget:           Seconds for processing of one state, None for unlimited
         :return:                       ICrawlingStatus
         """
 
         result = None
         best_state_idx = -1
         time_to_sleep = 2
+        self._checkpoints = CheckpointHistory()
+        deadline = Deadline(time_budget, state_budget)
 
         for _ in range(attempts):
+            if deadline.is_total_expired():
+                break
+
             self.on_tracing_started(domain)
-            attempt_result = self.do_trace(domain, wait_response_seconds, delaying_time)
+            attempt_result = self.do_trace(domain, wait_response_seconds, delaying_time, deadline)
             self.on_tracing_finished(attempt_result)
 
-            if isinstance(attempt_result, ProcessingStatus):
+            # Attempt that resumed from a checkpoint and got no deeper won't resume from it again
+            has_state = isinstance(attempt_result, (ProcessingStatus, Timeout)) and attempt_result.state is not None
+            self._checkpoints.finish_attempt(States.states.index(attempt_result.state) if has_state else -1)
+
+            if has_state:
                 idx = States.states.index(attempt_result.state)
                 if idx > best_state_idx:
                     best_state_idx = idx
@@ -368,20 +567,33 @@ class ShopTracer:
 
             if not result:
                 result = attempt_result
-            time.sleep(time_to_sleep)
-            time_to_sleep = 2 * time_to_sleep
+
+            # Backoff is needed only if the next attempt starts from the beginning
+            if self._checkpoints.is_empty():
+                time.sleep(deadline.cap(time_to_sleep))
+                time_to_sleep = 2 * time_to_sleep
         return result
 
-    def do_trace(self, domain, wait_response_seconds = 60, delaying_time = 10):
+    def do_trace(self, domain, wait_response_seconds = 60, delaying_time = 10, deadline = None):
         state = States.new
 
-        context = TraceContext(domain, delaying_time, self)
+        context = TraceContext(domain, delaying_time, self, deadline)
+        self._replay_steps = []
 
         try:
             status = None
 
-            if not self.environment.start(domain):
-                return NotAvailable('Domain {} is not available'.format(domain))
+            # Environment explores error pages, but tracer reports them like ShopTracer.get does
+            is_started = self.environment.start(domain)
+            navigation = self.environment.navigation
+            status = get_navigation_status(navigation, wait_response_seconds) if navigation else None
+            if status or not is_started:
+                return status or NotAvailable('Domain {} is not available'.format(domain))
+
+            # Waits and actors check the deadline through the driver
+            driver = self.environment.driver
+            driver.deadline = context.deadline
+            context.deadline.start_state(state)
 
             context.on_started()   
             assert context.is_started
@@ -389,13 +601,26 @@ class ShopTracer:
             if is_domain_for_sale(self.environment.driver, domain):
                 return NotAvailable('Domain {} for sale'.format(domain))
 
+            # Next attempts continue from the deepest state reached before
+            state = self.resume(driver, state, context)
+            if state == States.new:
+                state = self.replay(domain, state, context)
+
+            self.save_checkpoint(driver, state)
+
             while state != States.purchased:
+                context.deadline.start_state(state)
                 new_state = self.process_state(state, context)
 
                 if state == new_state:
                     break
 
                 state = new_state
+                self.save_checkpoint(driver, state)
+
+        except DeadlineExceeded as e:
+            self._logger.warning('{} during processing {}'.format(e, domain))
+            status = get_deadline_status(context.deadline, e, state)
                 
         except:
             self._logger.exception("Unexpected exception during processing {}".format(domain))
@@ -409,4 +634,6 @@ class ShopTracer:
             if context.is_started:
                 context.on_finished(status)
 
+            self.save_path(domain, status)
+
         return status
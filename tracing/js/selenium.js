@@ -139,3 +139,521 @@ window.__tra_gatherClickElements = function(curnode, gathered) {
     
     return gathered;
 }
+
+
+window.__tra_isLink = function(elem) {
+    var href = elem.href;
+    if (!href || typeof href !== 'string')
+        return false;
+
+    if (href.indexOf('#') >= 0)
+        href = href.substring(0, href.indexOf('#'));
+
+    return href.length > 0 && href.indexOf('javascript:') !== 0 && href !== window.location.href;
+}
+
+window.__tra_getRect = function(elem) {
+    var rect = elem.getBoundingClientRect(),
+        x = rect.left + window.pageXOffset,
+        y = rect.top + window.pageYOffset,
+        width = rect.width,
+        height = rect.height;
+
+    // Links and spans could have zero size while their only child is visible (the same as get_size, get_location)
+    var tag = elem.tagName.toLowerCase();
+    if ((tag === 'a' || tag === 'span') && elem.children.length === 1) {
+        var child = elem.children[0].getBoundingClientRect();
+        width = Math.max(width, child.width);
+        height = Math.max(height, child.height);
+        if (child.width > 0 && child.height > 0) {
+            x = Math.min(x, child.left + window.pageXOffset);
+            y = Math.min(y, child.top + window.pageYOffset);
+        }
+    }
+
+    return {x: x, y: y, width: width, height: height};
+}
+
+window.__tra_isVisibleAt = function(elem, rect) {
+    if (!elem.isConnected)
+        return false;
+
+    if (rect.width <= 1 || rect.height <= 1)
+        return false;
+
+    if (rect.x + rect.width <= 0 || rect.y + rect.height <= 0)
+        return false;
+
+    var cx = rect.x + Math.floor(rect.width / 2),
+        cy = rect.y + Math.floor(rect.height / 2);
+
+    // elementFromPoint works only inside the viewport, scroll the same way as scroll_to_element does
+    if (cy < window.pageYOffset || cy >= window.pageYOffset + window.innerHeight) {
+        window.scrollTo(window.pageXOffset, Math.max(0, rect.y - 300));
+    }
+
+    var found = document.elementFromPoint(cx - window.pageXOffset, cy - window.pageYOffset);
+    return found !== null && elem.contains(found);
+}
+
+window.__tra_getControlLabel = function(elem) {
+    var value = elem.value || elem.getAttribute('placeholder') || '';
+    var label = '', labelElem = null;
+
+    var ids = [elem.getAttribute('id'), elem.getAttribute('name')];
+    for (var i = 0; i < ids.length && !labelElem; i++) {
+        if (!ids[i])
+            continue;
+
+        var selector = 'label[for="' + ids[i].replace(/"/g, '\\"') + '"], lable[for="' + ids[i].replace(/"/g, '\\"') + '"]';
+        try {
+            labelElem = document.querySelector(selector);
+        }
+        catch (e) {
+            labelElem = null;
+        }
+
+        if (labelElem)
+            label = labelElem.innerText || '';
+    }
+
+    var parent = elem.parentElement;
+    if (!labelElem && parent) {
+        if (parent.tagName === 'LABEL' || parent.querySelectorAll('*').length === 1) {
+            labelElem = parent;
+            label = parent.innerText || '';
+        }
+    }
+
+    if (label && value)
+        label = value + '\n' + label;
+    else if (value)
+        label = value;
+
+    return {label: label, elem: labelElem};
+}
+
+window.__tra_unionRect = function(rect, elem) {
+    var other = __tra_getRect(elem);
+    if (other.width <= 0 || other.height <= 0)
+        return rect;
+
+    var x = Math.min(rect.x, other.x),
+        y = Math.min(rect.y, other.y),
+        right = Math.max(rect.x + rect.width, other.x + other.width),
+        bottom = Math.max(rect.y + rect.height, other.y + other.height);
+
+    return {x: x, y: y, width: right - x, height: bottom - y};
+}
+
+window.__tra_gatherControlCandidates = function() {
+    var q = function(selector) {
+        return Array.prototype.slice.call(document.querySelectorAll(selector));
+    };
+
+    var anchors = q('a, area');
+    return [
+        ['select', q('select')],
+        ['text', q('input[type="text"], input[type="search"], textarea, input[type="num"], input[type="number"], ' +
+                   'input[type="tel"], input[type="email"], input[type="url"]')],
+        ['button', anchors.filter(function(e) {return !__tra_isLink(e);})
+                      .concat(q('button, input[type="button"], input[type="submit"], input[type="image"]'))],
+        ['link', q('a[href], area').filter(__tra_isLink)],
+        ['checkbox', q('input[type="checkbox"]')],
+        ['radiobutton', q('input[type="radio"]')],
+        ['clickable', __tra_gatherClickElements()]
+    ];
+}
+
+// Unique id of the current document, is used to check that saved references are still valid
+window.__tra_pageId = window.__tra_pageId || Math.random().toString(36).substring(2) + Date.now().toString(36);
+
+// Extracted elements by their ids, element keeps the same id in all extractions of the document
+window.__tra_controls = window.__tra_controls || new Map();
+window.__tra_elementIds = window.__tra_elementIds || new WeakMap();
+window.__tra_nextElementId = window.__tra_nextElementId || 0;
+
+window.__tra_registerControl = function(elem) {
+    var id = window.__tra_elementIds.get(elem);
+    if (id === undefined) {
+        id = window.__tra_nextElementId++;
+        window.__tra_elementIds.set(elem, id);
+    }
+
+    window.__tra_controls.set(id, elem);
+    return id;
+}
+
+// Describes control in the format of __tra_extractControls items (without index)
+window.__tra_describeControl = function(elem, type, rect) {
+    var ctrl = {
+        type: type === 'clickable' ? 'button' : type,
+        label: null,
+        values: null,
+        code: null,
+        tooltip: null
+    };
+
+    if (type === 'button' || type === 'clickable') {
+        ctrl.label = elem.innerText || elem.value || null;
+        ctrl.tooltip = elem.getAttribute('tooltip') || elem.getAttribute('titile');
+    }
+    else if (type === 'link') {
+        ctrl.label = elem.innerText || null;
+        ctrl.tooltip = elem.getAttribute('tooltip') || elem.getAttribute('titile');
+        ctrl.code = elem.href;
+    }
+    else {
+        var label = __tra_getControlLabel(elem);
+        ctrl.label = label.label;
+        if (label.elem && label.elem !== elem && label.elem.getClientRects().length > 0)
+            rect = __tra_unionRect(rect, label.elem);
+
+        if (type === 'select') {
+            ctrl.values = Array.prototype.map.call(elem.options, function(o) {return o.textContent;});
+        }
+    }
+
+    ctrl.rect = rect;
+    ctrl.html = elem.outerHTML;
+    return ctrl;
+}
+
+// Extracts all visible controls of the current document in one call.
+// Elements are kept in window.__tra_controls and could be fetched by index later.
+window.__tra_extractControls = function() {
+    var scrollX = window.pageXOffset,
+        scrollY = window.pageYOffset;
+
+    // Removed elements are forgotten, so registry doesn't grow on long-lived pages
+    window.__tra_controls.forEach(function(elem, id) {
+        if (!elem.isConnected)
+            window.__tra_controls.delete(id);
+    });
+
+    var seen = new Set(),
+        result = [];
+
+    var groups = __tra_gatherControlCandidates();
+    for (var g = 0; g < groups.length; g++) {
+        var type = groups[g][0],
+            elems = groups[g][1];
+
+        for (var i = 0; i < elems.length; i++) {
+            var elem = elems[i];
+            if (seen.has(elem))
+                continue;
+
+            seen.add(elem);
+
+            var rect = __tra_getRect(elem);
+            if (!__tra_isVisibleAt(elem, rect))
+                continue;
+
+            var ctrl = __tra_describeControl(elem, type, rect);
+            ctrl.index = __tra_registerControl(elem);
+            result.push(ctrl);
+        }
+    }
+
+    window.scrollTo(scrollX, scrollY);
+    return {pageId: window.__tra_pageId, controls: result};
+}
+
+window.__tra_getControl = function(index, pageId) {
+    if (pageId !== window.__tra_pageId)
+        return null;
+
+    var elem = window.__tra_controls.get(index);
+    return elem && elem.isConnected ? elem : null;
+}
+
+// Current rect of extracted control, is computed the same way as in __tra_describeControl
+window.__tra_getControlRect = function(index, pageId, type) {
+    var elem = __tra_getControl(index, pageId);
+    if (!elem)
+        return null;
+
+    var rect = __tra_getRect(elem);
+    if (type !== 'button' && type !== 'link') {
+        var label = __tra_getControlLabel(elem);
+        if (label.elem && label.elem !== elem && label.elem.getClientRects().length > 0)
+            rect = __tra_unionRect(rect, label.elem);
+    }
+
+    return rect;
+}
+
+window.__tra_isControlVisible = function(index, pageId) {
+    var elem = __tra_getControl(index, pageId);
+    if (!elem)
+        return false;
+
+    return __tra_isVisibleAt(elem, __tra_getRect(elem));
+}
+
+
+// Builds css selector of the element that doesn't depend on extraction order.
+// Path is started from the nearest ancestor with unique id
+window.__tra_getSelector = function(elem) {
+    var path = [];
+    while (elem && elem.nodeType === Node.ELEMENT_NODE && elem !== document.documentElement) {
+        if (elem.id && !/\d{4,}/.test(elem.id)) {
+            var byId = '#' + CSS.escape(elem.id);
+            if (document.querySelectorAll(byId).length === 1) {
+                path.unshift(byId);
+                break;
+            }
+        }
+
+        var tag = elem.tagName.toLowerCase(),
+            idx = 1;
+
+        for (var sib = elem.previousElementSibling; sib; sib = sib.previousElementSibling) {
+            if (sib.tagName === elem.tagName)
+                idx += 1;
+        }
+
+        path.unshift(tag + ':nth-of-type(' + idx + ')');
+        elem = elem.parentElement;
+    }
+
+    return path.join(' > ');
+}
+
+window.__tra_getControlSelector = function(index, pageId) {
+    var elem = __tra_getControl(index, pageId);
+    return elem ? __tra_getSelector(elem) : null;
+}
+
+// Finds visible control by selector and registers it like __tra_extractControls does
+window.__tra_findControl = function(selector, type) {
+    var elem = null;
+    try {
+        elem = document.querySelector(selector);
+    }
+    catch (e) {
+        return null;
+    }
+
+    if (!elem)
+        return null;
+
+    var rect = __tra_getRect(elem);
+    if (!__tra_isVisibleAt(elem, rect))
+        return null;
+
+    var ctrl = __tra_describeControl(elem, type, rect);
+    ctrl.index = __tra_registerControl(elem);
+
+    return {pageId: window.__tra_pageId, controls: [ctrl]};
+}
+
+
+// Counter of DOM mutations, page snapshots are valid until it's changed
+window.__tra_domEpoch = window.__tra_domEpoch || 0;
+
+if (!window.__tra_domObserver && typeof MutationObserver === 'function') {
+    window.__tra_domObserver = new MutationObserver(function() {
+        window.__tra_domEpoch += 1;
+        window.__tra_lastActivity = Date.now();
+    });
+
+    window.__tra_domObserver.observe(document, {
+        childList: true,
+        subtree: true,
+        characterData: true,
+        attributes: true,
+        attributeFilter: ['class', 'style', 'hidden', 'disabled', 'href', 'type', 'value']
+    });
+}
+
+// Approximation of WebElement.is_enabled() and is_displayed()
+window.__tra_isDisplayed = function(elem) {
+    if (elem.disabled)
+        return false;
+
+    if (elem.tagName === 'INPUT' && elem.type === 'hidden')
+        return false;
+
+    if (!elem.getClientRects().length)
+        return false;
+
+    var style = getComputedStyle(elem);
+    return style.visibility !== 'hidden' && style.visibility !== 'collapse' && style.opacity !== '0';
+}
+
+window.__tra_querySelectors = function(selectors) {
+    var result = [];
+    selectors.forEach(function(selector) {
+        document.querySelectorAll(selector).forEach(function(elem) {
+            result.push(elem);
+        });
+    });
+
+    return result;
+}
+
+window.__tra_snapshotSections = {
+    links: function() {
+        return __tra_querySelectors(['a[href]', 'area'])
+            .filter(__tra_isLink)
+            .map(function(elem) {
+                return {
+                    elem: elem,
+                    html: elem.outerHTML,
+                    href: elem.href,
+                    displayed: __tra_isDisplayed(elem)
+                };
+            });
+    },
+
+    buttons: function() {
+        var links = __tra_querySelectors(['a', 'area']).filter(function(elem) {
+            return !__tra_isLink(elem);
+        });
+        var others = __tra_querySelectors(['button', 'input[type="button"]', 'input[type="submit"]', 'input[type="image"]']);
+
+        return links.concat(others).map(function(elem) {
+            return {
+                elem: elem,
+                inner: elem.innerHTML.trim(),
+                text: elem.innerText || '',
+                value: elem.getAttribute('value') || '',
+                href: elem.href || null,
+                displayed: __tra_isDisplayed(elem)
+            };
+        });
+    },
+
+    checks: function() {
+        return __tra_querySelectors(["input[type='radio']", "input[type='checkbox']"]).map(function(elem) {
+            var label = null;
+            if (elem.id) {
+                var found = document.querySelector('label[for="' + CSS.escape(elem.id) + '"]');
+                label = found ? found.innerHTML.trim() : null;
+            }
+
+            return {
+                elem: elem,
+                html: elem.outerHTML,
+                hasId: !!elem.id,
+                label: label
+            };
+        });
+    },
+
+    errors: function() {
+        return __tra_querySelectors(['div', 'span', 'label', 'p', 'ul'])
+            .filter(function(elem) {
+                return elem.className && __tra_isDisplayed(elem);
+            })
+            .map(function(elem) {
+                var inner = elem.innerHTML.trim();
+                return {
+                    elem: elem,
+                    cls: elem.getAttribute('class') || '',
+                    hasContent: inner.length > 0 && inner.toLowerCase().indexOf('error hide') < 0
+                };
+            });
+    },
+
+    texts: function() {
+        return __tra_querySelectors(['label', 'h', 'h1', 'h2', 'h3', 'h4', 'h5', 'span', 'p', 'td', 'li'])
+            .map(function(elem) {
+                return {elem: elem, html: elem.outerHTML};
+            });
+    }
+}
+
+// Returns items of snapshot section or only page id and epoch if cached items are still valid
+// known is a map pageId -> epoch of already cached snapshots
+window.__tra_snapshot = function(section, known) {
+    var pageId = window.__tra_pageId,
+        epoch = window.__tra_domEpoch;
+
+    if (known && known[pageId] === epoch)
+        return {pageId: pageId, epoch: epoch, items: null};
+
+    return {pageId: pageId, epoch: epoch, items: __tra_snapshotSections[section]()};
+}
+
+
+// Tracks network requests started by page scripts to detect when page is settled
+window.__tra_pendingRequests = window.__tra_pendingRequests || 0;
+window.__tra_lastActivity = window.__tra_lastActivity || Date.now();
+
+window.__tra_onRequestStarted = function() {
+    window.__tra_pendingRequests += 1;
+    window.__tra_lastActivity = Date.now();
+}
+
+window.__tra_onRequestFinished = function() {
+    window.__tra_pendingRequests = Math.max(0, window.__tra_pendingRequests - 1);
+    window.__tra_lastActivity = Date.now();
+}
+
+if (!window.__tra_requestsTracked) {
+    window.__tra_requestsTracked = true;
+
+    var originalSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function() {
+        __tra_onRequestStarted();
+        this.addEventListener('loadend', __tra_onRequestFinished);
+        return originalSend.apply(this, arguments);
+    };
+
+    if (typeof window.fetch === 'function') {
+        var originalFetch = window.fetch;
+        window.fetch = function() {
+            __tra_onRequestStarted();
+            return originalFetch.apply(this, arguments).then(function(response) {
+                __tra_onRequestFinished();
+                return response;
+            }, function(error) {
+                __tra_onRequestFinished();
+                throw error;
+            });
+        };
+    }
+
+    if (typeof PerformanceObserver === 'function') {
+        // Images, scripts and styles loaded by the page also mean that page isn't settled yet
+        try {
+            new PerformanceObserver(function() {
+                window.__tra_lastActivity = Date.now();
+            }).observe({entryTypes: ['resource']});
+        } catch (e) {}
+    }
+}
+
+// Checks that document is loaded and neither DOM nor network was active for quietMs.
+// Requests tracked in page are counted only if countRequests, otherwise they are tracked by performance log
+window.__tra_isSettled = function(quietMs, countRequests) {
+    return document.readyState === 'complete' &&
+        (!countRequests || window.__tra_pendingRequests === 0) &&
+        Date.now() - window.__tra_lastActivity >= quietMs;
+}
+
+// Resolves to true when document is loaded, there are no pending requests
+// and neither DOM nor network was active for quietMs. Resolves to false after timeoutMs
+window.__tra_waitSettled = function(quietMs, timeoutMs) {
+    var started = Date.now();
+
+    return new Promise(function(resolve) {
+        function check() {
+            var now = Date.now();
+            if (__tra_isSettled(quietMs, true)) {
+                resolve(true);
+            }
+            else if (now - started >= timeoutMs) {
+                resolve(false);
+            }
+            else {
+                setTimeout(check, 50);
+            }
+        }
+
+        check();
+    });
+}
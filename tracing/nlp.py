@@ -1,4 +1,5 @@
 import re
+from functools import lru_cache
 
 def normalize_text(text):
     # ToDo Proper normalization
@@ -10,68 +11,100 @@ def normalize_text(text):
 def tokenize(text):
     return re.split(r'(\d+|\W+)', text)
 
-def check_text(text, contains, not_contains=None, normalize=True):
-    if not contains:
-        contains = []
+class PatternSet:
+    """
+    List of regular expressions compiled once into a single alternation
+    """
+
+    # Back references and global inline flags can't be combined into one alternation
+    _not_combinable = re.compile(r'\\[1-9]|\(\?P=|\(\?[aiLmsux]+\)')
+
+    def __init__(self, patterns):
+        self.patterns = tuple(patterns)
+        self._regexes = []
+
+        if any(PatternSet._not_combinable.search(p) for p in self.patterns):
+            self._regexes = [re.compile(p) for p in self.patterns]
+        elif self.patterns:
+            try:
+                self._regexes = [re.compile('|'.join('(?:{})'.format(p) for p in self.patterns))]
+            except re.error:
+                # For instance the same group name is used in several patterns
+                self._regexes = [re.compile(p) for p in self.patterns]
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def search(self, text):
+        """
+        Checks if any pattern is found in text
+        """
+        for regex in self._regexes:
+            if regex.search(text):
+                return True
+
+        return False
+
+
+@lru_cache(maxsize=1024)
+def get_pattern_set(patterns):
+    """
+    Returns compiled PatternSet
+    :param patterns:  Tuple of regular expressions
+    :return:          PatternSet
+    """
+    return PatternSet(patterns)
+
+
+def to_pattern_set(patterns):
+    if isinstance(patterns, PatternSet):
+        return patterns
+
+    return get_pattern_set(tuple(patterns or ()))
 
-    if not not_contains:
-        not_contains = []
+
+def check_text(text, contains, not_contains=None, normalize=True):
+    contains = to_pattern_set(contains)
+    not_contains = to_pattern_set(not_contains)
 
     if normalize:
         text = normalize_text(text)
 
-    has_searched = False
-    for str in contains:
-        if re.search(str, text):
-            has_searched = True
-            break
-
-    if not has_searched and len(contains) > 0:
+    if len(contains) > 0 and not contains.search(text):
         return False
 
-    has_forbidden = False
-    for str in not_contains:
-        if re.search(str, text):
-            has_forbidden = True
-            break
+    return not not_contains.search(text)
+
 
-    return not has_forbidden
+def check_texts(texts, contains, not_contains=None, normalize=True):
+    """
+    Classifies list of texts with the same patterns
+    :param texts:         List of texts
+    :param contains:      Patterns where at least one should be found
+    :param not_contains:  Patterns that shouldn't be found
+    :param normalize:     Should be texts normalized before matching
+    :return:              List of bools, True for texts that pass check_text
+    """
+    contains = to_pattern_set(contains)
+    not_contains = to_pattern_set(not_contains)
+
+    return [check_text(text, contains, not_contains, normalize) for text in texts]
 
 
 def check_text_with_label(value, contains, not_contains=None, normalize=True):
     text = value[0]
     label = value[1]
 
-    if not contains:
-        contains = []
-
-    if not not_contains:
-        not_contains = []
+    contains = to_pattern_set(contains)
+    not_contains = to_pattern_set(not_contains)
 
     if normalize:
         text = normalize_text(text)
 
-    has_searched = False
-    for str in contains:
-        print (text, label)
-        print (re.search(str, text), re.search(str, label), "............", str)
-        if re.search(str, text):
-            has_searched = True
-            break
-        elif re.search(str, label):
-            has_searched = True
-            break
-
-    if not has_searched and len(contains) > 0:
+    if len(contains) > 0 and not contains.search(text) and not contains.search(label):
         return False
 
-    has_forbidden = False
-    for str in not_contains:
-        if re.search(str, text):
-            has_forbidden = True
-            break
-
-    return not has_forbidden
+    return not not_contains.search(text)
 
 
 def remove_letters(text, contains):
@@ -0,0 +1,193 @@
+import json
+import time
+import logging
+import sqlite3
+import threading
+
+from tracing.utils.domains import normalize_domain
+
+
+def trim_path(steps):
+    """
+    Removes steps after the last state transition, they didn't lead anywhere
+    :param steps:  List of step dicts with state and new_state
+    :return:       Trimmed list of steps
+    """
+    last = -1
+    for i, step in enumerate(steps):
+        if step['new_state'] != step['state']:
+            last = i
+
+    return steps[:last + 1]
+
+
+class ReplayStore:
+    """
+    Local SQLite index of the winning action sequences per domain.
+    Paths are recorded by tracers and replayed on the next traces of the same domain
+    """
+
+    def __init__(self,
+                 path = 'replay.sqlite',
+                 max_age_days = 30,
+                 max_failures = 3,
+                 max_domains = 100000,
+                 evict_every = 100
+                ):
+        """
+        :param path:          SQLite database file
+        :param max_age_days:  Paths that were recorded earlier are stale and are not replayed
+        :param max_failures:  Path is removed after this number of diverged replays in a row
+        :param max_domains:   Maximum number of stored paths, least recently used are evicted
+        :param evict_every:   Eviction runs after this number of saved paths
+        """
+        self.path = path
+        self.max_age = max_age_days * 24 * 3600
+        self.max_failures = max_failures
+        self.max_domains = max_domains
+        self.evict_every = evict_every
+
+        self._saves = 0
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger('shop_tracer')
+
+        self._connection = sqlite3.connect(path, timeout = 30, check_same_thread = False)
+        with self._connection:
+            self._connection.execute('''
+                CREATE TABLE IF NOT EXISTS paths (
+                    domain TEXT NOT NULL,
+                    tracer TEXT NOT NULL,
+                    steps TEXT NOT NULL,
+                    final_state TEXT,
+                    score INTEGER NOT NULL,
+                    updated REAL NOT NULL,
+                    used REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    failures INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (domain, tracer)
+                )''')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS paths_used ON paths (used)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    @staticmethod
+    def from_config(config, **kwargs):
+        """
+        Creates ReplayStore from section [replay] of config
+        :param config:  ConfigParser
+        :param kwargs:  Parameters that override config values
+        :return:        ReplayStore or None if replay is disabled
+        """
+        if not config.getboolean('replay', 'enabled', fallback=False):
+            return None
+
+        params = dict(
+            path = config.get('replay', 'path', fallback='replay.sqlite'),
+            max_age_days = config.getint('replay', 'max_age_days', fallback=30),
+            max_failures = config.getint('replay', 'max_failures', fallback=3),
+            max_domains = config.getint('replay', 'max_domains', fallback=100000)
+        )
+        params.update(kwargs)
+
+        return ReplayStore(**params)
+
+    def get_path(self, domain, tracer):
+        """
+        Returns recorded path for domain if it's not stale
+        :param domain:  Shop domain
+        :param tracer:  Name of the tracer that recorded path, states are different for tracers
+        :return:        List of step dicts or None
+        """
+        domain = normalize_domain(domain)
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT steps, updated FROM paths WHERE domain = ? AND tracer = ?', (domain, tracer)).fetchone()
+
+            if row is None:
+                return None
+
+            steps, updated = row
+            if time.time() - updated > self.max_age:
+                with self._connection:
+                    self._connection.execute('DELETE FROM paths WHERE domain = ? AND tracer = ?', (domain, tracer))
+                return None
+
+        return json.loads(steps)
+
+    def save_path(self, domain, tracer, steps, final_state, score):
+        """
+        Saves path if it's not worse than the stored one
+        :param domain:       Shop domain
+        :param tracer:       Name of the tracer
+        :param steps:        List of step dicts, steps after the last transition are removed
+        :param final_state:  State that was reached by the path
+        :param score:        Depth of final state, deeper paths replace shallower ones
+        :return:             True if path was saved
+        """
+        steps = trim_path(steps)
+        if not steps:
+            return False
+
+        domain = normalize_domain(domain)
+        now = time.time()
+        with self._lock:
+            with self._connection:
+                row = self._connection.execute(
+                    'SELECT score, updated FROM paths WHERE domain = ? AND tracer = ?', (domain, tracer)).fetchone()
+
+                if row is not None and row[0] > score and now - row[1] <= self.max_age:
+                    return False
+
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO paths (domain, tracer, steps, final_state, score, updated, used) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (domain, tracer, json.dumps(steps), final_state, score, now, now))
+
+            self._saves += 1
+            need_evict = self._saves % self.evict_every == 0
+
+        if need_evict:
+            self.evict()
+
+        return True
+
+    def report_replay(self, domain, tracer, diverged_step = None):
+        """
+        Updates replay statistics, path is removed if it diverges too often
+        :param domain:         Shop domain
+        :param tracer:         Name of the tracer
+        :param diverged_step:  Index of the first step that diverged or None if whole path was replayed
+        """
+        domain = normalize_domain(domain)
+        with self._lock, self._connection:
+            if diverged_step is None:
+                self._connection.execute(
+                    'UPDATE paths SET hits = hits + 1, failures = 0, used = ? WHERE domain = ? AND tracer = ?',
+                    (time.time(), domain, tracer))
+                return
+
+            self._logger.info('replay of {} diverged at step {}'.format(domain, diverged_step))
+            self._connection.execute(
+                'UPDATE paths SET failures = failures + 1, used = ? WHERE domain = ? AND tracer = ?',
+                (time.time(), domain, tracer))
+            self._connection.execute(
+                'DELETE FROM paths WHERE domain = ? AND tracer = ? AND failures >= ?',
+                (domain, tracer, self.max_failures))
+
+    def evict(self):
+        """
+        Removes stale paths and least recently used paths above max_domains
+        """
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM paths WHERE updated < ?', (time.time() - self.max_age,))
+            self._connection.execute(
+                'DELETE FROM paths WHERE rowid IN '
+                '(SELECT rowid FROM paths ORDER BY used DESC LIMIT -1 OFFSET ?)', (self.max_domains,))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -1,12 +1,17 @@
 import tensorflow as tf
 import tensorflow.contrib.slim as slim
-import tensorflow.contrib.slim.nets as nets
-import nets.nasnet.pnasnet
-import nets.inception_resnet_v2
-from nets.inception_resnet_v2 import inception_resnet_v2_arg_scope
 import random
 import numpy as np
 
+from tracing.training.backbones import get_backbone
+
+
+def get_layer_scope(output):
+    """
+    Variable scope of slim layer by it's output, is used to share layer variables with another tower
+    """
+    return output.op.name.rsplit('/', 1)[0]
+
 
 class A3CModel:
 
@@ -15,8 +20,15 @@ class A3CModel:
                  train_deep = True,
                  rnn_size = 100,
                  is_for_train = True,
-                 fixed_gate_probas = {}
+                 fixed_gate_probas = {},
+                 from_features = False,
+                 backbone = 'inception_resnet_v2'
                  ):
+        """
+        :param from_features:  Frozen backbone mode, model takes pooled backbone features
+                               (computed by BackboneFeatures) instead of images and trains only heads
+        :param backbone:       Backbone name from tracing.training.backbones registry
+        """
         
         self.num_actions = num_actions
         self.session = session
@@ -28,17 +40,19 @@ class A3CModel:
         self.rnn_size = rnn_size
         self.is_for_train = is_for_train
         self.fixed_gate_probas = fixed_gate_probas
+        self.from_features = from_features
+        self.backbone = get_backbone(backbone)
+
+        # Layer name -> variable scope, layers are shared by the inference tower
+        self.layer_scopes = {}
 
         self.build()
         
     
     def init_from_checkpoint(self, checkpoint):
+        assert not self.from_features, "Model with from_features doesn't have backbone"
         
-        inception_vars = tf.get_collection(
-            tf.GraphKeys.GLOBAL_VARIABLES, 
-            scope = 'InceptionResnetV2')
-
-        saver = tf.train.Saver(var_list = inception_vars)
+        saver = tf.train.Saver(var_list = self.backbone.get_variables())
         saver.restore(self.session, checkpoint)
         
     
@@ -62,6 +76,7 @@ class A3CModel:
         self.build_cnn()
         self.build_lstm()
         self.build_a3c()
+        self.build_inference()
         self.add_loss()
         self.add_train_op()
     
@@ -70,8 +85,12 @@ class A3CModel:
         with tf.variable_scope('inputs') as sc:
             self.move_rnn = tf.placeholder_with_default(True, (), "move_rnn")
             
-            # Batch x 300 x 300
-            self.img = tf.placeholder(tf.float32, (None, 300, 300, 3), "img")
+            if self.from_features:
+                # Batch x Features
+                self.img = tf.placeholder(tf.float32, (None, self.backbone.feature_size), "features")
+            else:
+                # Batch x 300 x 300
+                self.img = tf.placeholder(tf.float32, (None, 300, 300, 3), "img")
             self.dropout = tf.placeholder(tf.float32, (), "dropout")
             
             # Learning Rate
@@ -106,7 +125,9 @@ class A3CModel:
         actions_repr = tf.one_hot(self.prev_actions, self.num_actions - 1)
         actions_repr = tf.cast(actions_repr, dtype=tf.float32)
         img_repr = slim.fully_connected(self.net, 100)
+        self.layer_scopes['img_repr'] = get_layer_scope(img_repr)
         
+        # Batch x Channels
         rnn_input = tf.concat([actions_repr, img_repr], -1)
         rnn_input = tf.expand_dims(rnn_input, 0)
         
@@ -123,20 +144,24 @@ class A3CModel:
                          lambda:self.lstm_init_state.h)
         
         output = tf.reshape(output, (-1, self.rnn_size))
-        self.rnn_out = slim.flatten(slim.fully_connected(output, 100))
+        rnn_fc = slim.fully_connected(output, 100)
+        self.layer_scopes['rnn_fc'] = get_layer_scope(rnn_fc)
+        self.rnn_out = slim.flatten(rnn_fc)
     
     
     def build_cnn(self):
-        with slim.arg_scope(inception_resnet_v2_arg_scope()):
-            self.net, endpoints = nets.inception_resnet_v2.inception_resnet_v2(
-                   self.img, None, dropout_keep_prob = 1.0, is_training = self.is_for_train)
-            # Batch x Channels
-            self.net = slim.flatten(self.net)
+        with slim.arg_scope(self.backbone.arg_scope()):
+            if self.from_features:
+                self.net = self.img
+            else:
+                # Batch x Channels
+                self.net = self.backbone.build(self.img, self.is_for_train)
                 
             if not self.train_deep:
                 self.net = tf.stop_gradient(self.net)
 
             self.text_pretrain = slim.fully_connected(self.net, 512, activation_fn=None)
+            self.layer_scopes['text_pretrain'] = get_layer_scope(self.text_pretrain)
 
 
     def build_a3c(self):
@@ -156,6 +181,8 @@ class A3CModel:
                 self.fc1 = slim.fully_connected(self.full_net, 200)
                 self.fc2 = slim.fully_connected(self.full_net, 200)
                 self.fc3 = slim.fully_connected(self.full_net, 200)
+                self.layer_scopes['fc1'] = get_layer_scope(self.fc1)
+                self.layer_scopes['fc2'] = get_layer_scope(self.fc2)
                
                 #self.policy_input = tf.concat([self.fc1, self.rnn_out], -1)
                 self.policy_input = slim.dropout(self.fc1, self.dropout, scope='dropout')
@@ -165,6 +192,7 @@ class A3CModel:
 
                 # Policy
                 self.logits = slim.fully_connected(self.policy_input, self.num_actions - 1, activation_fn=None)
+                self.layer_scopes['logits'] = get_layer_scope(self.logits)
                 self.pi = tf.nn.softmax(self.logits)
                 
                 # Policy with Prior knowledge of possible actions
@@ -176,14 +204,64 @@ class A3CModel:
                 # Batch x num_actions
                 self.gate_logits = slim.fully_connected(self.gate_input, self.num_actions - 1, activation_fn=None)
                 self.gate_proba = tf.nn.sigmoid(self.gate_logits)
+                self.layer_scopes['gate'] = get_layer_scope(self.gate_logits)
 
                 # Critic
                 self.critic_input = tf.concat([self.fc3, self.rnn_out], -1)
                 self.critic_input = slim.dropout(self.critic_input, self.dropout, scope='dropout')
 
                 self.v = slim.fully_connected(self.policy_input, 1, activation_fn=None)
+                self.layer_scopes['v'] = get_layer_scope(self.v)
                 self.v = slim.flatten(self.v)
 
+
+
+    def build_inference(self):
+        """
+        Inference tower for a batch of independent actors, every row has it's own LSTM state.
+        Shares variables with the main graph, runs without dropout and backbone batch norm uses
+        moving statistics, so an actor's result doesn't depend on other rows of the batch
+        """
+        with tf.variable_scope('step_inputs') as sc:
+            # Batch x rnn_size
+            self.step_c = tf.placeholder(tf.float32, (None, self.rnn_size), 'step_c')
+            self.step_h = tf.placeholder(tf.float32, (None, self.rnn_size), 'step_h')
+
+        def shared_fc(name, input, size, activation_fn = tf.nn.relu):
+            return slim.fully_connected(input, size, activation_fn = activation_fn,
+                                        scope = self.layer_scopes[name], reuse = True)
+
+        if self.from_features or not self.is_for_train:
+            net = self.net
+        else:
+            with tf.variable_scope(tf.get_variable_scope(), reuse = True):
+                net = self.backbone.build(self.img, False)
+
+        text_pretrain = shared_fc('text_pretrain', net, 512, None)
+        full_net = tf.concat([net, text_pretrain], -1)
+        fc1 = shared_fc('fc1', full_net, 200)
+        fc2 = shared_fc('fc2', full_net, 200)
+
+        # Policy with Prior knowledge of possible actions
+        logits = shared_fc('logits', fc1, self.num_actions - 1, None)
+        self.step_pi = tf.nn.softmax(logits + tf.log(self.possible_proba))
+
+        # Critic
+        self.step_v = slim.flatten(shared_fc('v', fc1, 1, None))
+
+        # One LSTM step
+        actions_repr = tf.one_hot(self.prev_actions, self.num_actions - 1)
+        img_repr = shared_fc('img_repr', net, 100)
+        step_input = tf.concat([actions_repr, img_repr], -1)
+
+        state = tf.nn.rnn_cell.LSTMStateTuple(self.step_c, self.step_h)
+        output, self.step_state = self.lstm_cell(step_input, state)
+        rnn_out = slim.flatten(shared_fc('rnn_fc', output, 100))
+
+        # Apply/Do Nothing Gate
+        gate_logits = shared_fc('gate', tf.concat([fc2, rnn_out], -1), self.num_actions - 1, None)
+        self.step_gate_proba = tf.nn.sigmoid(gate_logits)
+
                                 
     def add_loss(self):
         # Advantage: reward - value
@@ -276,13 +354,7 @@ class A3CModel:
         gate_proba = np.squeeze(gate_proba)
         print('got probabilities:', pi)
 
-        action_id = np.random.choice(range(self.num_actions - 1), p = pi)
-
-        action_proba = gate_proba[action_id]
-        action_proba = self.fixed_gate_probas.get(action_id, action_proba)
-        print('action_proba:', action_proba)
-        
-        to_apply = random.random() <= action_proba
+        action_id, to_apply = self.choose_action(pi, gate_proba)
         
         # move state
         if return_next_state:
@@ -291,6 +363,59 @@ class A3CModel:
             return (action_id, to_apply)
     
 
+    def choose_action(self, pi, gate_proba):
+        """
+        Samples action and decides whether to apply it
+        :param pi:          Probabilities of actions
+        :param gate_proba:  Probabilities to apply actions
+        :return:            Tuple (action_id, to_apply)
+        """
+        action_id = np.random.choice(range(self.num_actions - 1), p = pi)
+
+        action_proba = gate_proba[action_id]
+        action_proba = self.fixed_gate_probas.get(action_id, action_proba)
+        print('action_proba:', action_proba)
+        
+        to_apply = random.random() <= action_proba
+        return (action_id, to_apply)
+
+
+    def get_actions(self, images, possible_actions, prev_actions, lstm_states):
+        """
+        Batched get_action for independent actors by one session run of the inference tower
+        :param lstm_states:  List of LSTM states of actors, None for the first step
+        :return:             List of tuples (action_id, to_apply, new_lstm_state)
+        """
+        zeros = np.zeros((1, self.rnn_size), dtype=np.float32)
+        feed_dict = {
+            self.img: images,
+            self.possible_actions: possible_actions,
+            self.prev_actions: prev_actions,
+            self.step_c: np.concatenate([zeros if state is None else state.c for state in lstm_states]),
+            self.step_h: np.concatenate([zeros if state is None else state.h for state in lstm_states])
+        }
+
+        pi, gate_proba, (c, h) = self.session.run([self.step_pi, self.step_gate_proba, self.step_state],
+                                                  feed_dict = feed_dict)
+
+        result = []
+        for i in range(len(images)):
+            action_id, to_apply = self.choose_action(pi[i], gate_proba[i])
+            new_lstm_state = tf.nn.rnn_cell.LSTMStateTuple(c[i:i+1], h[i:i+1])
+            result.append((action_id, to_apply, new_lstm_state))
+
+        return result
+
+
+    def estimate_scores(self, images):
+        """
+        Batched estimate_score, value doesn't depend on LSTM state
+        :return:  List of score estimations in the same format as estimate_score returns
+        """
+        v = self.session.run(self.step_v, feed_dict = {self.img: images})
+        return [v[i:i+1] for i in range(len(images))]
+
+
     def estimate_score(self, image, prev_action, lstm_state = None):
         """
         Returns Score Estimation
@@ -95,7 +95,7 @@ class InputBirthday(IAction):
                 
         if ctrl.type == Types.text:
             enter_text(ctrl.elem, self.get_contains()[0])
-            time.sleep(5)
+            wait_settled(driver, 5)
 
         else:
             val = None
@@ -107,7 +107,7 @@ class InputBirthday(IAction):
                 return False
 
             select_combobox_value(driver, ctrl.elem, val)
-            time.sleep(1)
+            wait_settled(driver, 1)
 
         return True
 
@@ -175,7 +175,7 @@ class InputEmail(IAction):
                 email = user.get('email', second)
 
             enter_text(ctrl.elem, email)
-            time.sleep(1)
+            wait_settled(driver, 1)
 
             return True
         
@@ -214,7 +214,7 @@ class InputCheckoutFields(IAction):
                 value = user[0].phone
 
             enter_text(ctrl.elem, value)
-            time.sleep(1)
+            wait_settled(driver, 1)
 
             return True
 
@@ -247,7 +247,7 @@ class InputPaymentTextField(IAction):
                 value = user[1].expire_date_year
 
             enter_text(ctrl.elem, value)
-            time.sleep(1)
+            wait_settled(driver, 1)
 
             return True
 
@@ -319,7 +319,7 @@ class InputSelectField(IAction):
             value = user[1].expire_date_year
 
         select_combobox_value(driver, ctrl.elem, value)
-        time.sleep(1)
+        wait_settled(driver, 1)
 
         return True
 
@@ -344,7 +344,7 @@ class Click(IAction):
     def apply(self, ctrl, driver, user):
         if self.is_applicable(ctrl):
             click(driver, ctrl.elem)
-            time.sleep(5)
+            wait_settled(driver, 5)
 
             return True
         
@@ -359,7 +359,8 @@ class Wait(IAction):
         return True
 
     def apply(self, ctrl, driver, user):
-        time.sleep(2)
+        # Policy expects that timer-driven popups have time to appear
+        wait_settled(driver, 3, min_wait = 2)
         return True
     
     def __str__(self):
@@ -383,13 +384,13 @@ class SearchProductPage(ISiteAction):
 
     def search_in_google(self, driver, query, site):
         driver.get('https://www.google.com')
-        time.sleep(3)
+        wait_settled(driver, 3)
 
         search_input = driver.find_element_by_css_selector('input.gsfi')
         search_input.clear()
         search_input.send_keys("site:{} {}".format(site, query))
         search_input.send_keys(Keys.ENTER)
-        time.sleep(3)
+        wait_settled(driver, 3)
 
         links = driver.find_elements_by_css_selector('div.g .rc .r > a[href]')
         links = [link.get_attribute("href") for link in links]
@@ -402,13 +403,13 @@ class SearchProductPage(ISiteAction):
 
     def search_in_bing(self, driver, query, site):
         driver.get('https://www.bing.com')
-        time.sleep(3)
+        wait_settled(driver, 3)
 
         search_input = driver.find_element_by_css_selector('input.b_searchbox')
         search_input.clear()
         search_input.send_keys("site:{} {}".format(site, query))
         search_input.send_keys(Keys.ENTER)
-        time.sleep(3)
+        wait_settled(driver, 3)
 
         links = []
         items = driver.find_elements_by_css_selector("ol#b_results > li.b_algo")
@@ -425,7 +426,7 @@ class SearchProductPage(ISiteAction):
     def filter(self, driver, links):
         for link in links:
             driver.get(link)
-            time.sleep(3)
+            wait_settled(driver, 3)
             if len(search_for_add_to_cart(driver)) > 0:
                 return link
 
@@ -464,7 +465,7 @@ class SearchProductPage(ISiteAction):
 
         if link:
             driver.get(link)
-            time.sleep(3)
+            wait_settled(driver, 3)
             return True
 
         return False
@@ -478,7 +479,7 @@ class InputPassword(IAction):
         # Generate password that secure
         text = str(uuid.uuid4())[0:4].upper() + '_' + '912' + str(uuid.uuid4())[:4].lower()
         enter_text(control.elem, text)
-        time.sleep(1)
+        wait_settled(driver, 1)
 
         return True
 
@@ -508,7 +509,7 @@ class SelectFirst(IAction):
             val = values[1]
 
         select_combobox_value(driver, control.elem, val)
-        time.sleep(1)
+        wait_settled(driver, 1)
 
         return True
 
@@ -535,3 +536,12 @@ class Actions:
     # ToDo Login??
     navigation = [Click(), InputEmail(), InputPassword(), SelectFirst(), Nothing()]
 
+    @staticmethod
+    def get_possible_actions(ctrl, actions = None):
+        """
+        :param actions:  List of actions, Actions.actions by default. The last action is Nothing, it's always possible
+        :return:         List of 1 and 0 for all actions except the last one
+        """
+        actions = Actions.actions if actions is None else actions
+        return [1 if action.is_applicable(ctrl) else 0 for action in actions[:-1]]
+
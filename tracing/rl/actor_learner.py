@@ -31,12 +31,7 @@ class ActionsMemory:
 
     @staticmethod
     def get_possible_actions(ctrl):
-        possible_actions = []
-        for a_id, action in enumerate(Actions.actions[:-1]):
-            is_applicable = 1 if action.is_applicable(ctrl) else 0
-            possible_actions.append(is_applicable)
-        
-        return possible_actions        
+        return Actions.get_possible_actions(ctrl)
 
 
     def append(self, img, action, is_applied, reward, ctrl):
@@ -89,7 +84,8 @@ class ActorLearnerWorker(threading.Thread):
                          gamma = 0.99, 
                          dropout = 0.5,
                          l2 = 0.01,
-                         steps_lr_decay = 20 # Number of steps after which learning rate should decay
+                         steps_lr_decay = 20, # Number of steps after which learning rate should decay
+                         inference_server = None # InferenceServer to batch inference with other workers
                 ):
         threading.Thread.__init__(self)
         
@@ -101,6 +97,8 @@ class ActorLearnerWorker(threading.Thread):
         #                            session = self.session, name = self.name)
         
         self.local_model = global_model        
+        if inference_server is not None:
+            self.local_model = inference_server.create_client()
         
         self.env = env
         self.max_steps = max_steps
@@ -1,7 +1,6 @@
-import tempfile
 import sys
+import io
 from PIL import Image
-from scipy import misc
 import os
 import numpy as np
 import traceback
@@ -9,8 +8,13 @@ import time
 import functools
 
 from tracing.rl.actions import Nothing, Wait, Click
+from tracing.rl.viewport_cache import ViewportCache, ViewportFrame
 import tracing.selenium_utils.common as common
 import tracing.selenium_utils.controls as selenium_controls
+from tracing.selenium_utils.profiler import install_profiler
+from tracing.selenium_utils.settle import wait_settled
+from tracing.deadline import DeadlineExceeded
+from tracing.selenium_utils.navigation import navigate
 from tracing.user_data import get_user_data
 
 class Environment:
@@ -22,8 +26,17 @@ class Environment:
                  crop_h = 300,
                  crop_w = 300,
                  crop_pad = 5,
-                 max_passes = 3
+                 max_passes = 3,
+                 driver_pool = None,
+                 profile = False,
+                 blocking = None
                 ):
+        """
+        :param driver_pool:  DriverPool to take drivers from, if None then driver is launched for every url
+        :param profile:      Record WebDriver commands by CommandProfiler (available as driver.profiler)
+        :param blocking:     BlockingProfile of resources that aren't loaded,
+                             use profile with fidelity if rewards are set, page classifier needs realistic screenshots
+        """
         self.rewards = rewards
         self.width = width
         self.headless = headless
@@ -36,6 +49,13 @@ class Environment:
         self.passes = 0
         self.states = []
         self.max_passes = max_passes
+        self.driver_pool = driver_pool
+        self.profile = profile
+        self.blocking = blocking
+        self.navigation = None
+
+        # Controls visible in the same viewport are cropped from one screenshot
+        self.viewport_cache = ViewportCache(width, crop_h, crop_w, crop_pad)
 
     def __enter__(self):
         pass
@@ -45,7 +65,9 @@ class Environment:
 
     def try_quit_driver(self):
         try:
-            if self.driver is not None:
+            if self.driver is not None and self.driver_pool is not None:
+                self.driver_pool.release(self.driver)
+            elif self.driver is not None:
                 self.driver.quit()
         except:
             traceback.print_exc()
@@ -73,16 +95,32 @@ class Environment:
         self.is_changed = False
         self.passes = 0
         self.states = []
+        self.navigation = None
+        self.viewport_cache.clear()
 
         try:
-            self.driver = common.create_chrome_driver(headless = self.headless, size=(1280, 1024))
+            if self.driver_pool is not None:
+                self.driver = self.driver_pool.acquire()
+            else:
+                self.driver = common.create_chrome_driver(headless = self.headless, size=(1280, 1024), network_log = True)
             self.driver.set_page_load_timeout(120)
 
+            if self.blocking:
+                self.blocking.apply(self.driver)
+
+            if self.profile:
+                install_profiler(self.driver)
+
             if not url.startswith('http://') and not url.startswith('https://'):
                 url = 'http://' + url
         
-            self.driver.get(url)
-            time.sleep(5)
+            # Response status is taken from the browser (available as self.navigation),
+            # as before only page load timeout fails the start, error pages are still explored
+            self.navigation = navigate(self.driver, url)
+            if self.navigation.timed_out:
+                return False
+
+            wait_settled(self.driver, 5)
             self.states.append((url, self.c_idx, self.f_idx))
      
             if self.rewards:
@@ -96,6 +134,8 @@ class Environment:
             else:
                 return True
         
+        except DeadlineExceeded:
+            raise
         except:
             traceback.print_exc()
             return False
@@ -174,7 +214,7 @@ class Environment:
         
             while self.c_idx < len(self.controls):
                 ctrl = self.controls[self.c_idx]
-                if not common.is_stale(ctrl.elem) and selenium_controls.is_visible(ctrl.elem):
+                if ctrl.is_visible():
                     return True
     
                 self.c_idx += 1
@@ -221,7 +261,8 @@ class Environment:
            url = 'http://' + url
 
         self.driver.get(url)
-        time.sleep(2)
+        self.viewport_cache.clear()
+        wait_settled(self.driver, 2)
         self.get_next_control_based_frame(url, c_idx, f_idx)
 
     # ToDo Need to remove?
@@ -244,33 +285,24 @@ class Environment:
     def get_screenshot_as_array(self, full_page = False, scale = 1.):
         assert self.driver is not None
         
-        # 1. Create temp file
-        f, tmp = tempfile.mkstemp(suffix='.png')
-        os.close(f)
-
-        # 2. Take a screenshot
+        # 1. Take a screenshot
         if full_page:
-            common.get_full_page_screenshot(self.driver, tmp, self.screen_scale)    
+            img = common.get_full_page_image(self.driver, self.screen_scale)
         else:
-            common.get_screenshot(self.driver, tmp)
+            img = Image.open(io.BytesIO(common.get_screenshot(self.driver)))
 
-        # 3. Resize image
-        img = Image.open(tmp)
+        # 2. Resize image
         width_scale = self.width / float(img.size[0]) / scale
 
         width = int(self.width / scale)
         height = int((img.size[1] * width_scale))
         img = img.resize((width, height), Image.ANTIALIAS)
-        img.save(tmp)
         
         self.scale = width_scale * self.screen_scale
         
 
-        # 4. Read as a numpy array
-        image = misc.imread(tmp)
-        os.remove(tmp)
-        
-        image = image[:, :, :3]
+        # 3. Read as a numpy array
+        image = np.array(img.convert('RGB'))
         [h, w, _] = image.shape
         if h < w:
             to_add = np.ndarray([w-h, w, 3], dtype=np.uint8)
@@ -352,6 +384,34 @@ class Environment:
             self.try_switch_to_frame()
     
     
+    def get_viewport_key(self, frame_offset):
+        """
+        Key of the current viewport picture, None if DOM changes can't be tracked
+        """
+        try:
+            position = self.driver.execute_script(
+                'return [window.pageXOffset, window.pageYOffset, window.__tra_domEpoch, window.__tra_pageId];')
+        except:
+            return None
+
+        if position is None or position[2] is None:
+            return None
+
+        return (self.f_idx, frame_offset['x'], frame_offset['y']) + tuple(position)
+
+
+    def get_viewport_frame(self, frame_offset):
+        key = self.get_viewport_key(frame_offset)
+        frame = self.viewport_cache.get(key)
+        if frame is None:
+            # Wait till scroll is painted
+            time.sleep(0.2)
+            frame = ViewportFrame(common.get_screenshot(self.driver), self.screen_scale, self.width)
+            self.viewport_cache.put(key, frame)
+
+        return frame
+
+
     def get_control_as_input(self, ctrl):
         x, y = selenium_controls.scroll_to_element(self.driver, ctrl)
         if y < 0:
@@ -359,6 +419,7 @@ class Environment:
                 # Try to scroll 1000 pixels lower if it's a hidden menu item
                 common.scroll_to(self.driver, 200 * i)
                 time.sleep(0.1)
+                ctrl.refresh_rect()
                 if ctrl.location['y'] >= 0:
                     scroll = common.get_scroll_top(self.driver)
                     y = ctrl.location['y'] - scroll
@@ -367,12 +428,9 @@ class Environment:
         
         assert ctrl.location['y'] >= 0
         
-        time.sleep(0.2)
-        
-        scale = self.get_screen_scale(ctrl)
-        image = self.get_screenshot_as_array(scale=scale)
-        
+        scale = self.viewport_cache.quantize_scale(self.get_screen_scale(ctrl))
         frame_offset = self.get_frame_location()
+        image, self.scale = self.get_viewport_frame(frame_offset).get_level(scale)
 
         [h, w, _] = image.shape
         top = y + frame_offset['y']
@@ -385,25 +443,15 @@ class Environment:
         bottom = int(bottom * self.scale)
         right = int(right * self.scale)
         
+        # Screenshot is padded to a square
         top = max(top, 0)
         left = max(left, 0)
-        bottom = min(bottom, h)
+        bottom = min(bottom, max(h, w))
         right = min(right, w)
                 
         assert(bottom > top and right > left)
 
-        if top > self.crop_pad:
-            image[:top-self.crop_pad, :, :] = 0
-        if bottom + self.crop_pad < h:
-            image[bottom+self.crop_pad:, :, :] = 0
-        if left > self.crop_pad:
-            image[:, :left-self.crop_pad, :] = 0
-        if right + self.crop_pad < w:
-            image[:, right+self.crop_pad:, :] = 0
-
-        image = self.crop_image(image, (left + right) // 2, (top + bottom) // 2)
-        
-        return (image - 128.0) / 128.0
+        return self.viewport_cache.crop(image, left, top, right, bottom)
 
     
     def get_controls(self):
@@ -478,6 +526,10 @@ class Environment:
         self.step += 1
 
         user = [self.user_info, self.payment_info]
+        # Typed text and hover change picture without DOM mutations
+        if not isinstance(action, Nothing):
+            self.viewport_cache.clear()
+
         if isinstance(action, Nothing) or isinstance(action, Wait):
             success = action.apply(control, self.driver, user)
             return (success, 0)
@@ -499,7 +551,9 @@ class Environment:
 
             if control:
                 # Control could disappear track it as Environment Changed
-                self.is_changed = self.is_changed or not selenium_controls.is_visible(control.elem)
+                self.is_changed = self.is_changed or not control.is_visible()
+        except DeadlineExceeded:
+            raise
         except:
             success = False
             traceback.print_exc()
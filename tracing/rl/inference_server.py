@@ -0,0 +1,201 @@
+import time
+import threading
+import traceback
+import multiprocessing
+from queue import Queue, Empty
+from concurrent.futures import Future
+
+
+class InferenceServer(threading.Thread):
+    """
+    Collects get_action and estimate_score requests of all actors and runs them by batches.
+    Every actor keeps it's own LSTM state, so requests of different actors are independent
+    """
+
+    def __init__(self, model, max_batch = 16, timeout = 0.01):
+        """
+        :param model:      A3CModel
+        :param max_batch:  Maximum number of requests in one session run
+        :param timeout:    Seconds to wait for more requests after the first one
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+        self.model = model
+        self.max_batch = max_batch
+        self.timeout = timeout
+
+        self._requests = Queue()
+        self._stopped = False
+
+        # Requests from actors in other processes
+        self._process_requests = None
+        self._process_responses = []
+        self._bridge = None
+
+    def submit(self, kind, *args):
+        """
+        Adds request to the next batch
+        :param kind:  'action' or 'score'
+        :param args:  (image, possible_actions, prev_action, lstm_state) for action, (image,) for score
+        :return:      Future with result of A3CModel.get_actions or estimate_scores for this request
+        """
+        future = Future()
+        self._requests.put((kind, args, future))
+        return future
+
+    def create_client(self):
+        """
+        Client for actors in threads of this process
+        """
+        return InferenceClient(self)
+
+    def create_process_client(self):
+        """
+        Client for actors in other processes, must be created before the process is started
+        and passed to it as an argument
+        """
+        if self._process_requests is None:
+            self._process_requests = multiprocessing.Queue()
+            self._bridge = threading.Thread(target = self.serve_processes, daemon = True)
+            self._bridge.start()
+
+        responses = multiprocessing.Queue()
+        self._process_responses.append(responses)
+
+        return ProcessInferenceClient(self._process_requests, responses, len(self._process_responses) - 1)
+
+    def serve_processes(self):
+        while not self._stopped:
+            try:
+                client_id, request_id, kind, args = self._process_requests.get(timeout = 1)
+            except Empty:
+                continue
+
+            future = self.submit(kind, *args)
+            responses = self._process_responses[client_id]
+            future.add_done_callback(lambda f, r = responses, i = request_id: self.reply(f, r, i))
+
+    @staticmethod
+    def reply(future, responses, request_id):
+        error = future.exception()
+        if error is not None:
+            responses.put((request_id, None, str(error)))
+        else:
+            responses.put((request_id, future.result(), None))
+
+    def next_batch(self):
+        try:
+            batch = [self._requests.get(timeout = 1)]
+        except Empty:
+            return []
+
+        deadline = time.time() + self.timeout
+        while len(batch) < self.max_batch:
+            left = deadline - time.time()
+            if left <= 0:
+                break
+
+            try:
+                batch.append(self._requests.get(timeout = left))
+            except Empty:
+                break
+
+        return batch
+
+    def process(self, batch):
+        actions = [request for request in batch if request[0] == 'action']
+        scores = [request for request in batch if request[0] == 'score']
+
+        if actions:
+            images, possible_actions, prev_actions, lstm_states = zip(*[args for _, args, _ in actions])
+            results = self.model.get_actions(list(images), list(possible_actions),
+                                             list(prev_actions), list(lstm_states))
+            for (_, _, future), result in zip(actions, results):
+                future.set_result(result)
+
+        if scores:
+            images = [args[0] for _, args, _ in scores]
+            results = self.model.estimate_scores(images)
+            for (_, _, future), result in zip(scores, results):
+                future.set_result(result)
+
+    def run(self):
+        while not self._stopped:
+            batch = self.next_batch()
+            if not batch:
+                continue
+
+            try:
+                self.process(batch)
+            except Exception as e:
+                traceback.print_exc()
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def stop(self):
+        self._stopped = True
+
+
+class InferenceClient:
+    """
+    Drop-in replacement of A3CModel for actors, inference goes through InferenceServer
+    and the rest (training, saving) is delegated to the model
+    """
+
+    def __init__(self, server):
+        self.server = server
+
+    def __getattr__(self, name):
+        return getattr(self.server.model, name)
+
+    def get_action(self, image, possible_actions, prev_action, lstm_state = None, return_next_state = False):
+        action_id, to_apply, new_lstm_state = self.server.submit(
+            'action', image, possible_actions, prev_action, lstm_state).result()
+
+        if return_next_state:
+            return (action_id, to_apply, new_lstm_state)
+        else:
+            return (action_id, to_apply)
+
+    def estimate_score(self, image, prev_action, lstm_state = None):
+        return self.server.submit('score', image).result()
+
+
+class ProcessInferenceClient:
+    """
+    InferenceClient for actors in other processes, requests are sent by multiprocessing queues.
+    Is used by one thread of the actor process
+    """
+
+    def __init__(self, requests, responses, client_id):
+        self.requests = requests
+        self.responses = responses
+        self.client_id = client_id
+        self.request_id = 0
+
+    def call(self, kind, *args):
+        self.request_id += 1
+        self.requests.put((self.client_id, self.request_id, kind, args))
+
+        while True:
+            request_id, result, error = self.responses.get()
+            if request_id != self.request_id:
+                continue
+
+            if error is not None:
+                raise Exception('Inference failed: {}'.format(error))
+
+            return result
+
+    def get_action(self, image, possible_actions, prev_action, lstm_state = None, return_next_state = False):
+        action_id, to_apply, new_lstm_state = self.call('action', image, possible_actions, prev_action, lstm_state)
+
+        if return_next_state:
+            return (action_id, to_apply, new_lstm_state)
+        else:
+            return (action_id, to_apply)
+
+    def estimate_score(self, image, prev_action, lstm_state = None):
+        return self.call('score', image)
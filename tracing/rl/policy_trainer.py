@@ -5,8 +5,13 @@ import random
 
 
 class PolicyTrainer:
-    def __init__(self, a3c):
+    def __init__(self, a3c, features = None):
+        """
+        :param a3c:       A3CModel
+        :param features:  BackboneFeatures for A3CModel with from_features
+        """
         self.a3c = a3c
+        self.features = features
 
     def build_graph(self):
         self.action_label = tf.placeholder(tf.int32, (None), "action")
@@ -60,6 +65,9 @@ class PolicyTrainer:
             is_applied.append(1. if is_success else 0.)
             control_labels.append(label)
 
+        if self.features is not None:
+            images = self.features.get(images)
+
         return {
             self.a3c.img: images,
             self.action_label: action_id,
@@ -0,0 +1,172 @@
+import multiprocessing
+import traceback
+import numpy as np
+
+from tracing.rl.actions import Actions
+
+
+def env_worker(pipe, index, env_fn, observations, shape, actions_set):
+    """
+    Runs Environment in a separate process and executes commands from pipe.
+    Control inputs are written to the shared observations array
+    """
+    env = env_fn()
+    actions = getattr(Actions, actions_set)
+    observation = np.frombuffer(observations, dtype = np.float32).reshape(shape)[index]
+    ctrl = None
+
+    while True:
+        command, arg = pipe.recv()
+
+        if command == 'close':
+            env.try_quit_driver()
+            pipe.close()
+            break
+
+        try:
+            if command == 'reset':
+                ctrl = None
+                result = env.start(arg)
+
+            elif command == 'next_control':
+                ctrl = None
+                if (env.rewards and env.is_final()) or not env.has_next_control():
+                    result = None
+                else:
+                    ctrl = env.get_next_control()
+                    observation[:] = env.get_control_as_input(ctrl)
+                    result = (Actions.get_possible_actions(ctrl, actions), str(ctrl)[:100])
+
+            elif command == 'apply_action':
+                success, reward = env.apply_action(ctrl, actions[arg])
+                result = (success, reward, env.step)
+
+            elif command == 'final_reward':
+                result = env.calc_final_reward()
+
+            else:
+                raise ValueError('Unknown command {}'.format(command))
+
+        except:
+            traceback.print_exc()
+            result = None
+
+        pipe.send(result)
+
+
+class VecEnvironment:
+    """
+    Runs several Environments in worker processes and steps them by batches.
+    Control inputs of all environments are returned as one numpy array in shared memory
+    """
+
+    def __init__(self, env_fns, crop_h = 300, crop_w = 300, actions_set = 'actions', start_method = 'spawn'):
+        """
+        :param env_fns:       List of picklable functions without arguments that create Environment,
+                              for instance functools.partial(Environment, headless = True)
+        :param crop_h:        Height of control input, must be the same as in environments
+        :param crop_w:        Width of control input, must be the same as in environments
+        :param actions_set:   Name of Actions attribute with list of actions, actions are referenced by index in it
+        :param start_method:  Multiprocessing start method, spawn doesn't share TensorFlow state with workers
+        """
+        self.num_envs = len(env_fns)
+        self.actions = getattr(Actions, actions_set)
+
+        self.shape = (self.num_envs, crop_h, crop_w, 3)
+
+        context = multiprocessing.get_context(start_method)
+        self._observations = context.RawArray('f', int(np.prod(self.shape)))
+        self.observations = np.frombuffer(self._observations, dtype = np.float32).reshape(self.shape)
+
+        self.pipes = []
+        self.processes = []
+        for index, env_fn in enumerate(env_fns):
+            pipe, worker_pipe = context.Pipe()
+            process = context.Process(target = env_worker,
+                                      args = (worker_pipe, index, env_fn, self._observations,
+                                              self.shape, actions_set))
+            process.daemon = True
+            process.start()
+            worker_pipe.close()
+
+            self.pipes.append(pipe)
+            self.processes.append(process)
+
+        self.active = [False] * self.num_envs
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def call(self, command, args, indexes):
+        for i in indexes:
+            self.pipes[i].send((command, args[i]))
+
+        return {i: self.pipes[i].recv() for i in indexes}
+
+    def reset(self, urls):
+        """
+        Starts all environments
+        :param urls:  List of urls, one per environment
+        :return:      List of bools, True if environment is started
+        """
+        results = self.call('reset', urls, range(self.num_envs))
+        self.active = [bool(results[i]) for i in range(self.num_envs)]
+
+        return list(self.active)
+
+    def next_controls(self):
+        """
+        Moves every active environment to the next visible control
+        :return:  Tuple (observations, active, possible_actions, labels).
+                  observations is a shared array N x crop_h x crop_w x 3 that is overwritten by the next call,
+                  rows of not active environments are not updated.
+                  active[i] is False if environment i is finished
+        """
+        indexes = [i for i in range(self.num_envs) if self.active[i]]
+        results = self.call('next_control', [None] * self.num_envs, indexes)
+
+        possible_actions = [None] * self.num_envs
+        labels = [None] * self.num_envs
+        for i, result in results.items():
+            if result is None:
+                self.active[i] = False
+            else:
+                possible_actions[i], labels[i] = result
+
+        return (self.observations, list(self.active), possible_actions, labels)
+
+    def apply_actions(self, action_ids):
+        """
+        Applies actions to the current controls
+        :param action_ids:  List of action indexes, None to skip environment
+        :return:            List of tuples (success, reward, step) or None for skipped environments
+        """
+        indexes = [i for i in range(self.num_envs) if self.active[i] and action_ids[i] is not None]
+        results = self.call('apply_action', action_ids, indexes)
+
+        return [results.get(i) for i in range(self.num_envs)]
+
+    def calc_final_rewards(self):
+        """
+        :return:  List of final rewards, environments must have rewards calculator
+        """
+        results = self.call('final_reward', [None] * self.num_envs, range(self.num_envs))
+        return [results[i] for i in range(self.num_envs)]
+
+    def close(self):
+        for pipe in self.pipes:
+            try:
+                pipe.send(('close', None))
+            except (BrokenPipeError, EOFError):
+                pass
+
+        for process in self.processes:
+            process.join(timeout = 30)
+            if process.is_alive():
+                process.terminate()
+
+        self.pipes = []
+        self.processes = []
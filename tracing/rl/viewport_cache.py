@@ -0,0 +1,137 @@
+import io
+import collections
+from PIL import Image
+import numpy as np
+
+
+def get_scale_levels(min_scale, max_scale, steps_per_octave = 4):
+    """
+    Quantized screen scales between min_scale and max_scale (both included)
+    """
+    levels = []
+    scale = min_scale
+    while scale < max_scale:
+        levels.append(scale)
+        scale *= 2 ** (1. / steps_per_octave)
+
+    levels.append(max_scale)
+    return levels
+
+
+class ViewportFrame:
+    """
+    One decoded viewport screenshot and it's resized copies by scale levels
+    """
+
+    def __init__(self, png, screen_scale, width):
+        """
+        :param png:           Screenshot of viewport
+        :param screen_scale:  Screenshot width / page width
+        :param width:         Width of the image at scale 1
+        """
+        self.image = Image.open(io.BytesIO(png)).convert('RGB')
+        self.screen_scale = screen_scale
+        self.width = width
+        self._levels = {}
+
+    def get_level(self, scale):
+        """
+        Resized screenshot, is computed once per scale
+        :param scale:  Scale level
+        :return:       Tuple (uint8 array H x W x 3, page pixels to array pixels scale)
+        """
+        if scale not in self._levels:
+            width_scale = self.width / float(self.image.size[0]) / scale
+
+            width = int(self.width / scale)
+            height = int(self.image.size[1] * width_scale)
+            array = np.asarray(self.image.resize((width, height), Image.ANTIALIAS), dtype = np.uint8)
+
+            self._levels[scale] = (array, width_scale * self.screen_scale)
+
+        return self._levels[scale]
+
+
+class ViewportCache:
+    """
+    Recently taken viewport frames, controls visible in the same viewport are cropped from one screenshot.
+    Frames are keyed by (frame index, frame offset, scroll position, DOM epoch) and the cache is cleared
+    when page is changed by action
+    """
+
+    def __init__(self, width, crop_h, crop_w, crop_pad, max_frames = 4):
+        """
+        :param width:       Width of the image at scale 1
+        :param crop_h:      Height of control input
+        :param crop_w:      Width of control input
+        :param crop_pad:    Pixels around the control that are kept
+        :param max_frames:  Maximum number of frames in cache
+        """
+        self.width = width
+        self.crop_h = crop_h
+        self.crop_w = crop_w
+        self.crop_pad = crop_pad
+        self.max_frames = max_frames
+        self.levels = get_scale_levels(0.5, width / crop_w)
+        self._frames = collections.OrderedDict()
+
+    def quantize_scale(self, scale):
+        """
+        The nearest level that is not less than scale, so control still fits into crop
+        """
+        for level in self.levels:
+            if level >= scale - 1e-6:
+                return level
+
+        return self.levels[-1]
+
+    def get(self, key):
+        if key is None or key not in self._frames:
+            return None
+
+        self._frames.move_to_end(key)
+        return self._frames[key]
+
+    def put(self, key, frame):
+        if key is None:
+            return
+
+        self._frames[key] = frame
+        if len(self._frames) > self.max_frames:
+            self._frames.popitem(last = False)
+
+    def clear(self):
+        self._frames.clear()
+
+    def crop(self, image, left, top, right, bottom):
+        """
+        Crops control input of size crop_h x crop_w around control box without copying the whole image.
+        Pixels farther than crop_pad from control are black, image is padded by black to a square
+        :param image:  uint8 array H x W x 3
+        :return:       float32 array crop_h x crop_w x 3 with values in [-1, 1]
+        """
+        (h, w, c) = image.shape
+        square_h = max(h, w)
+
+        center_x = (left + right) // 2
+        center_y = (top + bottom) // 2
+
+        crop_top = max(center_y - (self.crop_h - 1) // 2, 0)
+        crop_left = max(center_x - (self.crop_w - 1) // 2, 0)
+        crop_bottom = min(center_y + (self.crop_h + 2) // 2, square_h)
+        crop_right = min(center_x + (self.crop_w + 2) // 2, w)
+
+        # Cropped part is centered in the input if it's near the border
+        offset_y = (self.crop_h - (crop_bottom - crop_top)) // 2
+        offset_x = (self.crop_w - (crop_right - crop_left)) // 2
+
+        rows = (max(crop_top, top - self.crop_pad, 0), min(crop_bottom, bottom + self.crop_pad, h))
+        cols = (max(crop_left, left - self.crop_pad, 0), min(crop_right, right + self.crop_pad, w))
+
+        result = np.full([self.crop_h, self.crop_w, c], -1., dtype = np.float32)
+        if rows[1] > rows[0] and cols[1] > cols[0]:
+            part = image[rows[0]:rows[1], cols[0]:cols[1], :].astype(np.float32)
+            result[offset_y + rows[0] - crop_top : offset_y + rows[1] - crop_top,
+                   offset_x + cols[0] - crop_left : offset_x + cols[1] - crop_left, :] = (part - 128.) / 128.
+
+        return result
@@ -0,0 +1,102 @@
+from tracing.selenium_utils.common import *
+
+
+# Url extensions of resource types, Network.setBlockedURLs matches only urls
+resource_extensions = {
+    'image': ['png', 'jpg', 'jpeg', 'gif', 'webp', 'svg', 'ico', 'bmp'],
+    'font': ['woff', 'woff2', 'ttf', 'otf', 'eot'],
+    'media': ['mp4', 'webm', 'ogg', 'ogv', 'mp3', 'wav', 'm4a', 'mov', 'avi', 'm3u8']
+}
+
+# Analytics and ads that are never needed to find add to cart or checkout controls
+tracker_domains = [
+    'google-analytics.com', 'googletagmanager.com', 'doubleclick.net', 'googlesyndication.com',
+    'googleadservices.com', 'connect.facebook.net', 'hotjar.com', 'scorecardresearch.com',
+    'quantserve.com', 'criteo.com', 'criteo.net', 'taboola.com', 'outbrain.com', 'adnxs.com',
+    'amazon-adsystem.com', 'bat.bing.com', 'ads-twitter.com', 'mixpanel.com', 'cdn.segment.com',
+    'nr-data.net', 'crazyegg.com', 'mouseflow.com', 'fullstory.com', 'mc.yandex.ru', 'adroll.com',
+    'clarity.ms', 'youtube.com', 'vimeo.com'
+]
+
+
+class BlockingProfile:
+    """
+    Set of resources that aren't loaded by browser during tracing.
+    Is applied to driver by CDP Network.setBlockedURLs
+    """
+
+    def __init__(self,
+                 resource_types = ['image', 'font', 'media'],
+                 domains = tracker_domains,
+                 url_patterns = None,
+                 fidelity = False
+                ):
+        """
+        :param resource_types:  Types of resources to block: image, font, media
+        :param domains:         Domains (with subdomains) to block
+        :param url_patterns:    Additional url patterns with wildcards
+        :param fidelity:        Keep images and fonts for realistic screenshots, only media and domains are blocked
+        """
+        self.resource_types = list(resource_types or [])
+        self.domains = list(domains or [])
+        self.url_patterns = list(url_patterns or [])
+        self.fidelity = fidelity
+
+    @staticmethod
+    def from_config(config, **kwargs):
+        """
+        Creates BlockingProfile from section [blocking] of config
+        :param config:  ConfigParser
+        :param kwargs:  Parameters that override config values
+        :return:        BlockingProfile or None if blocking is disabled
+        """
+        if not config.getboolean('blocking', 'enabled', fallback=False):
+            return None
+
+        def get_list(option, fallback):
+            value = config.get('blocking', option, fallback=None)
+            if value is None:
+                return fallback
+
+            return [item.strip() for item in value.split(',') if item.strip()]
+
+        params = dict(
+            resource_types = get_list('resource_types', ['image', 'font', 'media']),
+            domains = tracker_domains + get_list('domains', []),
+            url_patterns = get_list('url_patterns', []),
+            fidelity = config.getboolean('blocking', 'fidelity', fallback=False)
+        )
+        params.update(kwargs)
+
+        return BlockingProfile(**params)
+
+    def get_blocked_urls(self):
+        types = self.resource_types
+        if self.fidelity:
+            types = [type for type in types if type not in ['image', 'font']]
+
+        patterns = []
+        for type in types:
+            for ext in resource_extensions.get(type, []):
+                patterns.extend(['*.{}'.format(ext), '*.{}?*'.format(ext)])
+
+        for domain in self.domains:
+            patterns.extend(['*://{}/*'.format(domain), '*://*.{}/*'.format(domain)])
+
+        return patterns + self.url_patterns
+
+    def apply(self, driver):
+        """
+        Blocks resources in the current tab of driver
+        :param driver:  Web driver
+        :return:        True if profile is applied, False if CDP isn't supported
+        """
+        if execute_cdp(driver, 'Network.enable') is None:
+            return False
+
+        if execute_cdp(driver, 'Network.setBlockedURLs', {'urls': self.get_blocked_urls()}) is None:
+            return False
+
+        driver.blocking_profile = self
+        return True
+
@@ -0,0 +1,161 @@
+import json
+import logging
+import traceback
+from collections import namedtuple
+
+from tracing.selenium_utils.settle import *
+from tracing.deadline import DeadlineExceeded
+
+
+# Browser state after a state transition that a later attempt could continue from
+Checkpoint = namedtuple('Checkpoint', ['state', 'url', 'cookies', 'local_storage', 'session_storage'])
+
+# Fields accepted by Network.setCookies
+cdp_cookie_fields = ['name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'sameSite', 'expires']
+
+# Fields accepted by WebDriver add_cookie
+webdriver_cookie_fields = ['name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'expiry']
+
+
+def to_cdp_cookie(cookie):
+    result = {key: cookie[key] for key in cdp_cookie_fields if key in cookie}
+    if 'expiry' in cookie:
+        result['expires'] = cookie['expiry']
+
+    # Session cookies are returned with expires -1
+    if result.get('expires', 0) <= 0:
+        result.pop('expires', None)
+
+    return result
+
+
+def to_webdriver_cookie(cookie):
+    result = {key: cookie[key] for key in webdriver_cookie_fields if key in cookie}
+    if cookie.get('expires', 0) > 0:
+        result['expiry'] = int(cookie['expires'])
+
+    return result
+
+
+def take_checkpoint(driver, state):
+    """
+    Saves url, cookies of all domains and storages of the main frame
+    :param driver:  Web driver
+    :param state:   Tracer state that is reached on the current page
+    :return:        Checkpoint or None if browser state can't be read
+    """
+    try:
+        driver.switch_to.default_content()
+
+        result = execute_cdp(driver, 'Network.getAllCookies')
+        if result is not None:
+            cookies = [to_cdp_cookie(cookie) for cookie in result.get('cookies', [])]
+        else:
+            cookies = [to_cdp_cookie(cookie) for cookie in driver.get_cookies()]
+
+        storages = driver.execute_script(
+            'try {return [JSON.stringify(localStorage), JSON.stringify(sessionStorage)];}' +
+            'catch (e) {return ["{}", "{}"];}')
+
+        return Checkpoint(state, get_url(driver), cookies, json.loads(storages[0]), json.loads(storages[1]))
+    except:
+        logger = logging.getLogger('shop_tracer')
+        logger.debug('Cannot take checkpoint {}'.format(traceback.format_exc()))
+        return None
+
+
+def restore_checkpoint(driver, checkpoint, timeout = 10):
+    """
+    Restores browser state saved by take_checkpoint and opens saved url.
+    Driver should be already navigated to the shop, otherwise cookies could be set only through CDP
+    :param driver:      Web driver
+    :param checkpoint:  Checkpoint
+    :param timeout:     Seconds to wait while restored page is loaded
+    :return:            True if state is restored
+    """
+    logger = logging.getLogger('shop_tracer')
+    try:
+        driver.switch_to.default_content()
+
+        if execute_cdp(driver, 'Network.setCookies', {'cookies': checkpoint.cookies}) is None:
+            for cookie in checkpoint.cookies:
+                try:
+                    driver.add_cookie(to_webdriver_cookie(cookie))
+                except WebDriverException:
+                    # Only cookies of the current domain could be added
+                    logger.debug('Cannot restore cookie {}'.format(cookie.get('name')))
+
+        driver.get(checkpoint.url)
+
+        if checkpoint.local_storage or checkpoint.session_storage:
+            driver.execute_script('''
+                var local = arguments[0], session = arguments[1];
+                for (var key in local) localStorage.setItem(key, local[key]);
+                for (var key in session) sessionStorage.setItem(key, session[key]);
+            ''', checkpoint.local_storage, checkpoint.session_storage)
+
+            # Page scripts should see restored storages
+            driver.refresh()
+
+        wait_settled(driver, timeout)
+        return True
+    except DeadlineExceeded:
+        raise
+    except:
+        logger.warning('Cannot restore checkpoint {}'.format(traceback.format_exc()))
+        return False
+
+
+class CheckpointHistory:
+    """
+    Checkpoints of the current trace from the shallowest to the deepest with recorded paths that led to them.
+    Attempt resumes from the deepest checkpoint, it's dropped if the attempt hasn't got deeper,
+    so the next attempt resumes from the previous checkpoint or starts from scratch
+    """
+
+    def __init__(self):
+        # List of tuples (depth, Checkpoint, steps)
+        self.items = []
+        self.resumed = None
+
+    def is_empty(self):
+        return not self.items
+
+    def save(self, driver, state, depth, steps):
+        """
+        Takes checkpoint if state is deeper than the deepest saved one
+        :param depth:  Depth of state, for instance index in States.states
+        :param steps:  Recorded path that led to the state
+        """
+        if self.items and self.items[-1][0] >= depth:
+            return
+
+        checkpoint = take_checkpoint(driver, state)
+        if checkpoint:
+            self.items.append((depth, checkpoint, list(steps)))
+
+    def restore(self, driver):
+        """
+        Restores the deepest checkpoint, checkpoints that can't be restored are dropped
+        :return:  Tuple (Checkpoint, steps) or None if there is nothing to restore
+        """
+        self.resumed = None
+        while self.items:
+            item = self.items[-1]
+            if restore_checkpoint(driver, item[1]):
+                self.resumed = item
+                return item[1], list(item[2])
+
+            self.items.pop()
+
+        return None
+
+    def finish_attempt(self, depth):
+        """
+        Drops the checkpoint the attempt was resumed from if attempt hasn't got deeper
+        :param depth:  Depth of the final state of the attempt, -1 if it's unknown
+        """
+        if self.resumed is not None and depth <= self.resumed[0] and self.resumed in self.items:
+            self.items.remove(self.resumed)
+
+        self.resumed = None
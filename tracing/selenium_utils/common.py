@@ -4,6 +4,8 @@ import logging
 import traceback
 import tempfile
 import os
+import io
+import base64
 from PIL import Image
 import time
 
@@ -102,15 +104,6 @@ def can_click(element):
         return False
 
 
-def click_radio_or_checkout_button(driver, element):
-    try:
-        element.send_keys(selenium.webdriver.common.keys.Keys.SPACE)
-    except:
-        driver.execute_script("arguments[0].click();", element)
-        pass
-    time.sleep(1)
-
-
 def find_alert(driver):    
     return alert_is_present()(driver)
 
@@ -239,12 +232,15 @@ def get_name_of_state(state):
     return us_state_abbrev[state]
 
 
-def create_chrome_driver(chrome_path='/usr/bin/chromedriver', headless=True, size = None):
+def create_chrome_driver(chrome_path='/usr/bin/chromedriver', headless=True, size = None, network_log = False):
     """
     Creates Chrome Web driver
     :param chrome_path:   Path to Chrome Web Driver binary
     :param headless:      Should be the driver headless or not
     :param size:          Tuple of page size
+    :param network_log:   Enable Network events in performance log. Log is buffered by chromedriver until it's read,
+                          so it should be enabled only for drivers that are used with navigate and wait_settled
+                          or are reset by DriverPool
     :return:              Web driver
     """
     options = webdriver.ChromeOptions()
@@ -271,9 +267,44 @@ def create_chrome_driver(chrome_path='/usr/bin/chromedriver', headless=True, siz
     options.add_argument("--crash-on-hang-threads")
     
     options.add_argument("--lang=en")
-    
-    
-    return webdriver.Chrome(chrome_path, chrome_options=options)
+
+    # Network events in performance log are used to capture navigation status (see navigation.py)
+    # and requests in flight (see settle.py)
+    if network_log:
+        options.add_experimental_option('perfLoggingPrefs', {'enableNetwork': True, 'enablePage': False})
+
+    capabilities = options.to_capabilities()
+    if network_log:
+        capabilities['loggingPrefs'] = {'performance': 'ALL'}
+        capabilities['goog:loggingPrefs'] = {'performance': 'ALL'}
+
+    driver = webdriver.Chrome(chrome_path, chrome_options=options, desired_capabilities=capabilities)
+    driver.network_log = network_log
+    return driver
+
+
+def execute_cdp(driver, cmd, params = None):
+    """
+    Executes Chrome DevTools Protocol command
+    :param driver:  Web driver
+    :param cmd:     Command name, for instance 'Network.clearBrowserCookies'
+    :param params:  Dict of command parameters
+    :return:        Command result or None if command is not supported by the driver
+    """
+    params = params or {}
+    try:
+        if hasattr(driver, 'execute_cdp_cmd'):
+            return driver.execute_cdp_cmd(cmd, params)
+
+        # Older selenium versions don't have this command registered
+        driver.command_executor._commands['executeCdpCommand'] = \
+            ('POST', '/session/$sessionId/goog/cdp/execute')
+        return driver.execute('executeCdpCommand', {'cmd': cmd, 'params': params})['value']
+
+    except WebDriverException:
+        logger = logging.getLogger('shop_tracer')
+        logger.debug('CDP command {} is not supported {}'.format(cmd, traceback.format_exc()))
+        return None
 
 
 def back(driver):
@@ -367,23 +398,26 @@ def get_viewport_size(driver):
     return {'width': iw, 'height': ih}
     
 
-def get_scale(driver):
+def get_scale(driver, refresh = False):
     """
-    Calculates scale between screenshot size and page size
+    Calculates scale between screenshot size and page size.
+    Value is cached in driver because it's the same for all pages
     :param driver:   Web driver
+    :param refresh:  Recalculate cached value
     :return:         Screenshot width / page width
     """
-    fd, path = tempfile.mkstemp(prefix='screenshot', suffix='.png')
-    os.close(fd)
+    scale = getattr(driver, 'screen_scale', None)
+    if scale and not refresh:
+        return scale
 
-    driver.save_screenshot(path)
-    w, h = Image.open(path).size
+    w, h = Image.open(io.BytesIO(driver.get_screenshot_as_png())).size
     
     iw, ih = driver.execute_script("var w=window; return [w.innerWidth, w.innerHeight];")
     
     scale = w / iw
     assert abs(scale - h/ih) <= 1e-5
-    
+
+    driver.screen_scale = scale
     return scale
 
 
@@ -398,84 +432,180 @@ def enter_text(driver, x, y, text):
     driver.execute_script('el = document.elementFromPoint({}, {}); el.value = "{}";'.format(x, y, text))
 
 
-def get_full_page_screenshot(driver, output_file, scale, max_pages = 10):
+def decode_png(data):
     """
-    Takes correct screenshot with scrolls and dynamic content
+    :param data:  PNG bytes or base64 encoded PNG (as DevTools returns it)
+    :return:      Loaded PIL Image
+    """
+    if isinstance(data, str):
+        data = base64.b64decode(data)
+
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    return img
+
+
+class PageCapture:
+    """
+    Full page screenshot as it's returned by browser: not decoded PNG tiles with their positions.
+    Decoding and stitching is done by to_image, so it could be moved out of the tracer thread
+    """
+
+    def __init__(self, tiles, scale = 1, bottom = None):
+        """
+        :param tiles:   List of tuples (top in page pixels, PNG bytes or base64 encoded PNG)
+        :param scale:   Screenshot width / page width
+        :param bottom:  Captured page height in page pixels, None if the only tile is the whole page
+        """
+        self.tiles = tiles
+        self.scale = scale
+        self.bottom = bottom
+
+    def to_image(self):
+        """
+        :return:  PIL Image or None if page is empty
+        """
+        if not self.tiles:
+            return None
+
+        if self.bottom is None:
+            return decode_png(self.tiles[0][1])
+
+        canvas = None
+        for top, data in self.tiles:
+            tile = decode_png(data)
+            offset = round(top * self.scale)
+
+            # Page could grow during scrolling, canvas is extended in this case
+            if canvas is None or canvas.size[1] < offset + tile.size[1]:
+                extended = Image.new('RGB', (tile.size[0] if canvas is None else canvas.size[0], offset + tile.size[1]))
+                if canvas is not None:
+                    extended.paste(canvas, (0, 0))
+                canvas = extended
+
+            canvas.paste(tile, (0, offset))
+
+        result_height = round(self.bottom * self.scale)
+        if result_height == 0 or canvas.size[0] == 0:
+            return None
+
+        return canvas.crop((0, 0, canvas.size[0], min(result_height, canvas.size[1])))
+
+
+def capture_full_page(driver, max_height = None, decode = True):
+    """
+    Takes full page screenshot without scrolling by DevTools Page.captureScreenshot
+    :param driver:      Web driver
+    :param max_height:  Maximum height of the page to capture, None for the whole page
+    :param decode:      Return PIL Image, otherwise PageCapture with base64 encoded PNG
+    :return:            PIL Image, PageCapture or None if DevTools command is not supported
+    """
+    metrics = execute_cdp(driver, 'Page.getLayoutMetrics')
+    if not metrics:
+        return None
+
+    width = metrics['layoutViewport']['clientWidth']
+    height = metrics['contentSize']['height']
+    if max_height is not None:
+        height = min(height, max_height)
+
+    result = execute_cdp(driver, 'Page.captureScreenshot', {
+        'format': 'png',
+        'captureBeyondViewport': True,
+        'clip': {'x': 0, 'y': 0, 'width': width, 'height': height, 'scale': 1}
+    })
+
+    if not result or 'data' not in result:
+        return None
+
+    capture = PageCapture([(0, result['data'])])
+    return capture.to_image() if decode else capture
+
+
+def capture_full_page_tiles(driver, scale = None, max_pages = 10, use_cdp = False):
+    """
+    Takes correct screenshot with scrolls and dynamic content.
+    Only browser work is done here, tiles are decoded later by PageCapture.to_image
     :param driver:       Web driver
-    :param output_file:  File to save screenshot
-    :param scale:        Screenshot width / page width
-                         Should be calculated using method get_scale(driver)
+    :param scale:        Screenshot width / page width, if None then get_scale(driver) is used
     :param max_pages:    Maximum pages to scroll (could be usefull for the infinite page). 
                          If max_pages < 0 then scrolls till the end or infinite time.
-                         
+    :param use_cdp:      Try to take screenshot by one DevTools command without scrolling
+    :return:             PageCapture
     """
-       
-    screens = []
-        
-    def save_screenshot():        
-        fd, path = tempfile.mkstemp(prefix='screenshot', suffix='.png')
-        os.close(fd)
-        driver.save_screenshot(path)
-        screens.append(path)
-        
-        return path
-    
+    if scale is None:
+        scale = get_scale(driver)
+
+    scroll_script = 'window.scrollBy(0, arguments[0]); ' + \
+                    'return [Math.max(document.documentElement.scrollTop, document.body.scrollTop), ' + \
+                    'document.body.parentNode.scrollHeight];'
+
     try:
         if hasattr(driver, 'active_frame') and driver.active_frame and driver.active_frame.is_need_to_exit():
             driver.switch_to_default_content()
 
         scroll_to_top(driver)
-        
-        # take screenshots
-        height = get_window_height(driver)
-        scrolled = height
-        save_screenshot()
-        
-        while scrolled < get_page_height(driver) and (max_pages < 0 or len(screens) < max_pages):
-            scroll(driver, 0, height)
+        height, page_height = driver.execute_script(
+            'return [window.innerHeight, document.body.parentNode.scrollHeight];')
+
+        max_height = None if max_pages < 0 else height * max_pages
+
+        if use_cdp:
+            capture = capture_full_page(driver, max_height, decode = False)
+            if capture is not None:
+                return capture
+
+        tiles = []
+        top = 0
+        bottom = 0
+        while True:
+            tiles.append((top, driver.get_screenshot_as_png()))
+            bottom = min(max(bottom, top + height), page_height)
+
+            if bottom >= page_height or (max_pages >= 0 and len(tiles) >= max_pages):
+                break
+
+            top, page_height = driver.execute_script(scroll_script, height)
+            if top + height <= bottom:
+                # Can't scroll anymore
+                break
+
             time.sleep(0.1)
-            save_screenshot()
-            
-            scrolled = min(scrolled + height, get_page_height(driver))
-            
-        # stitch images together
-        stiched = None
-        
-        y = 0
-        for i, screen in enumerate(screens):
-            img = Image.open(screen)
-             
-            w, h = img.size
-            if i == len(screens) - 1:
-                img = img.crop((0, h-(round(scale * scrolled)) % h, w, h))
-                w, h = img.size
-            
-            if h == 0 or w == 0:
-                continue
-                
-            if stiched is None:
-                stiched = Image.new('RGB', (w, round(scrolled * scale)))
-            
-            stiched.paste(img, (
-                0, # x0
-                y, # y0
-                w, # x1
-                y + h # y1
-            ))
-            y = y + h
-        
-        if stiched:
-            stiched.save(output_file)
-        
+
+        return PageCapture(tiles, scale, bottom)
+
     finally:
-        # cleanup
-        for screen in screens:
-            if os.path.isfile(screen):
-                os.remove(screen)
-        
         if hasattr(driver, 'active_frame') and driver.active_frame and driver.active_frame.is_need_to_exit():
             driver.switch_to.frame(driver.active_frame.frame)
-        
- 
-    return output_file
 
+
+def get_full_page_image(driver, scale = None, max_pages = 10, use_cdp = False):
+    """
+    Takes correct screenshot with scrolls and dynamic content.
+    Tiles are decoded in memory and stitched into one image
+    :param driver:       Web driver
+    :param scale:        Screenshot width / page width, if None then get_scale(driver) is used
+    :param max_pages:    Maximum pages to scroll (could be usefull for the infinite page). 
+                         If max_pages < 0 then scrolls till the end or infinite time.
+    :param use_cdp:      Try to take screenshot by one DevTools command without scrolling
+    :return:             PIL Image or None if page is empty
+    """
+    return capture_full_page_tiles(driver, scale, max_pages, use_cdp).to_image()
+
+
+def get_full_page_screenshot(driver, output_file, scale, max_pages = 10, use_cdp = False):
+    """
+    Takes correct screenshot with scrolls and dynamic content
+    :param driver:       Web driver
+    :param output_file:  File or file object to save screenshot
+    :param scale:        Screenshot width / page width
+                         Should be calculated using method get_scale(driver)
+    :param max_pages:    Maximum pages to scroll (could be usefull for the infinite page). 
+                         If max_pages < 0 then scrolls till the end or infinite time.
+    :param use_cdp:      Try to take screenshot by one DevTools command without scrolling
+    """
+    img = get_full_page_image(driver, scale, max_pages, use_cdp)
+    if img is not None:
+        img.save(output_file, format='PNG')
+
+    return output_file
@@ -45,6 +45,29 @@ def get_location(elem):
     
     return loc
 
+class ControlRef:
+    """
+    Reference to an element extracted by __tra_extractControls
+    """
+    def __init__(self, driver, page_id, index):
+        self.driver = driver
+        self.page_id = page_id
+        self.index = index
+
+    def call(self, function, *args):
+        script = 'return typeof {0} === "function" ? {0}.apply(null, arguments) : null'.format(function)
+        return self.driver.execute_script(script, self.index, self.page_id, *args)
+
+    def resolve(self):
+        return self.call('__tra_getControl')
+
+    def is_visible(self):
+        try:
+            return bool(self.call('__tra_isControlVisible'))
+        except WebDriverException:
+            return False
+
+
 class Control:
     def __init__(self, 
                  type, 
@@ -55,10 +78,18 @@ class Control:
                  max=None, 
                  code=None, 
                  label_elem = None,
-                 tooltip = None
+                 tooltip = None,
+                 rect = None,
+                 ref = None,
+                 html = None
                ):
+        """
+        :param rect:  Dict with x, y, width, height of the control together with it's label (from page snapshot)
+        :param ref:   ControlRef that is used to get WebElement if elem is None
+        :param html:  Outer html of the element (from page snapshot)
+        """
         self.type = type
-        self.elem = elem
+        self._elem = elem
         self.label = label
         self.values = values
         self.min = min
@@ -66,10 +97,95 @@ class Control:
         self.code = code
         self.label_elem = label_elem
         self.tooltip = tooltip
+        self._rect = rect
+        self._ref = ref
+        self._html = html
 
         if self.label_elem and not self.label_elem.is_displayed():
             self.label_elem = None
 
+    @property
+    def elem(self):
+        # WebElement is fetched only when it's needed (usually to apply an action)
+        if self._elem is None and self._ref is not None:
+            self._elem = self._ref.resolve()
+
+        return self._elem
+
+    def refresh_rect(self):
+        """
+        Reads current geometry of the control, it could change after scrolling or layout shift.
+        Rect from page snapshot is replaced by the live one, location and size are read from
+        the element if the rect can't be computed by page script
+        """
+        if self._rect is None:
+            return
+
+        rect = None
+        if self._ref is not None:
+            try:
+                rect = self._ref.call('__tra_getControlRect', self.type)
+            except WebDriverException:
+                rect = None
+
+        if rect is not None:
+            self._rect = {key: int(round(rect[key])) for key in ['x', 'y', 'width', 'height']}
+        elif self.elem is not None:
+            self._rect = None
+
+    def get_outer_html(self, live = False):
+        """
+        Outer html of the element, is taken from page snapshot without a WebDriver roundtrip if it's possible
+        :param live:  Read current html, for instance after an action was applied
+        """
+        if live:
+            return self.elem.get_attribute('outerHTML')
+
+        if self._html is None:
+            self._html = self.elem.get_attribute('outerHTML')
+
+        return self._html
+
+    @staticmethod
+    def from_snapshot(driver, page_id, item):
+        """
+        Creates Control from an item returned by __tra_extractControls
+        :param driver:   Web driver
+        :param page_id:  Id of the document where control was extracted
+        :param item:     Dict with type, rect, label, values, code, tooltip, html and index
+        :return:         Control
+        """
+        rect = {key: int(round(item['rect'][key])) for key in ['x', 'y', 'width', 'height']}
+
+        return Control(item['type'], None,
+                       label = item.get('label'),
+                       values = item.get('values'),
+                       code = item.get('code'),
+                       tooltip = item.get('tooltip'),
+                       rect = rect,
+                       ref = ControlRef(driver, page_id, item['index']),
+                       html = item.get('html')
+                      )
+
+    def is_visible(self):
+        """
+        Checks that control is still on the page and isn't covered by other elements
+        """
+        if self._ref is not None:
+            return self._ref.is_visible()
+
+        return not is_stale(self.elem) and is_visible(self.elem)
+
+    def get_selector(self):
+        """
+        Css selector of the control that could be used to find it again after page reload
+        """
+        if self._ref is not None:
+            return self._ref.call('__tra_getControlSelector')
+
+        add_scripts_if_need(self.elem.parent)
+        return self.elem.parent.execute_script('return __tra_getSelector(arguments[0])', self.elem)
+
     @staticmethod
     def get_right_bottom(elem):
        size = get_size(elem)
@@ -81,6 +197,9 @@ class Control:
 
     @property
     def location(self):
+        if self._rect is not None:
+            return {'x': self._rect['x'], 'y': self._rect['y']}
+
         loc = get_location(self.elem)
         if self.label_elem:
             loc_2 = get_location(self.label_elem)
@@ -91,6 +210,9 @@ class Control:
 
     @property
     def size(self):
+        if self._rect is not None:
+            return {'width': self._rect['width'], 'height': self._rect['height']}
+
         rb = Control.get_right_bottom(self.elem)
         if self.label_elem:
             rb2 = Control.get_right_bottom(self.label_elem)
@@ -125,6 +247,14 @@ class Control:
               )
 
     def __eq__(self, other):
+        # Element keeps it's index in all extractions of the same document
+        if self._ref is not None and other._ref is not None:
+            return (
+                self.type == other.type and
+                self._ref.page_id == other._ref.page_id and
+                self._ref.index == other._ref.index
+            )
+
         return (
                 self.type == other.type and
                 self.elem == other.elem
@@ -213,17 +343,28 @@ def execute_async(driver, script):
     return driver.execute_async_script(full_script)
 
 
+def get_live_location(element):
+    """
+    Current location of WebElement or Control, rect of Control from page snapshot is refreshed
+    """
+    if isinstance(element, Control):
+        element.refresh_rect()
+
+    return element.location
+
+
 def scroll_to_element(driver, element):
     last_scroll = driver.execute_script('return Math.max(document.documentElement.scrollTop, document.body.scrollTop);')
     # location could change during scrolling do it until it fixed
     for i in range(5):
-        y = element.location['y']
+        y = get_live_location(element)['y']
         scroll_to(driver, max(0, y - 300))
         scroll = driver.execute_script('return Math.max(document.documentElement.scrollTop, document.body.scrollTop);')
         if last_scroll == scroll:
             break
         
-    return (element.location['x'], element.location['y'] - scroll)
+    location = get_live_location(element)
+    return (location['x'], location['y'] - scroll)
     
 
 def extract_combobox_values(driver, element):
@@ -422,33 +563,32 @@ def gather_click_elements(driver):
 
 
 def extract_controls(driver):
-    select_elems = set(filter(is_visible, get_selects(driver)))
-    selects = list(map(Control.create_select, select_elems))
-
-    input_elems = set(filter(is_visible, get_inputs(driver)))
-    inputs = list(map(Control.create_input, input_elems))
-
-    button_elems = set(filter(is_visible, get_buttons(driver)))
-    buttons = list(map(Control.create_button, button_elems))
-
-    link_elems = set(filter(is_visible, get_links(driver)))
-    links = list(map(Control.create_link, link_elems))
-
-    checkbox_elems = set(filter(is_visible, get_checkboxes(driver)))
-    checkboxes = list(map(Control.create_checkbox, checkbox_elems))
-
-    radio_elems = set(filter(is_visible, get_radiobuttons(driver)))
-    radios = list(map(Control.create_radiobutton, radio_elems))
+    """
+    Extracts all visible controls from the current frame by one call to the browser
+    :param driver:  Web driver
+    :return:        List of Controls, WebElements are resolved only on demand
+    """
+    add_scripts_if_need(driver)
+    snapshot = driver.execute_script('return __tra_extractControls()')
 
-    all_elems = select_elems | input_elems | button_elems | link_elems | checkbox_elems | radio_elems
-    all_clickable = set(filter(is_visible, gather_click_elements(driver)))
-    clickable_elems = all_clickable.difference(all_elems)
+    page_id = snapshot['pageId']
+    return [Control.from_snapshot(driver, page_id, item) for item in snapshot['controls']]
 
-    clickable = list(map(Control.create_button, clickable_elems))
 
-    controls = (selects + inputs + buttons + links + checkboxes + radios + clickable)
+def find_control(driver, selector, type):
+    """
+    Finds visible control in the current frame by css selector
+    :param driver:    Web driver
+    :param selector:  Css selector returned by Control.get_selector
+    :param type:      Type of the control
+    :return:          Control or None if there is no visible element for selector
+    """
+    add_scripts_if_need(driver)
+    snapshot = driver.execute_script('return __tra_findControl(arguments[0], arguments[1])', selector, type)
+    if not snapshot:
+        return None
 
-    return list(set(controls))
+    return Control.from_snapshot(driver, snapshot['pageId'], snapshot['controls'][0])
 
 
 def normalize_url(url):
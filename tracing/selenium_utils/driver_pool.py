@@ -0,0 +1,284 @@
+import os
+import logging
+import threading
+import traceback
+from queue import Queue, Empty
+from contextlib import contextmanager
+
+from tracing.selenium_utils.common import *
+from tracing.selenium_utils.navigation import read_network_events, get_origin
+
+
+def get_process_tree_rss(pid):
+    """
+    Calculates resident memory of the process and all it's children
+    :param pid:  Process id
+    :return:     RSS in megabytes or 0 if it can't be calculated (not Linux)
+    """
+    page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+    rss = 0
+    to_visit = [pid]
+    while to_visit:
+        pid = to_visit.pop()
+        try:
+            with open('/proc/{}/statm'.format(pid)) as f:
+                rss += int(f.read().split()[1]) * page_size
+
+            for task in os.listdir('/proc/{}/task'.format(pid)):
+                with open('/proc/{}/task/{}/children'.format(pid, task)) as f:
+                    to_visit.extend(int(child) for child in f.read().split())
+        except (IOError, OSError, ValueError):
+            continue
+
+    return rss / (1024 * 1024)
+
+
+class DriverPool:
+    """
+    Pool of warm Chrome drivers that are reused between traces.
+    Drivers state (cookies, storage, tabs) is reset between leases
+    """
+
+    def __init__(self,
+                 size = 1,
+                 chrome_path = '/usr/bin/chromedriver',
+                 headless = True,
+                 window_size = None,
+                 page_load_timeout = 60,
+                 max_uses = 50,
+                 max_rss_mb = 2048,
+                 warm = True
+                ):
+        """
+        :param size:               Maximum number of drivers in pool
+        :param chrome_path:        Path to chrome driver
+        :param headless:           Wheather to start drivers in headless mode
+        :param window_size:        Tuple of window size or None for maximized window
+        :param page_load_timeout:  Default page load timeout in seconds
+        :param max_uses:           Driver is recycled after this number of leases
+        :param max_rss_mb:         Driver is recycled if Chrome uses more memory (in Mb)
+        :param warm:               Launch all drivers at start
+        """
+        assert size >= 1, "Pool size should be at least 1 while got {}".format(size)
+
+        self.size = size
+        self.chrome_path = chrome_path
+        self.headless = headless
+        self.window_size = window_size
+        self.page_load_timeout = page_load_timeout
+        self.max_uses = max_uses
+        self.max_rss_mb = max_rss_mb
+
+        self._idle = Queue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._uses = {}
+        self._closed = False
+        self._logger = logging.getLogger('shop_tracer')
+
+        if warm:
+            for _ in range(size):
+                self._reserve()
+                self._idle.put(self._create())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    @staticmethod
+    def from_config(config, **kwargs):
+        """
+        Creates DriverPool from section [driver_pool] of config
+        :param config:  ConfigParser
+        :param kwargs:  Parameters that override config values
+        """
+        params = dict(
+            size = config.getint('driver_pool', 'size', fallback=1),
+            max_uses = config.getint('driver_pool', 'max_uses', fallback=50),
+            max_rss_mb = config.getint('driver_pool', 'max_rss_mb', fallback=2048),
+            page_load_timeout = config.getint('driver_pool', 'page_load_timeout', fallback=60),
+            headless = config.getboolean('driver_pool', 'headless', fallback=True)
+        )
+        params.update(kwargs)
+
+        return DriverPool(**params)
+
+    def _reserve(self):
+        with self._lock:
+            if self._created >= self.size:
+                return False
+
+            self._created += 1
+            return True
+
+    def _create(self):
+        try:
+            driver = create_chrome_driver(self.chrome_path, self.headless, self.window_size, network_log = True)
+            driver.set_page_load_timeout(self.page_load_timeout)
+        except:
+            with self._lock:
+                self._created -= 1
+            raise
+
+        self._uses[id(driver)] = 0
+        return driver
+
+    def _destroy(self, driver):
+        self._uses.pop(id(driver), None)
+        with self._lock:
+            self._created -= 1
+
+        try:
+            driver.quit()
+        except:
+            self._logger.debug('Unexpected exception during quit driver {}'.format(traceback.format_exc()))
+
+    def acquire(self, timeout = None):
+        """
+        Takes driver from pool or launches new one if pool isn't full
+        :param timeout:  Seconds to wait for a free driver, None to wait forever
+        :return:         Web driver
+        """
+        assert not self._closed, "Driver pool is closed"
+
+        try:
+            driver = self._idle.get_nowait()
+        except Empty:
+            if self._reserve():
+                driver = self._create()
+            else:
+                driver = self._idle.get(timeout = timeout)
+
+        self._uses[id(driver)] += 1
+        driver.set_page_load_timeout(self.page_load_timeout)
+        return driver
+
+    def release(self, driver, broken = False):
+        """
+        Returns driver to pool. Driver is recycled if it's broken or worn out
+        :param driver:  Web driver that was taken by acquire
+        :param broken:  True if driver is in unknown state (for instance it hangs)
+        """
+        if self._closed:
+            self._destroy(driver)
+            return
+
+        if not broken and self.need_recycle(driver):
+            self._logger.info('recycling driver after {} uses'.format(self._uses.get(id(driver))))
+            broken = True
+
+        if not broken:
+            broken = not self.reset(driver)
+
+        if broken:
+            self._destroy(driver)
+            if self._reserve():
+                try:
+                    driver = self._create()
+                except:
+                    self._logger.exception('Cannot launch driver')
+                    return
+            else:
+                return
+
+        self._idle.put(driver)
+
+    @contextmanager
+    def lease(self, timeout = None):
+        """
+        Context manager that acquires driver and returns it back to pool
+        """
+        driver = self.acquire(timeout)
+        broken = False
+        try:
+            yield driver
+        except WebDriverException:
+            broken = True
+            raise
+        finally:
+            self.release(driver, broken)
+
+    def need_recycle(self, driver):
+        if self._uses.get(id(driver), 0) >= self.max_uses:
+            return True
+
+        if self.max_rss_mb:
+            try:
+                pid = driver.service.process.pid
+            except AttributeError:
+                return False
+
+            return get_process_tree_rss(pid) > self.max_rss_mb
+
+        return False
+
+    def reset(self, driver):
+        """
+        Clears cookies, storages and closes extra tabs
+        :param driver:  Web driver
+        :return:        True if driver state was successfully reset
+        """
+        try:
+            close_alert_if_appeared(driver)
+            handles = list(driver.window_handles)
+            for handle in handles[1:]:
+                driver.switch_to_window(handle)
+                driver.close()
+
+            driver.switch_to_window(handles[0])
+            driver.switch_to.default_content()
+
+            # Reading performance log adds origins of the latest documents to driver.visited_origins
+            read_network_events(driver)
+            origins = set(getattr(driver, 'visited_origins', None) or [])
+            current_origin = get_origin(get_url(driver))
+            if current_origin:
+                origins.add(current_origin)
+
+            # Session storage isn't covered by Storage.clearDataForOrigin
+            try:
+                driver.execute_script('window.localStorage.clear(); window.sessionStorage.clear();')
+            except WebDriverException:
+                pass
+
+            if execute_cdp(driver, 'Network.clearBrowserCookies') is None:
+                driver.delete_all_cookies()
+
+            # Local storage, IndexedDB, cache storage and service workers of every visited origin
+            for origin in origins:
+                execute_cdp(driver, 'Storage.clearDataForOrigin', {'origin': origin, 'storageTypes': 'all'})
+
+            driver.get('about:blank')
+
+            # Next lease could have another blocking profile or no profile at all
+            if getattr(driver, 'blocking_profile', None) is not None:
+                execute_cdp(driver, 'Network.setBlockedURLs', {'urls': []})
+
+            # Performance log is kept by chromedriver until it's read
+            read_network_events(driver)
+
+            for attr in ['active_frame', 'page_snapshot', 'navigation', 'blocking_profile', 'deadline',
+                         'visited_origins', 'pending_requests', 'network_activity']:
+                if hasattr(driver, attr):
+                    delattr(driver, attr)
+
+            return True
+        except:
+            self._logger.debug('Cannot reset driver {}'.format(traceback.format_exc()))
+            return False
+
+    def close(self):
+        """
+        Quits all idle drivers, leased drivers are quit on release
+        """
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except Empty:
+                break
+
+            self._destroy(driver)
@@ -0,0 +1,213 @@
+import json
+import time
+import logging
+from urllib.parse import urlparse
+
+from selenium.common.exceptions import TimeoutException
+from tracing.selenium_utils.common import *
+
+
+class NavigationResult:
+    """
+    Result of the main document navigation captured from the browser
+    """
+
+    def __init__(self, url, status = None, final_url = None, redirects = None,
+                 elapsed = None, ttfb = None, error = None, timed_out = False):
+        """
+        :param url:        Requested url
+        :param status:     HTTP status of the main document, None if it's unknown
+        :param final_url:  Url of the main document after redirects
+        :param redirects:  List of tuples (url, status) of redirects
+        :param elapsed:    Seconds spent for navigation
+        :param ttfb:       Seconds from request start till response headers were received
+        :param error:      Network error text, for instance net::ERR_NAME_NOT_RESOLVED
+        :param timed_out:  True if page wasn't loaded during page load timeout
+        """
+        self.url = url
+        self.status = status
+        self.final_url = final_url
+        self.redirects = redirects or []
+        self.elapsed = elapsed
+        self.ttfb = ttfb
+        self.error = error
+        self.timed_out = timed_out
+
+    @property
+    def is_error(self):
+        return self.error is not None or (self.status is not None and self.status >= 400)
+
+    def __str__(self):
+        return 'Navigation to {}: status {}, final url {}, elapsed {}, error {}'.format(
+            self.url, self.status, self.final_url, self.elapsed, self.error)
+
+
+def get_origin(url):
+    """
+    :return:  Origin scheme://host[:port] of http(s) url or None
+    """
+    parsed = urlparse(url or '')
+    if parsed.scheme not in ['http', 'https'] or not parsed.netloc:
+        return None
+
+    return '{}://{}'.format(parsed.scheme, parsed.netloc)
+
+
+def track_origins(driver, events):
+    """
+    Adds origins of loaded documents (pages and frames) to driver.visited_origins,
+    they are used to clear storages when driver is reused
+    """
+    origins = getattr(driver, 'visited_origins', None)
+    if origins is None:
+        origins = set()
+        driver.visited_origins = origins
+
+    for event in events:
+        params = event.get('params', {})
+        if event['method'] == 'Network.requestWillBeSent' and params.get('type') == 'Document':
+            origin = get_origin(params.get('request', {}).get('url'))
+            if origin:
+                origins.add(origin)
+
+
+def track_requests(driver, events):
+    """
+    Keeps requests that are in flight in driver.pending_requests (requestId -> time it was seen)
+    and time of the latest network event in driver.network_activity, they are used by wait_settled.
+    Unlike requests tracked in page, it includes requests started before scripts were injected
+    """
+    pending = getattr(driver, 'pending_requests', None)
+    if pending is None:
+        pending = {}
+        driver.pending_requests = pending
+
+    if not events:
+        return
+
+    now = time.time()
+    for event in events:
+        params = event.get('params', {})
+        method = event['method']
+        request_id = params.get('requestId')
+
+        if method == 'Network.requestWillBeSent':
+            # Redirect is sent with the same requestId, request stays in flight
+            if not params.get('request', {}).get('url', '').startswith('data:'):
+                pending.setdefault(request_id, now)
+
+        elif method in ['Network.loadingFinished', 'Network.loadingFailed']:
+            pending.pop(request_id, None)
+
+    driver.network_activity = now
+
+
+def read_network_events(driver):
+    """
+    Reads and clears Network events from performance log
+    :return:  List of events (dicts with method and params) or None if log isn't enabled
+    """
+    if not getattr(driver, 'network_log', False):
+        return None
+
+    try:
+        entries = driver.get_log('performance')
+    except WebDriverException:
+        return None
+
+    events = []
+    for entry in entries:
+        message = json.loads(entry['message']).get('message', {})
+        if message.get('method', '').startswith('Network.'):
+            events.append(message)
+
+    track_origins(driver, events)
+    track_requests(driver, events)
+    return events
+
+
+def parse_navigation(result, events):
+    """
+    Fills result by events of the first Document request
+    """
+    request_id = None
+    for event in events:
+        params = event.get('params', {})
+        method = event['method']
+
+        if method == 'Network.requestWillBeSent' and params.get('type') == 'Document':
+            if request_id is None:
+                request_id = params['requestId']
+
+            if params['requestId'] == request_id and 'redirectResponse' in params:
+                redirect = params['redirectResponse']
+                result.redirects.append((redirect.get('url'), redirect.get('status')))
+
+        if request_id is None or params.get('requestId') != request_id:
+            continue
+
+        if method == 'Network.responseReceived':
+            response = params.get('response', {})
+            result.status = response.get('status')
+            result.final_url = response.get('url')
+
+            timing = response.get('timing')
+            if timing and timing.get('receiveHeadersEnd') is not None:
+                result.ttfb = timing['receiveHeadersEnd'] / 1000.
+
+        elif method == 'Network.loadingFailed' and not params.get('canceled'):
+            result.error = params.get('errorText') or 'loading failed'
+
+
+def get_navigation_entry_status(driver):
+    # Navigation Timing has responseStatus only in the latest Chrome versions
+    try:
+        return driver.execute_script(
+            'var e = performance.getEntriesByType("navigation")[0]; return e && e.responseStatus || null;')
+    except WebDriverException:
+        return None
+
+
+def navigate(driver, url, timeout = None):
+    """
+    Opens url and captures the main document response from the browser.
+    Result is also available as driver.navigation
+    :param driver:   Web driver
+    :param url:      Url to open
+    :param timeout:  Page load timeout in seconds, current driver timeout is used if None
+    :return:         NavigationResult
+    """
+    result = NavigationResult(url)
+
+    # Drop events of previous pages
+    read_network_events(driver)
+
+    if timeout is not None:
+        driver.set_page_load_timeout(timeout)
+
+    start = time.time()
+    try:
+        driver.get(url)
+    except TimeoutException:
+        result.timed_out = True
+
+    result.elapsed = time.time() - start
+
+    events = read_network_events(driver)
+    if events:
+        parse_navigation(result, events)
+    elif not result.timed_out:
+        result.status = get_navigation_entry_status(driver)
+
+    current_url = get_url(driver)
+    if current_url and current_url.startswith('chrome-error://') and result.error is None:
+        result.error = 'chrome error page'
+
+    if result.final_url is None:
+        result.final_url = current_url
+
+    logger = logging.getLogger('shop_tracer')
+    logger.info(str(result))
+
+    driver.navigation = result
+    return result
@@ -0,0 +1,219 @@
+import sys
+import json
+import time
+from collections import namedtuple
+
+
+CommandRecord = namedtuple('CommandRecord', ['command', 'time', 'size', 'handler', 'state', 'frame'])
+
+
+def get_payload_size(value, depth = 3):
+    """
+    Approximate size of command parameters or response
+    """
+    if value is None:
+        return 0
+
+    if isinstance(value, (str, bytes)):
+        return len(value)
+
+    if depth <= 0:
+        return 8
+
+    if isinstance(value, dict):
+        return sum(len(str(key)) + get_payload_size(item, depth - 1) for key, item in value.items())
+
+    if isinstance(value, (list, tuple)):
+        return sum(get_payload_size(item, depth - 1) for item in value)
+
+    return 8
+
+
+def add_to_group(groups, key, elapsed, size, count = 1):
+    group = groups.get(key)
+    if group is None:
+        group = {'count': 0, 'time': 0., 'size': 0}
+        groups[key] = group
+
+    group['count'] += count
+    group['time'] += elapsed
+    group['size'] += size
+
+
+class CommandProfiler:
+    """
+    Records every WebDriver command together with handler, state and frame that issued it
+    """
+
+    def __init__(self, keep_records = False):
+        """
+        :param keep_records:  Keep every CommandRecord in records, otherwise only aggregates are collected
+        """
+        self.keep_records = keep_records
+        self.reset()
+
+    def reset(self):
+        self.handler = None
+        self.state = None
+        self.records = []
+        self.commands = 0
+        self.time = 0.
+        self.size = 0
+        self.by_command = {}
+        self.by_handler = {}
+        self.by_state = {}
+        self.by_frame = {}
+
+    def set_context(self, state = None, handler = None):
+        self.state = state
+        self.handler = handler
+
+    def record(self, command, elapsed, size, frame):
+        handler = self.handler or 'none'
+        state = str(self.state) if self.state is not None else 'none'
+
+        if self.keep_records:
+            self.records.append(CommandRecord(command, elapsed, size, handler, state, frame))
+
+        self.commands += 1
+        self.time += elapsed
+        self.size += size
+
+        add_to_group(self.by_command, command, elapsed, size)
+        add_to_group(self.by_handler, handler, elapsed, size)
+        add_to_group(self.by_state, state, elapsed, size)
+        add_to_group(self.by_frame, frame, elapsed, size)
+
+    def summary(self):
+        """
+        Returns per trace aggregates that could be saved together with trace
+        """
+        return {
+            'commands': self.commands,
+            'time': self.time,
+            'size': self.size,
+            'by_command': self.by_command,
+            'by_handler': self.by_handler,
+            'by_state': self.by_state,
+            'by_frame': self.by_frame
+        }
+
+
+def get_frame_name(driver):
+    frame = getattr(driver, 'active_frame', None)
+    if frame is None or frame.frame is None:
+        return 'main'
+
+    return getattr(frame, 'url', None) or 'frame'
+
+
+def install_profiler(driver, keep_records = False):
+    """
+    Wraps driver commands execution to record them by CommandProfiler.
+    If profiler has already been installed it's reset
+    :param driver:        Web driver
+    :param keep_records:  Keep every command record
+    :return:              CommandProfiler that is available also as driver.profiler
+    """
+    profiler = getattr(driver, 'profiler', None)
+    if profiler is not None:
+        profiler.reset()
+        profiler.keep_records = keep_records
+        return profiler
+
+    profiler = CommandProfiler(keep_records)
+    execute = driver.execute
+
+    def profiled_execute(command, params = None):
+        start = time.time()
+        response = None
+        try:
+            response = execute(command, params)
+            return response
+        finally:
+            size = get_payload_size(params)
+            if isinstance(response, dict):
+                size += get_payload_size(response.get('value'))
+
+            profiler.record(command, time.time() - start, size, get_frame_name(driver))
+
+    driver.execute = profiled_execute
+    driver.profiler = profiler
+
+    return profiler
+
+
+def set_profiler_context(driver, state = None, handler = None):
+    """
+    Sets state and handler that are attributed to the next commands
+    """
+    profiler = getattr(driver, 'profiler', None) if driver is not None else None
+    if profiler is not None:
+        profiler.set_context(state, handler)
+
+
+def merge_summaries(summaries):
+    """
+    Merges summaries of several traces
+    :param summaries:  List of CommandProfiler.summary() dicts
+    :return:           Summary with the same structure
+    """
+    result = {'commands': 0, 'time': 0., 'size': 0,
+              'by_command': {}, 'by_handler': {}, 'by_state': {}, 'by_frame': {}}
+
+    for summary in summaries:
+        if not summary:
+            continue
+
+        for key in ['commands', 'time', 'size']:
+            result[key] += summary.get(key, 0)
+
+        for key in ['by_command', 'by_handler', 'by_state', 'by_frame']:
+            for name, group in summary.get(key, {}).items():
+                add_to_group(result[key], name, group['time'], group['size'], group['count'])
+
+    result['traces'] = len([summary for summary in summaries if summary])
+    return result
+
+
+def export_summary(summaries, output = None, top = 10):
+    """
+    Prints top commands, top handlers and roundtrips per state for traces
+    :param summaries:  List of CommandProfiler.summary() dicts
+    :param output:     File object to write, stdout by default
+    :param top:        Number of top commands and handlers to print
+    :return:           Merged summary
+    """
+    output = output or sys.stdout
+    summary = merge_summaries(summaries)
+    traces = max(summary['traces'], 1)
+
+    output.write('traces: {}, commands: {}, time: {:.1f}s, payload: {:.1f}Mb\n'.format(
+        summary['traces'], summary['commands'], summary['time'], summary['size'] / (1024 * 1024)))
+
+    tables = [('top commands', 'by_command', top),
+              ('top handlers', 'by_handler', top),
+              ('roundtrips per state', 'by_state', None)]
+
+    for title, key, limit in tables:
+        groups = sorted(summary[key].items(), key = lambda p: -p[1]['time'])
+        if limit:
+            groups = groups[:limit]
+
+        output.write('\n{:<50} {:>10} {:>10} {:>12}\n'.format(title, 'count', 'time, s', 'per trace'))
+        for name, group in groups:
+            output.write('{:<50} {:>10} {:>10.1f} {:>12.1f}\n'.format(
+                str(name)[:50], group['count'], group['time'], group['count'] / traces))
+
+    return summary
+
+
+if __name__ == '__main__':
+    # Prints summary of profiles from FileTraceLogger results files
+    profiles = []
+    for results_file in sys.argv[1:]:
+        with open(results_file) as f:
+            for line in f:
+                profiles.append(json.loads(line).get('profile'))
+
+    export_summary(profiles)
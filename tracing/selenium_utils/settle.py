@@ -0,0 +1,84 @@
+import time
+import logging
+import traceback
+
+from tracing.selenium_utils.controls import *
+from tracing.selenium_utils.navigation import read_network_events
+from tracing.deadline import check_deadline
+
+
+# Requests that are in flight longer (long polling, streams) don't prevent page from settling
+long_request = 10
+
+# Seconds between checks of network and page activity
+poll_interval = 0.1
+
+
+def is_network_idle(driver, quiet):
+    """
+    Checks by Network events from performance log that no request is in flight and network was quiet.
+    Reading the log also keeps chromedriver from buffering it during long traces
+    :param quiet:  Seconds without network events
+    :return:       True or False, None if performance log isn't available
+    """
+    if read_network_events(driver) is None:
+        return None
+
+    now = time.time()
+    pending = [seen for seen in driver.pending_requests.values() if now - seen < long_request]
+    return not pending and now - getattr(driver, 'network_activity', 0) >= quiet
+
+
+def wait_settled(driver, timeout = 5, quiet = 0.5, min_wait = 0):
+    """
+    Waits until page is loaded, requests of the page are finished and DOM has stopped mutating.
+    Requests in flight are taken from Network events of performance log, so requests started
+    before scripts were injected (document subresources) are also awaited.
+    Replaces fixed sleeps after actions: returns as soon as page is settled but not later than timeout
+    :param driver:    Web driver
+    :param timeout:   Hard cap in seconds
+    :param quiet:     Seconds without DOM mutations and network activity
+    :param min_wait:  Seconds that are always waited before settle detection, lets timers on page fire
+    :return:          True if page is settled and False if timeout is reached
+    """
+    # Waiting is limited by the trace time budget
+    check_deadline(driver)
+    trace_deadline = getattr(driver, 'deadline', None)
+    if trace_deadline is not None:
+        timeout = trace_deadline.cap(timeout)
+
+    deadline = time.time() + timeout
+
+    if min_wait > 0:
+        time.sleep(min(min_wait, timeout))
+
+    while True:
+        left = deadline - time.time()
+        if left <= 0:
+            return False
+
+        try:
+            add_scripts_if_need(driver)
+
+            network_idle = is_network_idle(driver, quiet)
+            if network_idle is None:
+                # Without performance log only requests started by page scripts after injection are seen
+                driver.set_script_timeout(max(30, left + 1))
+                script = 'var done = arguments[arguments.length - 1];' + \
+                         '__tra_waitSettled({}, {}).then(done);'.format(int(quiet * 1000), int(left * 1000))
+                return bool(driver.execute_async_script(script))
+
+            if network_idle and driver.execute_script('return __tra_isSettled({}, false)'.format(int(quiet * 1000))):
+                return True
+
+            time.sleep(min(poll_interval, max(0, deadline - time.time())))
+
+        except UnexpectedAlertPresentException:
+            # Page waits for the user, there is nothing to wait for
+            return False
+
+        except WebDriverException:
+            # Document was unloaded during waiting (navigation), wait for the new one
+            logger = logging.getLogger('shop_tracer')
+            logger.debug('page was changed during waiting {}'.format(traceback.format_exc()))
+            time.sleep(min(0.2, max(0, deadline - time.time())))
@@ -0,0 +1,64 @@
+from tracing.selenium_utils.controls import *
+
+
+class PageSnapshot:
+    """
+    Elements of the page that are fetched by one call per section and reused by heuristics
+    until the document or it's DOM (tracked by MutationObserver epoch) is changed
+    """
+
+    sections = ['links', 'buttons', 'checks', 'errors', 'texts']
+
+    def __init__(self, driver, max_pages = 16):
+        """
+        :param driver:     Web driver
+        :param max_pages:  Maximum number of documents (pages or frames) to keep in cache
+        """
+        self.driver = driver
+        self.max_pages = max_pages
+        self._cache = {section: {} for section in PageSnapshot.sections}
+
+    def get(self, section):
+        """
+        Returns items of the section for the current document
+        :param section:  One of PageSnapshot.sections
+        :return:         List of dicts, every dict contains WebElement as 'elem'
+        """
+        assert section in PageSnapshot.sections, "unknown snapshot section {}".format(section)
+
+        cache = self._cache[section]
+        known = {page_id: epoch for page_id, (epoch, _) in cache.items()}
+
+        script = 'return typeof __tra_snapshot === "function" ? __tra_snapshot(arguments[0], arguments[1]) : null'
+        result = self.driver.execute_script(script, section, known)
+        if result is None:
+            add_scripts_if_need(self.driver)
+            result = self.driver.execute_script(script, section, known)
+
+        page_id = result['pageId']
+        if result['items'] is None:
+            return cache[page_id][1]
+
+        if page_id not in cache and len(cache) >= self.max_pages:
+            cache.pop(next(iter(cache)))
+
+        cache[page_id] = (result['epoch'], result['items'])
+        return result['items']
+
+    def clear(self):
+        for section in PageSnapshot.sections:
+            self._cache[section].clear()
+
+
+def get_page_snapshot(driver):
+    """
+    Returns PageSnapshot that is bound to the driver
+    :param driver:  Web driver
+    :return:        PageSnapshot
+    """
+    snapshot = getattr(driver, 'page_snapshot', None)
+    if snapshot is None:
+        snapshot = PageSnapshot(driver)
+        driver.page_snapshot = snapshot
+
+    return snapshot
@@ -1,13 +1,16 @@
 import logging
 import traceback
 from abc import abstractmethod
-import requests
 import selenium
 import sys
 
 from tracing.common_heuristics import *
 from tracing.selenium_utils.common import *
 from tracing.status import *
+from tracing.selenium_utils.navigation import navigate
+from tracing.selenium_utils.profiler import install_profiler, set_profiler_context
+from tracing.selenium_utils.checkpoint import CheckpointHistory
+from tracing.deadline import Deadline, DeadlineExceeded, check_deadline
 
 
 class States:
@@ -24,7 +27,7 @@ class States:
 
 
 class TraceContext:
-    def __init__(self, domain, user_info, payment_info, delaying_time, tracer):
+    def __init__(self, domain, user_info, payment_info, delaying_time, tracer, deadline = None):
         self.user_info = user_info
         self.payment_info = payment_info
         self.domain = domain
@@ -34,6 +37,7 @@ class TraceContext:
         self.state = None
         self.url = None
         self.delaying_time = delaying_time
+        self.deadline = deadline or Deadline()
         self.is_started = False
 
     @property
@@ -64,6 +68,10 @@ class TraceContext:
             return
         
         self.log_step(None, 'finished')
+
+        profiler = getattr(self.driver, 'profiler', None)
+        if profiler is not None:
+            self.trace.set_profile(profiler.summary())
         
         self.trace_logger.save(self.trace, status)
         self.trace = None
@@ -111,7 +119,11 @@ class ShopTracer:
                  chrome_path='/usr/bin/chromedriver',
                  headless=False,
                  # Must be an instance of ITraceSaver
-                 trace_logger = None
+                 trace_logger = None,
+                 driver_pool = None,
+                 profile = False,
+                 replay_store = None,
+                 blocking = None
                  ):
         """
         :param get_user_data: Function that should return tuple (user_data.UserInfo, user_data.PaymentInfo)
@@ -119,6 +131,11 @@ class ShopTracer:
         :param chrome_path:   Path to chrome driver
         :param headless:      Wheather to start driver in headless mode
         :param trace_logger:  ITraceLogger instance that could store snapshots and source code during tracing
+        :param driver_pool:   DriverPool to take drivers from, if None then driver is launched for every attempt
+        :param profile:       Record WebDriver commands and save their aggregates with trace
+        :param replay_store:  ReplayStore to record winning paths and replay them for the same domains
+        :param blocking:      BlockingProfile of resources that aren't loaded,
+                              use profile with fidelity to save realistic screenshots
         """
         self._handlers = []
         self._get_user_data = get_user_data
@@ -127,14 +144,32 @@ class ShopTracer:
         self._headless = headless
         self._driver = None
         self._trace_logger = trace_logger
+        self._driver_pool = driver_pool
+        self._profile = profile
+        self._replay_store = replay_store
+        self._replay_steps = []
+        self._blocking = blocking
+
+        # Deepest checkpoint of the current trace and recorded path that led to it
+        self._checkpoints = CheckpointHistory()
 
     def __enter__(self):
         pass
     
     def __exit__(self, type, value, traceback):
-        if self._driver:
+        self.release_driver()
+
+    def release_driver(self):
+        if not self._driver:
+            return
+
+        if self._driver_pool:
+            self._driver_pool.release(self._driver)
+        else:
             self._driver.quit()
 
+        self._driver = None
+
     def add_handler(self, actor, priority=1):
         assert priority >= 1 and priority <= 10, \
             "Priority should be between 1 and 10 while got {}".format(priority)
@@ -148,28 +183,36 @@ class ShopTracer:
     
     @staticmethod
     def get(driver, url, timeout=10):
-        try:
-            driver.get(url)
-            response = requests.get(url, verify=False, timeout=timeout)
-            code = response.status_code
-            if code >= 400:
-                return RequestError(code)
-            
-            return None
-        
-        except selenium.common.exceptions.TimeoutException:
-            return Timeout(timeout)
-            
-        except requests.exceptions.ConnectionError:
-            return NotAvailable(url)
+        """
+        Opens url, response status is taken from the browser (available as driver.navigation)
+        :return:  ITraceStatus if page can't be loaded or None
+        """
+        navigation = navigate(driver, url, timeout)
+        return get_navigation_status(navigation, timeout)
+
+    def save_status(self, domain, status):
+        """
+        Saves trace without steps for domain that wasn't traced, for instance rejected by DomainProber
+        """
+        if self._trace_logger:
+            trace = self._trace_logger.start_new(domain)
+            self._trace_logger.save(trace, status)
 
     def get_driver(self, timeout=60):
-        if self._driver:
-            self._driver.quit()
+        self.release_driver()
 
-        driver = create_chrome_driver(self._chrome_path, self._headless)
+        if self._driver_pool:
+            driver = self._driver_pool.acquire()
+        else:
+            driver = create_chrome_driver(self._chrome_path, self._headless, network_log = True)
         driver.set_page_load_timeout(timeout)
 
+        if self._blocking:
+            self._blocking.apply(driver)
+
+        if self._profile:
+            install_profiler(driver)
+
         self._driver = driver
 
         return driver
@@ -186,6 +229,7 @@ class ShopTracer:
         self._logger.info('processing state: {}'.format(state))
 
         for priority, handler in handlers:
+            check_deadline(driver)
             frames = get_frames(driver)
                 
             if len(frames) > 1 and state == States.new:
@@ -200,8 +244,10 @@ class ShopTracer:
                     break
 
                 frame = frames[i]
+                check_deadline(driver)
 
                 with Frame(driver, frame):
+                    set_profiler_context(driver, state, type(handler).__name__)
                     self._logger.info('handler {}'.format(handler))
                     new_state = handler.act(driver, state, context)
                     close_alert_if_appeared(self._driver)
@@ -212,25 +258,142 @@ class ShopTracer:
                     context.on_handler_finished(new_state, handler)            
 
                     if new_state != state:
+                        self.record_step(driver, state, handler, i, new_state)
                         return new_state
 
         return state
 
-    def trace(self, domain, wait_response_seconds = 60, attempts = 3, delaying_time = 10):
+    def record_step(self, driver, state, handler, frame_idx, new_state):
+        self._replay_steps.append({
+            'state': state,
+            'handler': type(handler).__name__,
+            'frame': frame_idx,
+            'url': get_url(driver),
+            'new_state': new_state
+        })
+
+    def replay_step(self, driver, step, state, context):
+        """
+        Runs only the handler that made the transition in the recorded path in the recorded frame
+        :return:  New state, it's equal to step['new_state'] if step is replayed successfully
+        """
+        handlers = [handler for _, handler in self._handlers if type(handler).__name__ == step['handler']]
+        if not handlers:
+            return state
+
+        handler = handlers[0]
+        try:
+            close_alert_if_appeared(driver)
+            if not handler.can_handle(driver, state, context):
+                return state
+
+            frames = get_frames(driver)
+            if step['frame'] >= len(frames):
+                return state
+
+            with Frame(driver, frames[step['frame']]):
+                set_profiler_context(driver, state, type(handler).__name__)
+                new_state = handler.act(driver, state, context)
+                close_alert_if_appeared(driver)
+                context.on_handler_finished(new_state, handler)
+        except DeadlineExceeded:
+            raise
+        except:
+            self._logger.debug('Unexpected exception during replay {}'.format(traceback.format_exc()))
+            return state
+
+        if new_state != state:
+            self.record_step(driver, state, handler, step['frame'], new_state)
+
+        return new_state
+
+    def replay(self, driver, domain, state, context):
+        """
+        Replays path recorded by previous traces of the domain until the first step that diverges
+        :return:  Reached state, heuristics continue from it
+        """
+        steps = self._replay_store.get_path(domain, 'shop_tracer') if self._replay_store else None
+        if not steps:
+            return state
+
+        self._logger.info('replaying {} steps for {}'.format(len(steps), domain))
+        diverged = None
+        for i, step in enumerate(steps):
+            if step['state'] != state:
+                diverged = i
+                break
+
+            state = self.replay_step(driver, step, state, context)
+            if state != step['new_state']:
+                diverged = i
+                break
+
+        self._replay_store.report_replay(domain, 'shop_tracer', diverged)
+        return state
+
+    def save_checkpoint(self, driver, state):
+        """
+        Saves browser state if state is deeper than the saved checkpoints
+        """
+        if state in [States.new, States.purchased]:
+            return
+
+        self._checkpoints.save(driver, state, States.states.index(state), self._replay_steps)
+
+    def resume(self, driver, state, context):
+        """
+        Restores the deepest checkpoint of previous attempts that hasn't led to a dead end
+        :return:  State of the checkpoint or the current state if there is nothing to restore
+        """
+        restored = self._checkpoints.restore(driver)
+        if restored is None:
+            return state
+
+        checkpoint, steps = restored
+        self._logger.info('resuming from state {}, url {}'.format(checkpoint.state, checkpoint.url))
+        self._replay_steps = steps
+        context.state = checkpoint.state
+        context.url = get_url(driver)
+
+        return checkpoint.state
+
+    def save_path(self, domain, status):
+        if not self._replay_store or not isinstance(status, ProcessingStatus):
+            return
+
+        self._replay_store.save_path(domain, 'shop_tracer', self._replay_steps,
+                                     status.state, States.states.index(status.state))
+
+    def trace(self, domain, wait_response_seconds = 60, attempts = 3, delaying_time = 10,
+              time_budget = None, state_budget = None):
         """
         Traces shop
         :param domain:                 Shop domain to trace
         :param wait_response_seconds:  Seconds to wait response from shop
-        :param attempts:               Number of attempts to navigate to checkout page
+        :param attempts:               Number of attempts to navigate to checkout page,
+                                       every attempt is resumed from the deepest state reached before,
+                                       or from a shallower one if resuming from it made no progress
+        :param time_budget:            Seconds for all attempts, None for unlimited
+        :param state_budget:           Seconds for processing of one state, None for unlimited
         :return:                       ITracingStatus
         """
 
         result = None
         best_state_idx = -1
+        self._checkpoints = CheckpointHistory()
+        deadline = Deadline(time_budget, state_budget)
+
         for _ in range(attempts):
-            attempt_result = self.do_trace(domain, wait_response_seconds, delaying_time)
+            if deadline.is_total_expired():
+                break
 
-            if isinstance(attempt_result, ProcessingStatus):
+            attempt_result = self.do_trace(domain, wait_response_seconds, delaying_time, deadline)
+
+            # Attempt that resumed from a checkpoint and got no deeper won't resume from it again
+            has_state = isinstance(attempt_result, (ProcessingStatus, Timeout)) and attempt_result.state is not None
+            self._checkpoints.finish_attempt(States.states.index(attempt_result.state) if has_state else -1)
+
+            if has_state:
                 idx = States.states.index(attempt_result.state)
                 if idx > best_state_idx:
                     best_state_idx = idx
@@ -245,7 +408,7 @@ class ShopTracer:
 
         return result
 
-    def do_trace(self, domain, wait_response_seconds = 60, delaying_time = 10):
+    def do_trace(self, domain, wait_response_seconds = 60, delaying_time = 10, deadline = None):
 
         url = ShopTracer.normalize_url(domain)
 
@@ -254,7 +417,12 @@ class ShopTracer:
 
         user_info, payment_info = self._get_user_data()
 
-        context = TraceContext(domain, user_info, payment_info, delaying_time, self)
+        context = TraceContext(domain, user_info, payment_info, delaying_time, self, deadline)
+        self._replay_steps = []
+
+        # Waits and handlers check the deadline through the driver
+        driver.deadline = context.deadline
+        context.deadline.start_state(state)
             
         try:
             status = ShopTracer.get(driver, url, wait_response_seconds)
@@ -268,15 +436,27 @@ class ShopTracer:
             if is_domain_for_sale(driver, domain):
                 return NotAvailable('Domain {} for sale'.format(domain))
 
+            # Next attempts continue from the deepest state reached before
+            state = self.resume(driver, state, context)
+            if state == States.new:
+                state = self.replay(driver, domain, state, context)
+
+            self.save_checkpoint(driver, state)
             new_state = state
 
             while state != States.purchased:
+                context.deadline.start_state(state)
                 new_state = self.process_state(driver, state, context)
 
                 if state == new_state:
                     break
 
                 state = new_state
+                self.save_checkpoint(driver, state)
+
+        except DeadlineExceeded as e:
+            self._logger.warning('{} during processing {}'.format(e, url))
+            status = get_deadline_status(context.deadline, e, state)
                 
         except:
             self._logger.exception("Unexpected exception during processing {}".format(url))
@@ -290,4 +470,6 @@ class ShopTracer:
             if context.is_started:
                 context.on_finished(status)
 
+            self.save_path(domain, status)
+
         return status
\ No newline at end of file
@@ -1,96 +1,404 @@
 import os, logging, mongoengine, time, threading, pika, configparser
 import json
+import signal
+import multiprocessing
+from queue import Empty
 
 from tracing.shop_tracer import ShopTracer
+from tracing.selenium_utils.driver_pool import DriverPool
+from tracing.replay_store import ReplayStore
+from tracing.domain_prober import DomainProber
+from tracing.freshness import FreshnessIndex
+from tracing.selenium_utils.blocking import BlockingProfile
 import tracing.trace_logger as trace_logger
 import tracing.common_actors as common_actors
 import tracing.user_data as user_data
 
 
+def create_tracer(driver_pool = None, replay_store = None, blocking = None):
+    logger = trace_logger.MongoDbTraceLogger()
+    tracer = ShopTracer(user_data.get_user_data, headless=False, trace_logger = logger,
+                        driver_pool = driver_pool, replay_store = replay_store, blocking = blocking)
+    common_actors.add_tracer_extensions(tracer)
+
+    return tracer
+
+
+def create_prober(config):
+    if not config.getboolean('prober', 'worker_gate', fallback=False):
+        return None
+
+    return DomainProber.from_config(config, concurrency = 1)
+
+
+def get_budgets(config):
+    """
+    Reads trace and state time budgets in seconds, 0 means unlimited
+    """
+    time_budget = config.getint('worker', 'trace_budget', fallback=0)
+    state_budget = config.getint('worker', 'state_budget', fallback=0)
+
+    return (time_budget or None, state_budget or None)
+
+
+def trace_task(tracer, body, prober = None, budgets = (None, None), freshness = None):
+    """
+    Traces url from RabbitMQ task
+    :param tracer:     ShopTracer
+    :param body:       Message body
+    :param prober:     DomainProber to check domain before it gets a browser
+    :param budgets:    Tuple of default trace and state time budgets, could be overridden by task
+    :param freshness:  FreshnessIndex to skip domains that were traced recently, task could set force to trace anyway
+    :return:           True if task is processed and False if it should be rejected
+    """
+    try:
+        # 1. Extract values from task
+        task = json.loads(body)
+        url = task['url']
+        attempts = task.get('attempts', 3)
+        time_budget = task.get('time_budget', budgets[0])
+        state_budget = task.get('state_budget', budgets[1])
+
+        # Recently traced domains are acked without tracing
+        if freshness and not task.get('force', False) and freshness.is_fresh(url):
+            return True
+
+        # Dead and parked domains don't take browser
+        status = prober.check(url) if prober else None
+        if status:
+            tracer.save_status(url, status)
+            return True
+
+        # 2. Run Tracing
+        status = tracer.trace(url, attempts = attempts, time_budget = time_budget, state_budget = state_budget)
+        return True
+
+    except:
+        logger = logging.getLogger("shop_tracer")
+        logger.exception('Cannot process task: {}. Rejecting RabbitMQ task.'.format(body))
+        return False
+
+
 class Worker(threading.Thread):
-    def __init__(self, config):
+    def __init__(self, config, driver_pool = None, replay_store = None):
         threading.Thread.__init__(self)
 
         # 1. Create ShopTracer
-        logger = trace_logger.MongoDbTraceLogger()
-        self.tracer = ShopTracer(user_data.get_user_data, headless=False, trace_logger = logger)
-        common_actors.add_tracer_extensions(self.tracer)
-        
+        self.tracer = create_tracer(driver_pool, replay_store, BlockingProfile.from_config(config))
+        self.prober = create_prober(config)
+        self.budgets = get_budgets(config)
+        self.freshness = FreshnessIndex.from_config(config)
+
         # 2. Connect to RabbitMQ
         rabbitmq_host = config.get('rabbitmq', 'host', fallback='localhost', raw=False)
         rabbitmq_queue = config.get('rabbitmq', 'queue', fallback='trace_tasks')
-        
+
         params = pika.ConnectionParameters(host=rabbitmq_host,
             heartbeat_interval=0, connection_attempts=3, retry_delay=1)
-        
+
         self.connection = pika.BlockingConnection(params)
         self.channel = self.connection.channel()
         self.channel.queue_declare(queue = rabbitmq_queue, durable=True)
         self.channel.basic_qos(prefetch_count = 1)
-        self.channel.basic_consume(consumer_callback = self.process_task, queue = rabbitmq_queue)        
+        self.channel.basic_consume(consumer_callback = self.process_task, queue = rabbitmq_queue)
 
     def run(self):
         self.channel.start_consuming()
-    
+
     def process_task(self, ch, method, properties, body):
-        try:
-            # 1. Extract values from task
-            task = json.loads(body)
-            url = task['url']
-            attempts = task.get('attempts', 3)
+        # 3. If Success, Ack Message Queue
+        if trace_task(self.tracer, body, self.prober, self.budgets, self.freshness):
+            self.channel.basic_ack(delivery_tag = method.delivery_tag)
+        else:
+            ch.basic_nack(delivery_tag = method.delivery_tag, requeue = False)
 
-            # 2. Run Tracing
-            status = self.tracer.trace(url, attempts = attempts)
 
-            # 3. If Success, Ack Message Queue
-            self.channel.basic_ack(delivery_tag = method.delivery_tag)
+class TracerProcess(multiprocessing.Process):
+    """
+    Process that runs several tracers in threads.
+    Takes tasks (delivery_tag, body) from it's own tasks queue and reports progress to results queue
+    """
 
-        except:
-            logger = logging.getLogger("shop_tracer")
-            logger.exception('Cannot process task: {}. Rejecting RabbitMQ task.'.format(body))
+    def __init__(self, config, tasks, results, concurrency, draining):
+        """
+        :param draining:  multiprocessing.Event, tasks that are taken after it's set are skipped
+        """
+        multiprocessing.Process.__init__(self)
+        self.config = config
+        self.tasks = tasks
+        self.results = results
+        self.concurrency = concurrency
+        self.draining = draining
 
-            ch.basic_nack(delivery_tag = method.delivery_tag, requeue = False)
-            
-       
-if "RABBIT_HOST" not in os.environ:
-    os.environ["RABBIT_HOST"] = "localhost"
-
-if "MONGO_HOST" not in os.environ:
-    os.environ["MONGO_HOST"] = "localhost"
-
-
-config = configparser.ConfigParser(os.environ)
-config.read('config.ini')
-
-# Number of threads
-num_threads = config.getint('common', 'num_threads', fallback=8)
-
-# Needs to Selenium otherwise it could hang
-os.environ['DBUS_SESSION_BUS_ADDRESS'] = '/dev/null'
-
-# Config Logger
-logger = logging.getLogger('shop_tracer')
-logger.setLevel(logging.WARNING)
-handler = logging.StreamHandler()
-formatter = logging.Formatter(
-        '%(asctime)s %(name)-12s %(levelname)-8s %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
-
-# Connect to MongoDB
-mongo_db = config.get('mogodb', 'db', fallback='trace_automation')
-mongo_host = config.get('mogodb', 'host', fallback='localhost', raw=False)
-mongoengine.connect(mongo_db, host=mongo_host)
-
-# Start Workers
-workers = []
-for _ in range(num_threads):
-    worker = Worker(config)
-    worker.setDaemon(True)
-    workers.append(worker)
-    worker.start()
-
-# Keep Main thread for additional checks later
-while True:
-    # Will do additional checks
-    time.sleep(10)
+    def run(self):
+        # Dispatcher decides when to stop, tasks in progress should be finished
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        connect_mongo(self.config)
+        driver_pool = DriverPool.from_config(self.config, size = self.concurrency, headless = False)
+        replay_store = ReplayStore.from_config(self.config)
+
+        threads = [threading.Thread(target=self.consume, args=(driver_pool, replay_store))
+                   for _ in range(self.concurrency)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        driver_pool.close()
+        if replay_store:
+            replay_store.close()
+
+    def consume(self, driver_pool, replay_store):
+        tracer = create_tracer(driver_pool, replay_store, BlockingProfile.from_config(self.config))
+        prober = create_prober(self.config)
+        budgets = get_budgets(self.config)
+        freshness = FreshnessIndex.from_config(self.config)
+        pid = os.getpid()
+
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+
+            delivery_tag, body = task
+
+            # Dispatcher is stopping, not started tasks are returned to RabbitMQ
+            if self.draining.is_set():
+                self.results.put(('skipped', pid, delivery_tag, None))
+                continue
+
+            self.results.put(('started', pid, delivery_tag, None))
+
+            processed = trace_task(tracer, body, prober, budgets, freshness)
+            self.results.put(('finished', pid, delivery_tag, processed))
+
+        tracer.release_driver()
+
+
+class ProcessDispatcher:
+    """
+    Consumes RabbitMQ tasks by one connection and dispatches them to a pool of TracerProcess.
+    Connection is served by the main thread so heartbeats are sent during long traces
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.processes_number = config.getint('worker', 'processes', fallback=multiprocessing.cpu_count())
+        self.concurrency = config.getint('worker', 'concurrency', fallback=1)
+
+        # Maximum number of tasks in flight (unacked by the worker)
+        capacity = self.processes_number * self.concurrency
+        self.prefetch = config.getint('worker', 'prefetch', fallback=capacity)
+        self.heartbeat = config.getint('worker', 'heartbeat', fallback=60)
+
+        self.results = multiprocessing.Queue()
+        self.draining = multiprocessing.Event()
+        self.processes = []
+
+        # delivery_tag -> [process the task is dispatched to, is task started]
+        self.in_flight = {}
+        self.stopping = False
+        self.consumer_tag = None
+        self._logger = logging.getLogger('shop_tracer')
+
+    def start_process(self):
+        # Every process has it's own queue, so dispatcher knows which tasks are lost if process dies
+        process = TracerProcess(self.config, multiprocessing.Queue(), self.results, self.concurrency, self.draining)
+        process.start()
+        self.processes.append(process)
+
+    def get_load(self, process):
+        return sum(1 for owner, _ in self.in_flight.values() if owner is process)
+
+    def connect(self):
+        rabbitmq_host = self.config.get('rabbitmq', 'host', fallback='localhost', raw=False)
+        rabbitmq_queue = self.config.get('rabbitmq', 'queue', fallback='trace_tasks')
+
+        params = pika.ConnectionParameters(host=rabbitmq_host,
+            heartbeat_interval=self.heartbeat, connection_attempts=3, retry_delay=1)
+
+        self.connection = pika.BlockingConnection(params)
+        self.channel = self.connection.channel()
+        self.channel.queue_declare(queue = rabbitmq_queue, durable=True)
+        self.channel.basic_qos(prefetch_count = self.prefetch)
+        self.consumer_tag = self.channel.basic_consume(consumer_callback = self.on_message, queue = rabbitmq_queue)
+
+    def on_message(self, ch, method, properties, body):
+        if not self.processes or self.draining.is_set():
+            ch.basic_nack(delivery_tag = method.delivery_tag, requeue = True)
+            return
+
+        process = min(self.processes, key = self.get_load)
+        self.in_flight[method.delivery_tag] = [process, False]
+        process.tasks.put((method.delivery_tag, body))
+
+    def collect_results(self):
+        while True:
+            try:
+                event, pid, delivery_tag, processed = self.results.get_nowait()
+            except Empty:
+                return
+
+            if event == 'started':
+                if delivery_tag in self.in_flight:
+                    self.in_flight[delivery_tag][1] = True
+                continue
+
+            if event == 'skipped':
+                self.in_flight.pop(delivery_tag, None)
+                self.channel.basic_nack(delivery_tag = delivery_tag, requeue = True)
+                continue
+
+            self.in_flight.pop(delivery_tag, None)
+            if processed:
+                self.channel.basic_ack(delivery_tag = delivery_tag)
+            else:
+                self.channel.basic_nack(delivery_tag = delivery_tag, requeue = False)
+
+    def check_processes(self):
+        for process in list(self.processes):
+            if process.is_alive():
+                continue
+
+            self.processes.remove(process)
+
+            # Results of the process could be still in results queue
+            self.collect_results()
+            lost = [tag for tag, (owner, _) in self.in_flight.items() if owner is process]
+            self._logger.error('tracer process {} died with exit code {}, lost {} tasks'.format(
+                process.pid, process.exitcode, len(lost)))
+
+            for tag in lost:
+                _, started = self.in_flight.pop(tag)
+                # Started task could kill the process, others are returned to the queue
+                self.channel.basic_nack(delivery_tag = tag, requeue = not started)
+
+            if not self.stopping:
+                self.start_process()
+
+    def drain(self):
+        """
+        Returns tasks that are not started yet to RabbitMQ, so shutdown waits only for traces in progress.
+        Tasks that are still in transit to processes are skipped by them
+        """
+        self.draining.set()
+        for process in self.processes:
+            while True:
+                try:
+                    delivery_tag, _ = process.tasks.get_nowait()
+                except Empty:
+                    break
+
+                self.in_flight.pop(delivery_tag, None)
+                self.channel.basic_nack(delivery_tag = delivery_tag, requeue = True)
+
+    def stop(self, signum = None, frame = None):
+        # Only set flag, channel is not safe to use from signal handler
+        self.stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        for _ in range(self.processes_number):
+            self.start_process()
+
+        self.connect()
+
+        while not self.stopping or self.in_flight:
+            if self.stopping and self.consumer_tag:
+                self._logger.warning('stopping worker, waiting for {} tasks'.format(len(self.in_flight)))
+                self.channel.basic_cancel(self.consumer_tag)
+                self.consumer_tag = None
+                self.drain()
+
+            self.connection.process_data_events(time_limit = 1)
+            self.collect_results()
+            self.check_processes()
+
+        for process in self.processes:
+            for _ in range(self.concurrency):
+                process.tasks.put(None)
+
+        for process in self.processes:
+            process.join()
+
+        self.connection.close()
+
+
+def read_config(file = 'config.ini'):
+    if "RABBIT_HOST" not in os.environ:
+        os.environ["RABBIT_HOST"] = "localhost"
+
+    if "MONGO_HOST" not in os.environ:
+        os.environ["MONGO_HOST"] = "localhost"
+
+    config = configparser.ConfigParser(os.environ)
+    config.read(file)
+
+    return config
+
+
+def config_logger():
+    logger = logging.getLogger('shop_tracer')
+    logger.setLevel(logging.WARNING)
+    handler = logging.StreamHandler()
+    formatter = logging.Formatter(
+            '%(asctime)s %(name)-12s %(levelname)-8s %(message)s')
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+
+
+def connect_mongo(config):
+    mongo_db = config.get('mogodb', 'db', fallback='trace_automation')
+    mongo_host = config.get('mogodb', 'host', fallback='localhost', raw=False)
+    mongoengine.connect(mongo_db, host=mongo_host)
+
+
+def run_threads(config):
+    # Number of threads
+    num_threads = config.getint('common', 'num_threads', fallback=8)
+
+    connect_mongo(config)
+
+    # Warm drivers shared by all workers
+    driver_pool = DriverPool.from_config(config, size = num_threads, headless = False)
+
+    # Paths recorded by previous traces
+    replay_store = ReplayStore.from_config(config)
+
+    # Start Workers
+    workers = []
+    for _ in range(num_threads):
+        worker = Worker(config, driver_pool, replay_store)
+        worker.setDaemon(True)
+        workers.append(worker)
+        worker.start()
+
+    # Keep Main thread for additional checks later
+    while True:
+        # Will do additional checks
+        time.sleep(10)
+
+
+def run_processes(config):
+    ProcessDispatcher(config).run()
+
+
+if __name__ == '__main__':
+    config = read_config()
+
+    # Needs to Selenium otherwise it could hang
+    os.environ['DBUS_SESSION_BUS_ADDRESS'] = '/dev/null'
+
+    config_logger()
+
+    mode = config.get('worker', 'mode', fallback='threads')
+    if mode == 'processes':
+        run_processes(config)
+    else:
+        run_threads(config)
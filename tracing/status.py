@@ -50,10 +50,13 @@ class RequestError(ITraceStatus):
 
 class Timeout(ITraceStatus):
     """
-        Request timed out
+        Request timed out or time budget of trace is over
     """
-    def __init__(self, time_limit, message = None):
-        super().__init__("Timed Out", message = message, time_limit = time_limit)
+    def __init__(self, time_limit, message = None, state = None):
+        """
+        :param state:  The deepest state that was reached before time was over
+        """
+        super().__init__("Timed Out", message = message, time_limit = time_limit, state = state)
 
 
     def toJSON(self):
@@ -75,3 +78,51 @@ class ProcessingStatus(ITraceStatus):
     def __str__(self):
         return 'Finished at state: "{}"'.format(self.state)
 
+
+def get_deadline_status(deadline, exception, state):
+    """
+    Converts DeadlineExceeded to the trace status
+    :param deadline:   Deadline of the trace
+    :param exception:  DeadlineExceeded
+    :param state:      The deepest state reached
+    :return:           Timeout
+    """
+    time_limit = deadline.budget if exception.total else deadline.state_budget
+    return Timeout(time_limit, str(exception), state = state)
+
+
+def get_navigation_status(navigation, timeout = 60):
+    """
+    Converts failed navigation to the trace status
+    :param navigation:  NavigationResult
+    :param timeout:     Page load timeout in seconds
+    :return:            ITraceStatus or None if page is loaded
+    """
+    if navigation.timed_out:
+        return Timeout(timeout)
+
+    if navigation.error is not None:
+        return NotAvailable('{}: {}'.format(navigation.url, navigation.error))
+
+    if navigation.status is not None and navigation.status >= 400:
+        return RequestError(navigation.status)
+
+    return None
+
+
+def get_outcome(status):
+    """
+    Short name of the trace result that is used to decide when domain should be traced again
+    :param status:  ITraceStatus
+    :return:        Error kind (not_available, request_error, timeout) or final state, for instance purchased
+    """
+    if isinstance(status, NotAvailable):
+        return 'not_available'
+
+    if isinstance(status, RequestError):
+        return 'request_error'
+
+    if isinstance(status, Timeout):
+        return 'timeout'
+
+    return status.state or 'unknown'
@@ -5,6 +5,13 @@ import os.path
 import os
 import json
 import tempfile
+import io
+import zlib
+import hashlib
+import logging
+import threading
+from queue import Queue
+from concurrent.futures import Future
 
 from tracing.selenium_utils.common import *
 
@@ -32,6 +39,108 @@ class TraceEncoder(json.JSONEncoder):
         return result
 
     
+def encode_png(image):
+    """
+    Encodes PIL Image to PNG
+    :param image:  PIL Image or None
+    :return:       PNG bytes, empty for None
+    """
+    if image is None:
+        return b''
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def get_image_hash(image):
+    """
+    Exact hash of image pixels, is used as a key of screenshots storage
+    :param image:  PIL Image or None
+    :return:       Hex digest
+    """
+    digest = hashlib.sha1()
+    if image is not None:
+        digest.update('{}{}'.format(image.mode, image.size).encode())
+        digest.update(image.tobytes())
+
+    return digest.hexdigest()
+
+
+def get_source_hash(source):
+    """
+    Hash of page source, is used as a key of sources storage
+    """
+    return hashlib.sha1((source or '').encode('utf-8')).hexdigest()
+
+
+def compress_source(source):
+    return zlib.compress((source or '').encode('utf-8'), 6)
+
+
+def decompress_source(data):
+    return zlib.decompress(data).decode('utf-8')
+
+
+def save_captured(save_screenshot, capture):
+    """
+    Decodes captured screenshot and saves it by function returned by ITraceLogging.reserve_step
+    :param capture:  PageCapture
+    """
+    save_screenshot(capture.to_image())
+
+
+class SnapshotWriter:
+    """
+    Decodes, encodes and saves screenshots of trace steps in background threads.
+    Tracer thread waits only when max_pending tasks are already queued
+    """
+
+    def __init__(self, workers = 2, max_pending = 8):
+        """
+        :param workers:      Number of background threads
+        :param max_pending:  Maximum number of queued tasks
+        """
+        self._queue = Queue(maxsize = max_pending)
+        self._threads = []
+        for _ in range(workers):
+            thread = threading.Thread(target = self._run)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                break
+
+            future, function, args = task
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(function(*args))
+                except Exception as e:
+                    future.set_exception(e)
+
+            self._queue.task_done()
+
+    def submit(self, function, *args):
+        """
+        Schedules function call, blocks if queue is full
+        :return:  concurrent.futures.Future
+        """
+        future = Future()
+        self._queue.put((future, function, args))
+        return future
+
+    def close(self):
+        for _ in self._threads:
+            self._queue.put(None)
+
+        for thread in self._threads:
+            thread.join()
+
+
 class ITraceLogging:
     """
     Object that logs current trace
@@ -49,18 +158,59 @@ class ITraceLogging:
     def add_step(self, url, state, handler, screenshot_file, source, additional = None):
         raise NotImplementedError
 
+    def reserve_step(self, url, state, handler, source, additional = None):
+        """
+        Adds step to the trace and returns function that saves it's screenshot (and source if it's stored apart).
+        Function could be called later from another thread
+        :return:  Function that takes PIL Image of the screenshot
+        """
+        def save_screenshot(image):
+            screenshot_file = self.create_img_file()
+            with open(screenshot_file, 'wb') as f:
+                f.write(encode_png(image))
+
+            self.add_step(url, state, handler, screenshot_file, source, additional)
+
+        return save_screenshot
+
     def save_snapshot(self, driver, state, handler, additional = None):
-        
-        if not hasattr(self, '_scale') or not self._scale:
-            self._scale = get_scale(driver)
-            
         url = get_url(driver)
         html = get_source(driver)
-        
-        screenshot_file = self.create_img_file()
-        get_full_page_screenshot(driver, screenshot_file, self._scale, 10)
+        # Only browser work is done in the tracer thread, tiles are decoded and stitched by writer
+        capture = capture_full_page_tiles(driver, get_scale(driver), 10)
 
-        self.add_step(url, state, handler, screenshot_file, html, additional)
+        save_screenshot = self.reserve_step(url, state, handler, html, additional)
+
+        writer = getattr(self, '_writer', None)
+        if writer is None:
+            save_captured(save_screenshot, capture)
+        else:
+            self._get_pending().append(writer.submit(save_captured, save_screenshot, capture))
+
+    def set_profile(self, profile):
+        """
+        Attaches WebDriver commands profile (CommandProfiler.summary()) to the trace
+        """
+        self.profile = profile
+
+    def _get_pending(self):
+        if getattr(self, '_pending', None) is None:
+            self._pending = []
+
+        return self._pending
+
+    def flush(self):
+        """
+        Waits until all screenshots are saved
+        """
+        pending = self._get_pending()
+        while pending:
+            future = pending.pop(0)
+            try:
+                future.result()
+            except Exception:
+                logger = logging.getLogger('shop_tracer')
+                logger.exception('Cannot save trace screenshot')
 
         
 class ITraceLogger:
@@ -74,15 +224,24 @@ class ITraceLogger:
         raise NotImplementedError
     
 
-Step = namedtuple('Step', ['url', 'state', 'handler', 'screen_path', 'source', 'additional'])
+# source is None when page source is stored in sources folder by source_hash
+Step = namedtuple('Step', ['url', 'state', 'handler', 'screen_path', 'source', 'additional', 'source_hash'])
 
 
 class FileTraceLogger(ITraceLogger):
 
-    def __init__(self, results_file, img_folder, clear = True):
-        
+    def __init__(self, results_file, img_folder, clear = True, writer = None, sources_folder = None):
+        """
+        :param results_file:             File to append traces as json lines
+        :param img_folder:               Folder to save screenshots
+        :param clear:                    Remove previous results
+        :param writer:                   SnapshotWriter to save screenshots in background, if None then one is created
+        :param sources_folder:           Folder to save compressed page sources,
+                                         by default 'sources' folder near results_file
+        """
         self._results_file = results_file
         self._img_folder = img_folder
+        self._writer = writer or SnapshotWriter()
         
         # clear results file
         dirname = os.path.dirname(results_file)
@@ -90,10 +249,13 @@ class FileTraceLogger(ITraceLogger):
             os.makedirs(dirname)
         if clear:
             open(results_file, 'w+').close()
+
+        self._sources_folder = sources_folder or FileTraceLogger.get_sources_folder(results_file)
         
-        # create image folder if not exists
-        if not os.path.exists(img_folder):
-            os.makedirs(img_folder)
+        # create image and sources folders if not exist
+        for folder in [img_folder, self._sources_folder]:
+            if not os.path.exists(folder):
+                os.makedirs(folder)
 
         # Delete all .png files in directory
         if clear:
@@ -104,7 +266,7 @@ class FileTraceLogger(ITraceLogger):
 
     @abstractmethod
     def start_new(self, domain):
-        return FileTraceLogging(domain, self._img_folder)
+        return FileTraceLogging(domain, self._img_folder, self._writer, self._sources_folder)
 
     @abstractmethod
     def save(self, trace, status):
@@ -112,6 +274,7 @@ class FileTraceLogger(ITraceLogger):
         :param trace:    ITraceLogging - collected trace
         :param status:   ITraceStatus  - final status
         """
+        trace.flush()
         trace.set_status(status)
 
         json = TraceEncoder().encode(trace)
@@ -122,54 +285,173 @@ class FileTraceLogger(ITraceLogger):
             f.write(to_write)
             f.flush()
 
+    @staticmethod
+    def get_sources_folder(results_file):
+        return os.path.join(os.path.dirname(results_file), 'sources')
+
+    @staticmethod
+    def read_source(sources_folder, source_hash):
+        """
+        Reads page source saved by FileTraceLogging
+        :param sources_folder:  Folder with compressed sources
+        :param source_hash:     Hash from step
+        :return:                Page source
+        """
+        with open(os.path.join(sources_folder, source_hash + '.html.z'), 'rb') as f:
+            return decompress_source(f.read())
+
+    @staticmethod
+    def read_traces(results_file, sources_folder = None, load_sources = True):
+        """
+        Reads traces saved by FileTraceLogger
+        :param results_file:    File with json lines
+        :param sources_folder:  Folder with compressed sources, by default 'sources' folder near results_file
+        :param load_sources:    Fill step 'source' from sources folder
+        :return:                Generator of trace dicts
+        """
+        sources_folder = sources_folder or FileTraceLogger.get_sources_folder(results_file)
+
+        with open(results_file, 'r') as f:
+            for line in f:
+                trace = json.loads(line)
+                if load_sources:
+                    for step in trace.get('steps', []):
+                        if step.get('source') is None and step.get('source_hash'):
+                            step['source'] = FileTraceLogger.read_source(sources_folder, step['source_hash'])
+
+                yield trace
+
 
 class FileTraceLogging(ITraceLogging):
 
-    def __init__(self, domain, img_folder):
+    def __init__(self, domain, img_folder, writer = None, sources_folder = None):
         self.domain = domain
         self.steps = []
         self.status = None
         self._img_folder = img_folder
+        self._writer = writer
+        self._sources_folder = sources_folder
     
     def add_step(self, url, state, handler, screenshot_file, source, additional = None):
         file_name = str(uuid.uuid4()) + '.png'
         file_path = os.path.join(self._img_folder, file_name)
         os.rename(screenshot_file, file_path)
 
-        step = Step(url, state, handler, file_path, source, additional)
+        step = Step(url, state, handler, file_path, source, additional, None)
         self.steps.append(step)
 
+    def save_source(self, source, source_hash):
+        file_path = os.path.join(self._sources_folder, source_hash + '.html.z')
+        if os.path.exists(file_path):
+            return
+
+        tmp_path = file_path + '.' + str(uuid.uuid4())
+        with open(tmp_path, 'wb') as f:
+            f.write(compress_source(source))
+        os.replace(tmp_path, file_path)
+
+    def reserve_step(self, url, state, handler, source, additional = None):
+        if self._sources_folder:
+            # Sources are compressed and content addressed, step keeps only hash
+            source_hash = get_source_hash(source)
+            step = Step(url, state, handler, None, None, additional, source_hash)
+        else:
+            source_hash = None
+            step = Step(url, state, handler, None, source, additional, None)
+
+        idx = len(self.steps)
+        self.steps.append(step)
+
+        def save_screenshot(image):
+            if source_hash:
+                self.save_source(source, source_hash)
+
+            # Screenshots are content addressed, the same image is stored once
+            file_path = os.path.join(self._img_folder, get_image_hash(image) + '.png')
+            if not os.path.exists(file_path):
+                tmp_path = file_path + '.' + str(uuid.uuid4())
+                with open(tmp_path, 'wb') as f:
+                    f.write(encode_png(image))
+                os.replace(tmp_path, file_path)
+
+            self.steps[idx] = step._replace(screen_path = file_path)
+
+        return save_screenshot
+
     def set_status(self, status):
         self.status = status
 
 
 
 from mongoengine import *
+from mongoengine.connection import get_db
 import datetime
+
+from tracing.freshness import MongoDbFreshness
         
 class MongoDbTraceLogger(ITraceLogger):
 
+    def __init__(self, writer = None):
+        """
+        :param writer:  SnapshotWriter to upload screenshots in background, if None then one is created
+        """
+        self._writer = writer or SnapshotWriter()
+
     @abstractmethod
     def start_new(self, domain):
-        return MongoDbTrace(domain = domain, steps = [])
+        trace = MongoDbTrace(domain = domain, steps = [])
+        trace._writer = self._writer
+
+        return trace
 
     @abstractmethod
     def save(self, trace, status):
+        trace.flush()
         trace.final_state = status.state
         trace.status = str(status)
         
         trace.save()
+        MongoDbFreshness.register(trace.domain, status)
 
 class MongoDbStep(EmbeddedDocument):
     url = StringField()
     state = StringField()
     handler = StringField()
     screenshot = FileField()
+    # sha1 of screenshot pixels, steps with the same screenshot share one GridFS file
+    screenshot_hash = StringField()
+    # Old steps keep source inline, new ones refer MongoDbSource by hash
     source = StringField()
+    source_hash = StringField()
     additional = StringField()
     
     added = DateTimeField(default=datetime.datetime.utcnow)
 
+    def get_source(self):
+        """
+        Returns page source of the step, decompressed if it's stored in MongoDbSource
+        """
+        if self.source is not None or not self.source_hash:
+            return self.source
+
+        stored = MongoDbSource.objects(hash = self.source_hash).first()
+        return decompress_source(stored.data) if stored else None
+
+
+class MongoDbSource(Document):
+    """
+    Compressed page source that is shared by all steps with the same source
+    """
+    hash = StringField(primary_key = True)
+    data = BinaryField()
+
+    meta = {'collection': 'trace_sources'}
+
+    @staticmethod
+    def save_if_needed(source, source_hash):
+        if MongoDbSource.objects(hash = source_hash).only('hash').first() is None:
+            MongoDbSource(hash = source_hash, data = compress_source(source)).save()
+
             
 class MongoDbTrace(Document, ITraceLogging):
     domain = StringField(required=True)
@@ -178,6 +460,18 @@ class MongoDbTrace(Document, ITraceLogging):
     
     final_state = StringField()
     status = StringField()
+    profile = DictField()
+
+    meta = {'indexes': ['domain', 'started', 'final_state']}
+
+    def set_profile(self, profile):
+        # MongoDB doesn't allow dots and dollars in keys (frame urls)
+        def sanitize(value):
+            if isinstance(value, dict):
+                return {str(key).replace('.', '_').replace('$', '_'): sanitize(item) for key, item in value.items()}
+            return value
+
+        self.profile = sanitize(profile)
     
     def add_step(self, url, state, handler, screenshot_file, source, additional = None):
         step = MongoDbStep(url = url, 
@@ -192,4 +486,53 @@ class MongoDbTrace(Document, ITraceLogging):
         self.steps.append(step)
         os.remove(screenshot_file)
 
+    def reserve_step(self, url, state, handler, source, additional = None):
+        source_hash = get_source_hash(source)
+        step = MongoDbStep(url = url, 
+                           state = state, 
+                           handler = handler, 
+                           source_hash = source_hash, 
+                           additional = additional)
+        self.steps.append(step)
+
+        def save_screenshot(image):
+            MongoDbSource.save_if_needed(source, source_hash)
+
+            image_hash = get_image_hash(image)
+            step.screenshot_hash = image_hash
+
+            fs = step.screenshot.fs
+            ensure_screenshot_index(step.screenshot)
+
+            # Writer threads could save the same screenshot at the same time, it must be stored once
+            with get_screenshot_lock(image_hash):
+                existing = fs.find_one({'sha1': image_hash})
+                if existing is not None:
+                    step.screenshot.grid_id = existing._id
+                else:
+                    step.screenshot.put(encode_png(image), content_type='image/png', sha1=image_hash)
+
+        return save_screenshot
+
+
+_indexed_collections = set()
+
+# Locks of screenshot hashes, the number is fixed so they are shared by hashes
+_screenshot_locks = [threading.Lock() for _ in range(64)]
+
+def get_screenshot_lock(image_hash):
+    return _screenshot_locks[int(image_hash[:8], 16) % len(_screenshot_locks)]
+
+def ensure_screenshot_index(proxy):
+    """
+    Creates index by screenshot hash in GridFS files collection
+    :param proxy:  GridFSProxy of FileField
+    """
+    collection = get_db(proxy.db_alias)[proxy.collection_name].files
+    if collection.full_name in _indexed_collections:
+        return
+
+    collection.create_index('sha1')
+    _indexed_collections.add(collection.full_name)
+
 
@@ -0,0 +1,69 @@
+import tensorflow as tf
+import tensorflow.contrib.slim as slim
+import tensorflow.contrib.slim.nets as nets
+import nets.inception_resnet_v2
+import nets.mobilenet_v1
+from nets.inception_resnet_v2 import inception_resnet_v2_arg_scope
+from nets.mobilenet_v1 import mobilenet_v1_arg_scope
+
+
+class Backbone:
+    """
+    CNN that converts images with values in [-1, 1] to pooled features
+    """
+
+    def __init__(self, name, scope, feature_size, build, arg_scope):
+        """
+        :param name:          Name in registry
+        :param scope:         Variable scope of backbone, is used to restore ImageNet checkpoints
+        :param feature_size:  Size of pooled features
+        :param build:         Function (img, is_training) -> Batch x feature_size tensor
+        :param arg_scope:     Function that returns slim arg scope for heads built on top of backbone
+        """
+        self.name = name
+        self.scope = scope
+        self.feature_size = feature_size
+        self.build = build
+        self.arg_scope = arg_scope
+
+    def get_variables(self):
+        return tf.get_collection(tf.GraphKeys.GLOBAL_VARIABLES, scope = self.scope)
+
+
+def build_inception_resnet_v2(img, is_training):
+    with slim.arg_scope(inception_resnet_v2_arg_scope()):
+        net, endpoints = nets.inception_resnet_v2.inception_resnet_v2(
+            img, None, dropout_keep_prob = 1.0, is_training = is_training)
+
+    # Batch x Channels
+    return slim.flatten(net)
+
+
+def build_mobilenet_v1(img, is_training):
+    # Global pooling supports pages of any height
+    with slim.arg_scope(mobilenet_v1_arg_scope(is_training = is_training)):
+        net, endpoints = nets.mobilenet_v1.mobilenet_v1(
+            img, None, dropout_keep_prob = 1.0, is_training = is_training, global_pool = True)
+
+    # Batch x Channels
+    return slim.flatten(net)
+
+
+backbones = {
+    # Accurate, about 1 second per full page screenshot on CPU
+    'inception_resnet_v2': Backbone('inception_resnet_v2', 'InceptionResnetV2', 1536,
+                                    build_inception_resnet_v2, inception_resnet_v2_arg_scope),
+
+    # Mobile-class, an order of magnitude faster on CPU, is trained by distillation from inception_resnet_v2
+    'mobilenet_v1': Backbone('mobilenet_v1', 'MobilenetV1', 1024,
+                             build_mobilenet_v1, lambda: slim.arg_scope([]))
+}
+
+
+def get_backbone(name):
+    """
+    :param name:  Backbone name, one of backbones keys
+    :return:      Backbone
+    """
+    assert name in backbones, "Unknown backbone {}, available: {}".format(name, ', '.join(backbones))
+    return backbones[name]
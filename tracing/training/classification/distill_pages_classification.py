@@ -0,0 +1,48 @@
+import tensorflow as tf
+
+import os
+from tracing.training.classification.pages_dataset import read_pages_dataset
+from tracing.training.classification.page_classifier import PageClassifier
+from tracing.training.classification.distillation import PageClassifierDistiller
+
+
+# Change it to your cache folder
+train_urls, test_urls = read_pages_dataset(cache_folder = None, seed = 0)
+
+# Teacher is Inception-ResNet-v2 classifier trained by train_pages_classification.py
+teacher = PageClassifier.from_checkpoint('classification_model/19')
+
+student_backbone = 'mobilenet_v1'
+student_graph = tf.Graph()
+with student_graph.as_default():
+    student = PageClassifier(tf.Session(graph = student_graph), backbone = student_backbone)
+    student.session.run(tf.global_variables_initializer())
+
+    checkpoint = None
+    start_epoch = 0
+    for i in range(100):
+        fname = 'distilled_model/{}'.format(i)
+        if os.path.exists(fname + '.index'):
+            checkpoint = fname
+            start_epoch = i + 1
+
+    if checkpoint:
+        print('loading checkpoint', checkpoint)
+        student.load(checkpoint)
+    else:
+        # ImageNet weights from tensorflow/models slim
+        student.restore_inception('./mobilenet_v1_1.0_224.ckpt')
+
+    distiller = PageClassifierDistiller(teacher, student, temperature = 2.0)
+
+
+print('teacher test f1:', teacher.measure(test_urls))
+
+for epoch in range(start_epoch, 20):
+    print('epoch ', epoch)
+    distiller.train(train_urls, epochs=1, lr = 0.0001, dropout = 0.65)
+
+    test_f1 = student.measure(test_urls)
+    print('student test f1:', test_f1)
+
+    student.save('distilled_model/{}'.format(epoch))
@@ -0,0 +1,99 @@
+import tensorflow as tf
+
+import random
+import sys
+
+from tracing.utils.dataset import *
+
+
+class PageClassifierDistiller:
+    """
+    Trains student PageClassifier (usually with a light backbone) to reproduce soft predictions
+    of teacher PageClassifier. Teacher and student must be built in different graphs
+    """
+
+    def __init__(self, teacher, student, temperature = 2.0, soft_weight = 0.7):
+        """
+        :param teacher:      Trained PageClassifier, it's weights are not changed
+        :param student:      PageClassifier to train
+        :param temperature:  Softmax temperature of soft targets
+        :param soft_weight:  Weight of soft targets loss, hard labels loss has weight 1 - soft_weight
+        """
+        self.teacher = teacher
+        self.student = student
+        self.temperature = temperature
+        self.soft_weight = soft_weight
+
+        with self.student.session.graph.as_default():
+            self.build_graph()
+
+    def get_soft_loss(self, teacher_logits, logits):
+        soft_targets = tf.nn.softmax(teacher_logits / self.temperature)
+        loss = tf.nn.softmax_cross_entropy_with_logits_v2(
+            labels = tf.stop_gradient(soft_targets),
+            logits = logits / self.temperature)
+
+        # Gradients of soft targets scale as 1/T^2
+        return tf.reduce_mean(loss) * (self.temperature ** 2)
+
+    def build_graph(self):
+        with tf.variable_scope('distillation'):
+            self.teacher_popup_logits = tf.placeholder(tf.float32, (None, 2), "teacher_popup_logits")
+            self.teacher_checkout_logits = tf.placeholder(tf.float32, (None, 2), "teacher_checkout_logits")
+
+            # Teacher predicts both tasks for every page, so soft losses are not masked
+            self.popup_loss = self.get_soft_loss(self.teacher_popup_logits, self.student.popup_logits)
+            self.checkout_loss = self.get_soft_loss(self.teacher_checkout_logits, self.student.checkout_logits)
+
+            self.soft_loss = (self.popup_loss + self.checkout_loss) / 2.0
+            self.loss = self.soft_weight * self.soft_loss + (1. - self.soft_weight) * self.student.loss
+
+            vars_before = set(tf.global_variables())
+            self.opt = tf.train.AdamOptimizer(self.student.lr)
+            self.train_op = self.opt.minimize(self.loss)
+
+            # Initialize only optimizer variables, student could be already restored
+            new_vars = [var for var in tf.global_variables() if var not in vars_before]
+            self.student.session.run(tf.variables_initializer(new_vars))
+
+    def batch_to_feed(self, batch):
+        imgs = [self.student.read_image(item) for item in batch]
+
+        # to_input pads images in place, so every model gets it's own list
+        teacher_popup_logits, teacher_checkout_logits = self.teacher.session.run(
+            [self.teacher.popup_logits, self.teacher.checkout_logits],
+            feed_dict = {
+                self.teacher.img: self.teacher.to_input(list(imgs)),
+                self.teacher.dropout: 1.0
+            })
+
+        feed = self.student.batch_to_feed(batch, list(imgs))
+        feed[self.teacher_popup_logits] = teacher_popup_logits
+        feed[self.teacher_checkout_logits] = teacher_checkout_logits
+        return feed
+
+    def train(self, imgs, epochs = 10, lr = 0.001, dropout = 0.8, l2 = 0.001, batch_size = 12):
+        print('dataset size:', len(imgs))
+        for epoch in range(epochs):
+            print('Distillation started')
+            random.shuffle(imgs)
+            sum_loss = 0
+            loss_cnts = 0
+            for i, batch in enumerate(slice(imgs, batch_size)):
+                feed = self.batch_to_feed(batch)
+                feed[self.student.lr] = lr
+                feed[self.student.dropout] = dropout
+                feed[self.student.l2] = l2
+
+                _, loss, soft_loss = self.student.session.run(
+                    [self.train_op, self.loss, self.soft_loss],
+                    feed_dict = feed)
+
+                sys.stdout.write('\rfinished: {:2.2f}% loss: {}, soft_loss: {}'
+                                 .format(i * batch_size * 100 / len(imgs), loss, soft_loss))
+                sys.stdout.flush()
+
+                sum_loss += loss
+                loss_cnts += 1
+
+            print('Epoch finished, loss: {}'.format(sum_loss / max(loss_cnts, 1)))
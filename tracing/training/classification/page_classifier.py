@@ -1,8 +1,5 @@
 import tensorflow as tf
 import tensorflow.contrib.slim as slim
-import tensorflow.contrib.slim.nets as nets
-import nets.inception_resnet_v2
-from nets.inception_resnet_v2 import inception_resnet_v2_arg_scope
 
 import numpy as np
 import random
@@ -12,15 +9,24 @@ from tracing.utils.dataset import read_small_image
 from tracing.utils.downloader import Downloader
 from tracing.utils.images import ImageHelper
 from tracing.utils.dataset import *
+from tracing.training.backbones import get_backbone
 
 
 class PageClassifier:
-    def __init__(self, session = None, use_batch_norm = False):
+    def __init__(self, session = None, use_batch_norm = False, features = None, backbone = 'inception_resnet_v2'):
+        """
+        :param features:  BackboneFeatures, if set then backbone is frozen and only classifier heads
+                          are trained on cached features
+        :param backbone:  Backbone name from tracing.training.backbones registry,
+                          is ignored if features are set (features backbone is used)
+        """
 
         if session is None:
             session = tf.Session()
 
         self.session = session
+        self.features = features
+        self.backbone = features.backbone if features is not None else get_backbone(backbone)
         self.build_graph(use_batch_norm)
 
         self.init_task_labels_and_logits()
@@ -31,11 +37,9 @@ class PageClassifier:
     def init_savers(self):
         self.saver = tf.train.Saver()
 
-        inception_vars = tf.get_collection(
-            tf.GraphKeys.GLOBAL_VARIABLES,
-            scope = 'InceptionResnetV2')
-
-        self.inception_saver = tf.train.Saver(var_list = inception_vars)
+        # Saver for ImageNet weights of backbone
+        backbone_vars = self.backbone.get_variables()
+        self.inception_saver = tf.train.Saver(var_list = backbone_vars) if backbone_vars else None
 
 
     def init_task_labels_and_logits(self):
@@ -81,7 +85,11 @@ class PageClassifier:
             self.lr = tf.placeholder(tf.float32, (), "lr")
             self.l2 = tf.placeholder(tf.float32, (), "l2")
 
-            self.img = tf.placeholder(tf.float32, (None, None, 300, 3), "img")
+            if self.features is not None:
+                # Batch x Features
+                self.img = tf.placeholder(tf.float32, (None, self.backbone.feature_size), "features")
+            else:
+                self.img = tf.placeholder(tf.float32, (None, None, 300, 3), "img")
             self.popup_labels = tf.placeholder(tf.float32, (None, 2), "popup_labels")
             self.checkout_labels = tf.placeholder(tf.float32, (None, 2), "checkout_labels")
 
@@ -90,12 +98,11 @@ class PageClassifier:
             self.is_checkout_task = tf.placeholder(tf.bool, [None], "is_checkout")
 
 
-        with slim.arg_scope(inception_resnet_v2_arg_scope()):
-            self.net, endpoints = nets.inception_resnet_v2.inception_resnet_v2(
-                self.img, None, dropout_keep_prob = 1.0, is_training = use_batch_norm)
-
+        if self.features is not None:
+            self.net = self.img
+        else:
             # Batch x Channels
-            self.net = slim.flatten(self.net)
+            self.net = self.backbone.build(self.img, use_batch_norm)
 
 
         with tf.variable_scope('page_classification') as sc:
@@ -148,8 +155,21 @@ class PageClassifier:
         return (image -128.0) / 128.0
 
 
-    def batch_to_feed(self, batch):
-        imgs = []
+    def to_input(self, imgs, max_height = 1200):
+        if self.features is not None:
+            # Features are cached per image, so images are not padded to the batch height
+            return self.features.get([img[:max_height] for img in imgs])
+
+        return self.ih.make_equal(imgs, max_height = max_height)
+
+
+    def batch_to_feed(self, batch, imgs = None):
+        """
+        :param imgs:  Already read images of batch items, they are read if not set
+        """
+        read_images = imgs is None
+        if read_images:
+            imgs = []
 
         popup_labels = []
         checkout_labels = []
@@ -171,11 +191,11 @@ class PageClassifier:
             else:
                 checkout_labels.append([0, 1])
 
-            img = self.read_image(item)
-            imgs.append(img)
+            if read_images:
+                imgs.append(self.read_image(item))
 
         return {
-            self.img: self.ih.make_equal(imgs, max_height = 1200),
+            self.img: self.to_input(imgs),
             self.popup_labels: popup_labels,
             self.checkout_labels: checkout_labels,
             self.is_popup_task: is_popup_task,
@@ -276,7 +296,7 @@ class PageClassifier:
         result = []
         for batch in slice(imgs):
             feed = {
-                self.img: batch,
+                self.img: self.features.compute(batch) if self.features is not None else batch,
                 self.dropout: 1.0
             }
 
@@ -297,6 +317,20 @@ class PageClassifier:
         result = self.classify_pages([img])
         return result[0]
 
+    @staticmethod
+    def from_checkpoint(checkpoint, backbone = 'inception_resnet_v2'):
+        """
+        Loads classifier in it's own graph, so it can be used together with other models
+        :param checkpoint:  Checkpoint of PageClassifier with the same backbone
+        :param backbone:    Backbone name from tracing.training.backbones registry
+        """
+        graph = tf.Graph()
+        with graph.as_default():
+            model = PageClassifier(tf.Session(graph = graph), backbone = backbone)
+            model.load(checkpoint)
+
+        return model
+
     @staticmethod
     def get_pretrained(cache_folder = None, clear_cache = False):
         downloader = Downloader(cache_folder)
@@ -0,0 +1,48 @@
+import random
+
+from tracing.utils.downloader import Downloader
+from tracing.training.navigation.create_dataset import CheckoutsDataset
+from tracing.training.popups.create_dataset import PopupsDataset
+
+
+def read_pages_dataset(cache_folder = None, seed = 0, train_part = 0.8):
+    """
+    Reads popups and checkouts datasets and splits them to train and test parts.
+    Split depends only on seed, so all page classifiers are measured on the same test pages
+    :param cache_folder:  Downloader cache folder
+    :return:              (train_urls, test_urls)
+    """
+    random.seed(seed)
+
+    downloader = Downloader(cache_folder)
+    popups_dataset_file = downloader.download_popup_dataset()
+    checkouts_dataset_file = downloader.download_checkout_dataset()
+
+    popups_dataset = PopupsDataset.read(popups_dataset_file).items
+    popups_dataset = list([url for url in popups_dataset if url['to_classify'] == True])
+    random.shuffle(popups_dataset)
+
+    split = int(len(popups_dataset) * train_part)
+    train_popups = popups_dataset[:split]
+    test_popups = popups_dataset[split:]
+
+    print('train popups size: ', len(train_popups))
+    print('test popups size: ', len(test_popups))
+
+    checkouts_dataset = CheckoutsDataset.read(checkouts_dataset_file).items
+    random.shuffle(checkouts_dataset)
+
+    split = int(len(checkouts_dataset) * train_part)
+    train_checkouts = checkouts_dataset[:split]
+    test_checkouts = checkouts_dataset[split:]
+
+    print('train checkouts size: ', len(train_checkouts))
+    print('test checkouts size: ', len(test_checkouts))
+
+    train_urls = train_popups + train_checkouts
+    test_urls = test_popups + test_checkouts
+
+    random.shuffle(train_urls)
+    random.shuffle(test_urls)
+
+    return train_urls, test_urls
@@ -1,57 +1,30 @@
 import tensorflow as tf
 
 import os
-import random
-from tracing.utils.downloader import Downloader
-
-from tracing.training.navigation.create_dataset import CheckoutsDataset
-from tracing.training.popups.create_dataset import PopupsDataset
+from tracing.training.classification.pages_dataset import read_pages_dataset
 from tracing.training.classification.page_classifier import PageClassifier
+from tracing.training.features import BackboneFeatures
 
 
-random.seed(0)
-
 # Change it to your cache folder
-downloader = Downloader()
-popups_dataset_file = downloader.download_popup_dataset()
-checkouts_dataset_file = downloader.download_checkout_dataset()
-
-popups_dataset = PopupsDataset.read(popups_dataset_file).items
-popups_dataset = list([url for url in popups_dataset if url['to_classify'] == True])
-random.shuffle(popups_dataset)
-
-split = int(len(popups_dataset) * 0.8)
-train_popups = popups_dataset[:split]
-test_popups = popups_dataset[split:]
-
-print('train popups size: ', len(train_popups))
-print('test popups size: ', len(test_popups))
-
-checkouts_dataset = CheckoutsDataset.read(checkouts_dataset_file).items
-random.shuffle(checkouts_dataset)
-
-split = int(len(checkouts_dataset) * 0.8)
-train_checkouts = checkouts_dataset[:split]
-test_checkouts = checkouts_dataset[split:]
-
-print('train checkouts size: ', len(train_checkouts))
-print('test checkouts size: ', len(test_checkouts))
-
-train_urls = train_popups + train_checkouts
-test_urls = test_popups + test_checkouts
+train_urls, test_urls = read_pages_dataset(cache_folder = None, seed = 0)
 
-random.shuffle(train_urls)
-random.shuffle(test_urls)
 
+# Train only classifier heads on cached features of the frozen backbone
+frozen_backbone = False
+features = None
+if frozen_backbone:
+    features = BackboneFeatures('./cache/pages_features', './inception_resnet_v2_2016_08_30.ckpt')
 
 tf.reset_default_graph()
 session = tf.Session(config=tf.ConfigProto(allow_soft_placement=True, log_device_placement=False))
 
 with tf.device('/gpu:0'):
-    classifier = PageClassifier(session, use_batch_norm = False)
+    classifier = PageClassifier(session, use_batch_norm = False, features = features)
     session.run(tf.global_variables_initializer())
 
-classifier.restore_inception('./inception_resnet_v2_2016_08_30.ckpt')
+if not frozen_backbone:
+    classifier.restore_inception('./inception_resnet_v2_2016_08_30.ckpt')
 
 checkpoint = None
 start_epoch = 0
@@ -0,0 +1,79 @@
+import os
+import tensorflow as tf
+import numpy as np
+
+from tracing.utils.feature_store import FeatureStore
+from tracing.training.backbones import get_backbone
+
+
+def get_checkpoint_id(checkpoint):
+    """
+    Path and modification time of checkpoint, so the overwritten checkpoint has another id
+    """
+    index_file = checkpoint + '.index'
+    mtime = int(os.path.getmtime(index_file)) if os.path.isfile(index_file) else None
+
+    return '{}@{}'.format(os.path.abspath(checkpoint), mtime)
+
+
+class BackboneFeatures:
+    """
+    Frozen backbone in it's own graph that computes pooled features of images.
+    Features are cached in FeatureStore, so models with from_features train only their heads
+    """
+
+    def __init__(self, store_path, checkpoint, batch_size = 16, backbone = 'inception_resnet_v2'):
+        """
+        :param store_path:  Path prefix of FeatureStore files, store refuses to open for another backbone or checkpoint
+        :param checkpoint:  Checkpoint with backbone variables
+        :param batch_size:  Number of images in one session run
+        :param backbone:    Backbone name from registry
+        """
+        self.batch_size = batch_size
+        self.backbone = get_backbone(backbone)
+        self.feature_size = self.backbone.feature_size
+        self.store = FeatureStore(store_path, self.feature_size, meta = {
+            'backbone': self.backbone.name,
+            'checkpoint': get_checkpoint_id(checkpoint)
+        })
+
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            self.img = tf.placeholder(tf.float32, (None, None, 300, 3), "img")
+
+            # Batch x Channels
+            self.net = self.backbone.build(self.img, False)
+
+            self.saver = tf.train.Saver(var_list = self.backbone.get_variables())
+            self.session = tf.Session(graph = self.graph)
+
+        self.saver.restore(self.session, checkpoint)
+
+    def compute(self, images):
+        """
+        Runs backbone, images of the same shape are processed by batches
+        :param images:  List of arrays H x 300 x 3 with values in [-1, 1]
+        :return:        Array len(images) x feature_size
+        """
+        result = np.zeros((len(images), self.feature_size), dtype = np.float32)
+
+        by_shape = {}
+        for i, image in enumerate(images):
+            by_shape.setdefault(np.shape(image), []).append(i)
+
+        for indexes in by_shape.values():
+            for start in range(0, len(indexes), self.batch_size):
+                batch = indexes[start:start + self.batch_size]
+                result[batch] = self.session.run(self.net, feed_dict = {self.img: [images[i] for i in batch]})
+
+        return result
+
+    def get(self, images):
+        """
+        Returns cached features, features of new images are computed and saved
+        """
+        return self.store.get_or_compute(images, self.compute)
+
+    def close(self):
+        self.store.close()
+        self.session.close()
@@ -1,4 +1,5 @@
 from tracing.shop_tracer import *
+from tracing.selenium_utils.blocking import BlockingProfile
 import tracing.trace_logger as trace_logger
 import tracing.common_actors as common_actors
 import tracing.user_data as user_data
@@ -33,7 +34,8 @@ def get_tracer(headless):
     logger = trace_logger.FileTraceLogger('log/results.jsonl',
                                           'log/images',
                                           clear=False)
-    tracer = ShopTracer(user_data.get_user_data, headless=headless, trace_logger=logger)
+    tracer = ShopTracer(user_data.get_user_data, headless=headless, trace_logger=logger,
+                        blocking=BlockingProfile(fidelity=True))
     common_actors.add_tracer_extensions(tracer)
 
     yield tracer
@@ -4,6 +4,7 @@ from tracing.utils.downloader import Downloader
 import tracing.heuristic.common_actors as common_actors
 from tracing.heuristic.shop_tracer import ShopTracer
 from tracing.rl.environment import Environment
+from tracing.selenium_utils.blocking import BlockingProfile
 import logging
 import threading
 from actions_saver import ActionsFileRecorder
@@ -17,7 +18,8 @@ threads = 4
 
 @contextmanager
 def get_tracer(headless=True):
-    env = Environment(headless=headless, max_passes=10)
+    # Screenshots of controls are recorded, so only trackers and media are blocked
+    env = Environment(headless=headless, max_passes=10, blocking=BlockingProfile(fidelity=True))
     tracer = ShopTracer(environment = env)
     common_actors.add_tracer_extensions(tracer)
     yield tracer
@@ -1,5 +1,7 @@
 from tracing.rl.rewards import HeuristicPopupRewardsCalculator
 import tracing.selenium_utils.common as common
+from tracing.selenium_utils.driver_pool import DriverPool
+from tracing.selenium_utils.blocking import BlockingProfile
 
 import threading
 import csv, re
@@ -16,6 +18,9 @@ queue = Queue()
 resources = '../../../resources/'
 dataset_path = 'popups_dataset'
 
+# Screenshots are saved to dataset, so only trackers and media are blocked
+blocking = BlockingProfile(fidelity = True)
+
 
 def dataset_item_to_str(item):
     return '{}\t{}\t{}\t{}\t{}'.format(
@@ -81,8 +86,9 @@ def create_driver():
 
 class UrlPopupsChecker:
     
-    def __init__(self, dataset_file, img_folder, already_read):
-        self.driver = create_driver()        
+    def __init__(self, dataset_file, img_folder, already_read, driver_pool = None):
+        self.driver_pool = driver_pool
+        self.driver = create_driver() if driver_pool is None else None
         self.dataset_file = dataset_file
         self.img_folder = img_folder
         self.already_read = {item['url']: True for item in already_read}
@@ -115,17 +121,32 @@ class UrlPopupsChecker:
         if result is not None:
             return result
 
+        if self.driver_pool is None:
+            return self.check_url_with_driver(url)
+
+        with self.driver_pool.lease() as driver:
+            self.driver = driver
+            try:
+                return self.check_url_with_driver(url)
+            finally:
+                self.driver = None
+
+    def check_url_with_driver(self, url):
         rewards = HeuristicPopupRewardsCalculator()
         has_popup = False
         for _ in range(3):
             try:
+                blocking.apply(self.driver)
                 self.driver.get('http://' + url)
                 has_popup = rewards.is_popup_exists(self.driver)
                 break
             except:
                 traceback.print_exc()
-                self.driver.quit()
-                self.driver = create_driver()
+                if self.driver_pool is not None:
+                    self.driver_pool.reset(self.driver)
+                else:
+                    self.driver.quit()
+                    self.driver = create_driver()
                 continue
 
         img_file = self.get_img_file()
@@ -180,8 +201,9 @@ def create_popup_dataset(dataset_path, reuse_cache = True):
     for url in smoke_urls:
         queue.put(url)
 
+    driver_pool = DriverPool(num_threads, window_size=(1280, 1024), page_load_timeout=120)
     for i in range(num_threads):
-        checker = UrlPopupsChecker(dataset_file, img_folder, processed)
+        checker = UrlPopupsChecker(dataset_file, img_folder, processed, driver_pool)
         t = threading.Thread(target=checker.run)
         t.daemon = True
         t.start()
@@ -196,6 +218,7 @@ def create_popup_dataset(dataset_path, reuse_cache = True):
 
     print('wait for the rest')
     queue.join()
+    driver_pool.close()
 
     os.rename(tmp_path, dataset_path)
     
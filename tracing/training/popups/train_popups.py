@@ -3,6 +3,7 @@ from tracing.rl.a3cmodel import A3CModel
 from tracing.rl.rewards import *
 from tracing.rl.environment import Environment
 from tracing.rl.actor_learner import ActorLearnerWorker
+from tracing.rl.inference_server import InferenceServer
 import tensorflow as tf
 import threading
 import random
@@ -55,6 +56,10 @@ if pretrained_checkpoint:
     saver = tf.train.Saver()
     saver.restore(session, pretrained_checkpoint)
 
+# Batches get_action and estimate_score calls of all workers
+inference_server = InferenceServer(global_model, max_batch = num_workers)
+inference_server.start()
+
 workers = []
 
 for i in range(num_workers):
@@ -69,7 +74,8 @@ for i in range(num_workers):
                                 l2 = 0.003,
                                 entropy_l=0.1, 
                                 dropout = 0.8, 
-                                gamma=0.99)
+                                gamma=0.99,
+                                inference_server = inference_server)
     workers.append(worker)
     
 coord = tf.train.Coordinator()
@@ -1,5 +1,7 @@
 from tracing.rl.environment import Environment
 from tracing.rl.actions import Actions
+from tracing.selenium_utils.driver_pool import DriverPool
+from tracing.selenium_utils.blocking import BlockingProfile
 
 import PIL
 import numpy as np
@@ -14,10 +16,11 @@ import time
 
 class ControlsExtractor:
 
-    def __init__(self, img_folder, dataset_file, queue):
+    def __init__(self, img_folder, dataset_file, queue, driver_pool = None):
         self.img_folder = img_folder
         self.dataset_file = dataset_file
         self.queue = queue
+        self.driver_pool = driver_pool
 
     
     @staticmethod
@@ -42,7 +45,8 @@ class ControlsExtractor:
 
 
     def extract(self, url):
-        env = Environment()
+        # Images of controls are saved to dataset, so only trackers and media are blocked
+        env = Environment(driver_pool = self.driver_pool, blocking = BlockingProfile(fidelity = True))
         with env:
             if not env.start(url):
                 return 
@@ -114,10 +118,10 @@ for file in old_files:
     os.remove(os.path.join(imgs_folder, file))
     
 num_threads = 8
-
+driver_pool = DriverPool(num_threads, window_size=(1280, 1024), page_load_timeout=120)
 
 for _ in range(num_threads):
-    extractor = ControlsExtractor(imgs_folder, dataset, queue)
+    extractor = ControlsExtractor(imgs_folder, dataset, queue, driver_pool)
     t = threading.Thread(target=extractor.start)
     t.daemon = True
     t.start()
@@ -127,4 +131,5 @@ while not queue.empty():
     time.sleep(60)
     
 queue.join()
+driver_pool.close()
 
@@ -1,6 +1,7 @@
 from tracing.rl.a3cmodel import A3CModel
 from tracing.rl.actions import *
 from tracing.selenium_utils.controls import Types
+from tracing.training.features import BackboneFeatures
 
 from pretrain_dataset import *
 
@@ -46,13 +47,15 @@ def read_img(ctrl, size = 300):
 
 class ControlPretrainModel:
     # If session is not defined than default session will be used
-    def __init__(self, a3c_model, session, encoder):
+    # If features (BackboneFeatures) are set then a3c_model should be created with from_features
+    def __init__(self, a3c_model, session, encoder, features = None):
         self.word_repr = None
         self.word_embeddings = None
                 
         self.a3c_model = a3c_model
         self.session = session 
         self.encoder = encoder
+        self.features = features
         
         self.device = '/cpu:0'
         
@@ -83,6 +86,9 @@ class ControlPretrainModel:
         for ctrl in batch:
             imgs.append(read_img(ctrl))
             
+        if self.features is not None:
+            return self.features.get(imgs)
+
         return imgs
     
         
@@ -259,11 +265,17 @@ if __name__ == '__main__':
     controls = read_control_dataset()
     encoder = cache_embeddings(controls)
 
+    # Train only heads on features of the frozen backbone that are computed once per image
+    frozen_backbone = False
+    features = None
+    if frozen_backbone:
+        features = BackboneFeatures('./cache/controls_features', './checkpoints/pretrain_checkpoint-8')
+
     tf.reset_default_graph()
     session = tf.Session()
 
-    a3c = A3CModel(len(Actions.actions), session = session, train_deep=True)
-    model = ControlPretrainModel(a3c, session, encoder)
+    a3c = A3CModel(len(Actions.actions), session = session, train_deep=True, from_features = frozen_backbone)
+    model = ControlPretrainModel(a3c, session, encoder, features)
 
     session.run(tf.global_variables_initializer())
     saver = tf.train.Saver()
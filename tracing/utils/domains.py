@@ -0,0 +1,21 @@
+from urllib.parse import urlsplit
+
+
+def normalize_domain(url):
+    """
+    Normalizes shop url to the domain that is used as a key in indexes
+    :param url:  Domain or url, for instance 'https://WWW.Shop.com:443/index.html'
+    :return:     Lower case host without 'www.' prefix and port, for instance 'shop.com'
+    """
+    url = (url or '').strip().lower()
+    if not url:
+        return url
+
+    if '://' not in url:
+        url = 'http://' + url
+
+    host = urlsplit(url).hostname or ''
+    if host.startswith('www.'):
+        host = host[4:]
+
+    return host.rstrip('.')
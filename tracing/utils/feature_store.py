@@ -0,0 +1,167 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+
+
+# Length of image hash in keys file
+key_size = hashlib.sha1().digest_size * 2
+
+
+def get_array_hash(image):
+    """
+    Hash of image content and shape
+    :param image:  Numpy array
+    """
+    image = np.ascontiguousarray(image, dtype = np.float32)
+
+    sha1 = hashlib.sha1(str(image.shape).encode('utf-8'))
+    sha1.update(image.tobytes())
+    return sha1.hexdigest()
+
+
+class FeatureStore:
+    """
+    Features of images that are computed once by a frozen backbone.
+    Features are kept in memory-mapped file <path>.dat and hashes of images in <path>.keys,
+    so they are reused between epochs and runs. Store remembers in <path>.meta what computed the features
+    (size, backbone, weights) and can't be opened with another meta
+    """
+
+    def __init__(self, path, dim, initial_capacity = 1024, meta = None):
+        """
+        :param path:              Path prefix of store files
+        :param dim:               Size of feature vector
+        :param initial_capacity:  Number of rows allocated in a new store, file grows twice when it's full
+        :param meta:              Dict that identifies features, for instance backbone and checkpoint
+        :raises ValueError:       If existing store was created with another dim or meta
+        """
+        self.path = path
+        self.dim = dim
+        self.data_file = path + '.dat'
+        self.keys_file = path + '.keys'
+        self.meta_file = path + '.meta'
+        self.meta = dict(meta or {}, dim = dim)
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        self._check_meta()
+
+        # image hash -> row
+        self.index = {}
+        for key in self._read_keys():
+            self.index[key] = len(self.index)
+
+        row_bytes = dim * np.dtype(np.float32).itemsize
+        file_rows = os.path.getsize(self.data_file) // row_bytes if os.path.isfile(self.data_file) else 0
+        self._open(max(initial_capacity, len(self.index), file_rows))
+
+        self._keys = open(self.keys_file, 'a')
+        self._lock = threading.Lock()
+
+    def _check_meta(self):
+        if os.path.isfile(self.meta_file):
+            with open(self.meta_file) as f:
+                meta = json.load(f)
+
+            if meta != self.meta:
+                raise ValueError('Feature store {} contains features of {}, but is opened for {}'
+                                 .format(self.path, meta, self.meta))
+            return
+
+        for file in [self.data_file, self.keys_file]:
+            if os.path.isfile(file) and os.path.getsize(file) > 0:
+                raise ValueError('Feature store {} has no meta file, features can\'t be verified'.format(self.path))
+
+        with open(self.meta_file, 'w') as f:
+            json.dump(self.meta, f, sort_keys = True)
+
+    def _read_keys(self):
+        if not os.path.isfile(self.keys_file):
+            return []
+
+        with open(self.keys_file, 'rb') as f:
+            content = f.read()
+
+        # Key torn by crash is removed, it's row is rewritten by the next add
+        end = content.rfind(b'\n') + 1
+        if end < len(content):
+            with open(self.keys_file, 'r+b') as f:
+                f.truncate(end)
+
+        keys = content[:end].decode('ascii').splitlines()
+        for i, key in enumerate(keys):
+            if len(key) != key_size:
+                raise ValueError('Corrupted key {} in line {} of {}'.format(key, i + 1, self.keys_file))
+
+        return keys
+
+    def _open(self, capacity):
+        size = capacity * self.dim * np.dtype(np.float32).itemsize
+        with open(self.data_file, 'ab') as f:
+            if f.tell() < size:
+                f.truncate(size)
+
+        self.data = np.memmap(self.data_file, dtype = np.float32, mode = 'r+', shape = (capacity, self.dim))
+        self.capacity = capacity
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def get(self, keys):
+        """
+        :param keys:  List of image hashes that are in the store
+        :return:      Array len(keys) x dim
+        """
+        return np.array(self.data[[self.index[key] for key in keys]])
+
+    def add(self, keys, features):
+        """
+        Appends features of new images
+        :param keys:      List of image hashes
+        :param features:  Array len(keys) x dim
+        """
+        with self._lock:
+            start = len(self.index)
+            if start + len(keys) > self.capacity:
+                self.data.flush()
+                del self.data
+                self._open(max(self.capacity * 2, start + len(keys)))
+
+            self.data[start:start + len(keys)] = features
+            self.data.flush()
+
+            # Keys are written after features, so a key never points to unwritten row
+            for i, key in enumerate(keys):
+                self._keys.write(key + '\n')
+                self.index[key] = start + i
+            self._keys.flush()
+
+    def get_or_compute(self, images, compute):
+        """
+        Returns features of images, features of new images are computed and saved
+        :param images:   List of numpy arrays
+        :param compute:  Function that takes list of images and returns array of their features
+        :return:         Array len(images) x dim
+        """
+        keys = [get_array_hash(image) for image in images]
+
+        missing = {}
+        for image, key in zip(images, keys):
+            if key not in self.index and key not in missing:
+                missing[key] = image
+
+        if missing:
+            self.add(list(missing.keys()), compute(list(missing.values())))
+
+        return self.get(keys)
+
+    def close(self):
+        self.data.flush()
+        self._keys.close()